@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Canonical agency dimension and agency → authorized product index.
+
+Agency names arrive spelled many ways: the AI usage workbook, the catalog's
+``agency_authorizations``, the CSV's parent/sub agency columns and the
+authorization tables scraped from product pages. Every spelling is
+normalized (case, punctuation, '&', 'Dept.', a leading 'U.S.' or 'The',
+"Homeland Security, Department of") and resolved through ``agency_aliases`` to
+one row in ``agencies``; ``rules/agency_aliases.json`` seeds acronyms and
+parent departments. Authorizations from every source are then written to
+``agency_product_authorizations`` so "which products has this agency
+authorized" is an indexed join, and ``agency_ai_usage.agency_id`` links each
+usage row to its canonical agency. Sub-agencies are also keyed under their
+parent, so the many departments' "Office of the Inspector General" stay
+separate agencies instead of all joining whichever was seen first.
+
+Agency ids are stable across runs: agencies and aliases are only ever added.
+"""
+
+import json
+import re
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from catalog import load_catalog
+from db import get_connection, initialize_database, table_exists
+from fetch_json import OUTPUT_FILE as JSON_PATH
+
+SEED_PATH = Path(__file__).parent / "rules" / "agency_aliases.json"
+
+PARENTHETICAL_RE = re.compile(r'\(([^)]*)\)')
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+INVERTED_RE = re.compile(r'^(.*?),\s*((?:the\s+)?(?:department|dept\.?|office|bureau|administration)\s+of(?:\s+the)?)\s*$',
+                         re.IGNORECASE)
+WORD_REPLACEMENTS = {'dept': 'department', 'admin': 'administration', 'natl': 'national', 'svcs': 'services'}
+LEADING_WORDS = (('the',), ('united', 'states'), ('u', 's'), ('us',))
+NAME_KEYS = ('agency_name', 'parent_agency', 'agency', 'name', 'parent')
+SUB_AGENCY_KEYS = ('sub_agency', 'subagency', 'sub')
+
+
+def normalize_agency_name(name: str) -> str:
+    """Comparison key for an agency name (parenthetical acronyms are dropped)"""
+    text = PARENTHETICAL_RE.sub(' ', name or '').strip()
+    inverted = INVERTED_RE.match(text)
+    if inverted:
+        text = f"{inverted.group(2)} {inverted.group(1)}"
+    text = text.lower().replace('&', ' and ')
+    words = [WORD_REPLACEMENTS.get(w, w) for w in NON_ALNUM_RE.sub(' ', text).split()]
+
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in LEADING_WORDS:
+            if tuple(words[:len(prefix)]) == prefix and len(words) > len(prefix):
+                words = words[len(prefix):]
+                stripped = True
+    return ' '.join(words)
+
+def alias_keys(name: str) -> List[str]:
+    """The normalized name plus any acronym given in parentheses"""
+    keys = []
+    key = normalize_agency_name(name)
+    if key:
+        keys.append(key)
+    for acronym in PARENTHETICAL_RE.findall(name or ''):
+        acronym_key = normalize_agency_name(acronym)
+        if acronym_key and acronym_key not in keys:
+            keys.append(acronym_key)
+    return keys
+
+def slugify(name: str) -> str:
+    return re.sub(r'[-\s]+', '-', re.sub(r'[^\w\s-]', '', name.lower())).strip('-')
+
+
+class AgencyResolver:
+    """Resolves agency spellings to canonical agency ids, creating agencies as needed"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.aliases: Dict[str, int] = dict(conn.execute("SELECT alias_key, agency_id FROM agency_aliases"))
+        self.slugs = {row[0] for row in conn.execute("SELECT slug FROM agencies")}
+        self.parents: Dict[int, Optional[int]] = dict(conn.execute("SELECT id, parent_id FROM agencies"))
+        self.created = 0
+        self.new_aliases = 0
+
+    def _add_alias(self, key: str, agency_id: int, alias: str, source: str):
+        if key in self.aliases:
+            return
+        self.aliases[key] = agency_id
+        self.new_aliases += 1
+        self.conn.execute(
+            "INSERT OR IGNORE INTO agency_aliases (alias_key, agency_id, alias, source) VALUES (?, ?, ?, ?)",
+            (key, agency_id, alias, source)
+        )
+
+    def _create(self, name: str, parent_id: Optional[int]) -> int:
+        display = ' '.join(PARENTHETICAL_RE.sub(' ', name).split()) or name.strip()
+        slug = base = slugify(display) or 'agency'
+        suffix = 2
+        while slug in self.slugs:
+            slug, suffix = f"{base}-{suffix}", suffix + 1
+        self.slugs.add(slug)
+        self.created += 1
+        cursor = self.conn.execute(
+            "INSERT INTO agencies (canonical_name, slug, parent_id) VALUES (?, ?, ?)", (display, slug, parent_id)
+        )
+        self.parents[cursor.lastrowid] = parent_id
+        return cursor.lastrowid
+
+    def resolve(self, name: Optional[str], source: str, parent_id: Optional[int] = None) -> Optional[int]:
+        """
+        Canonical id for a spelling; every key of the spelling becomes an alias of it
+
+        With a parent, the spelling is first looked up under that parent, and a
+        name known globally is only used if it has no parent or the same one;
+        otherwise the sub-agency is created under this parent.
+        """
+        keys = alias_keys(name or '')
+        if not keys:
+            return None
+        scoped = [f"{parent_id}:{key}" for key in keys] if parent_id is not None else []
+        agency_id = next((self.aliases[k] for k in scoped if k in self.aliases), None)
+        if agency_id is None:
+            agency_id = next((self.aliases[k] for k in keys if k in self.aliases), None)
+            if scoped and agency_id is not None and self.parents.get(agency_id) not in (None, parent_id):
+                agency_id = None
+        if agency_id is None:
+            agency_id = self._create(name, parent_id)
+        for key in scoped + keys:
+            self._add_alias(key, agency_id, name.strip(), source)
+        return agency_id
+
+    def load_seed(self, path: Path = SEED_PATH):
+        """Make sure every seeded agency, acronym and parent link exists"""
+        seed = json.loads(path.read_text(encoding='utf-8'))
+        entries = seed.get('agencies', [])
+        ids = {entry['name']: self.resolve(entry['name'], 'seed') for entry in entries}
+        for entry in entries:
+            for alias in entry.get('aliases', []):
+                for key in alias_keys(alias):
+                    self._add_alias(key, ids[entry['name']], alias, 'seed')
+            if entry.get('parent'):
+                parent_id = ids.get(entry['parent']) or self.resolve(entry['parent'], 'seed')
+                self.conn.execute(
+                    "UPDATE agencies SET parent_id = ? WHERE id = ? AND parent_id IS NULL",
+                    (parent_id, ids[entry['name']])
+                )
+                if self.parents.get(ids[entry['name']]) is None:
+                    self.parents[ids[entry['name']]] = parent_id
+
+
+def _catalog_authorizations(value: Any) -> Iterator[Tuple[str, Optional[str]]]:
+    """(agency, sub_agency) pairs from the catalog's loosely typed agency_authorizations field"""
+    if not value:
+        return
+    if isinstance(value, str):
+        for part in re.split(r'[;\n]', value):
+            if part.strip():
+                yield part.strip(), None
+    elif isinstance(value, dict):
+        if any(k in value for k in NAME_KEYS):
+            yield from _catalog_authorizations([value])
+        else:
+            # {agency: [sub agencies]} or {agency: sub agency}
+            for agency, subs in value.items():
+                subs = subs if isinstance(subs, list) else [subs]
+                for sub in subs or [None]:
+                    yield agency, sub if isinstance(sub, str) else None
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, str):
+                if item.strip():
+                    yield item.strip(), None
+            elif isinstance(item, dict):
+                agency = next((item[k] for k in NAME_KEYS if item.get(k)), None)
+                sub = next((item[k] for k in SUB_AGENCY_KEYS if item.get(k)), None)
+                if isinstance(agency, str):
+                    yield agency, sub if isinstance(sub, str) else None
+
+
+def build_agency_index(conn: sqlite3.Connection, json_path: Path = JSON_PATH) -> Dict[str, int]:
+    """Resolve every agency spelling and rebuild the agency → product authorization index"""
+    resolver = AgencyResolver(conn)
+    resolver.load_seed()
+
+    authorizations: Dict[Tuple[int, str, str], Optional[str]] = {}
+
+    def add(product_id: str, agency: Optional[str], sub_agency: Optional[str], source: str,
+            issued: Optional[str] = None):
+        parent_id = resolver.resolve(agency, source)
+        ids = [parent_id]
+        if sub_agency and normalize_agency_name(sub_agency) != normalize_agency_name(agency or ''):
+            ids.append(resolver.resolve(sub_agency, source, parent_id=parent_id))
+        for agency_id in ids:
+            if agency_id is not None:
+                key = (agency_id, product_id, source)
+                authorizations[key] = authorizations.get(key) or issued
+
+    # Scraped pages and CSV rows
+    for product_id, agency, sub_agency, issued, source in conn.execute('''
+        SELECT fedramp_id, agency_name, sub_agency, ato_issuance_date, source FROM product_agency_authorizations
+    '''):
+        add(product_id, agency, sub_agency, source, issued)
+
+    # The CSV's per-product parent/sub agency columns
+    for product_id, agency, sub_agency, issued in conn.execute('''
+        SELECT fedramp_id, parent_agency, sub_agency, ato_issuance_date FROM products
+        WHERE parent_agency IS NOT NULL AND parent_agency != ''
+    '''):
+        add(product_id, agency, sub_agency, 'product', issued)
+
+    # The catalog JSON
+    if json_path.exists():
+        for product in load_catalog(json_path):
+            for agency, sub_agency in _catalog_authorizations(product.agency_authorizations):
+                add(product.id, agency, sub_agency, 'catalog')
+
+    conn.execute("DELETE FROM agency_product_authorizations")
+    conn.executemany('''
+        INSERT INTO agency_product_authorizations (agency_id, product_id, source, ato_issuance_date)
+        VALUES (?, ?, ?, ?)
+    ''', [key + (issued,) for key, issued in authorizations.items()])
+
+    # Link agency AI usage rows to their canonical agency
+    linked = 0
+    if table_exists(conn, 'agency_ai_usage'):
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(agency_ai_usage)")}
+        if 'agency_id' not in columns:
+            conn.execute("ALTER TABLE agency_ai_usage ADD COLUMN agency_id INTEGER REFERENCES agencies(id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_agency_ai_usage_agency ON agency_ai_usage(agency_id)")
+        links = [(resolver.resolve(name, 'usage'), usage_id)
+                 for usage_id, name in conn.execute("SELECT id, agency_name FROM agency_ai_usage").fetchall()]
+        conn.executemany("UPDATE agency_ai_usage SET agency_id = ? WHERE id = ?", links)
+        linked = len(links)
+
+    return {
+        'agencies': conn.execute("SELECT COUNT(*) FROM agencies").fetchone()[0],
+        'created': resolver.created,
+        'aliases_added': resolver.new_aliases,
+        'authorizations': len(authorizations),
+        'usage_rows_linked': linked,
+    }
+
+def get_authorized_products(conn: sqlite3.Connection, agency_ids: List[int]) -> Dict[int, set]:
+    """Product ids each canonical agency has authorized"""
+    authorized: Dict[int, set] = {agency_id: set() for agency_id in agency_ids}
+    if not agency_ids:
+        return authorized
+    placeholders = ','.join('?' * len(agency_ids))
+    for agency_id, product_id in conn.execute(f'''
+        SELECT agency_id, product_id FROM agency_product_authorizations WHERE agency_id IN ({placeholders})
+    ''', agency_ids):
+        authorized[agency_id].add(product_id)
+    return authorized
+
+def main() -> int:
+    print("🏛️  Building canonical agency index")
+    print("=" * 60)
+
+    initialize_database()
+    conn = get_connection()
+    try:
+        with conn:
+            stats = build_agency_index(conn)
+    finally:
+        conn.close()
+
+    metrics.add('stage_items_processed', stats['authorizations'])
+    metrics.record_rows('agencies', 'insert', stats['created'])
+    metrics.record_rows('agency_aliases', 'insert', stats['aliases_added'])
+    metrics.record_rows('agency_product_authorizations', 'replace', stats['authorizations'])
+    metrics.record_rows('agency_ai_usage', 'update', stats['usage_rows_linked'])
+    print(f"✓ Agencies: {stats['agencies']} ({stats['created']} new, {stats['aliases_added']} new aliases)")
+    print(f"✓ Authorizations indexed: {stats['authorizations']}")
+    print(f"✓ Agency AI usage rows linked: {stats['usage_rows_linked']}")
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -4,49 +4,67 @@ Analyzes FedRAMP products to identify AI, Generative AI, and LLM services
 """
 import json
 import os
+import threading
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Any
-import anthropic
-from dotenv import load_dotenv
-from db import get_connection, initialize_database, insert_ai_analysis, clear_ai_analysis, get_ai_stats, record_product_analysis_run
-
-# Load environment variables
-load_dotenv()
+from typing import List, Dict, Any, Iterable, Optional, Set
+import metrics
+import tracing
+from catalog import ProductRecord, load_catalog
+from db import get_connection, initialize_database, insert_ai_analysis, clear_ai_analysis, get_ai_stats, record_product_analysis_run, delete_ai_analysis_for_products
 
 JSON_PATH = Path(__file__).parent.parent / "data" / "fedramp_products.json"
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
-if not ANTHROPIC_API_KEY:
-    raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Create the Anthropic client on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import anthropic
+            from dotenv import load_dotenv
+
+            # Load environment variables
+            load_dotenv()
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+
+            if not api_key:
+                raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
 
-client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+            _client = anthropic.Anthropic(api_key=api_key)
+        return _client
 
-def load_products() -> List[Dict[str, Any]]:
-    """Load all products from JSON"""
-    with open(JSON_PATH, 'r') as f:
-        data = json.load(f)
-    return data['data']['Products']
+def set_client(client):
+    """Use the given client (e.g. a stand-in for benchmarks) instead of creating one; None resets"""
+    global _client
+    with _client_lock:
+        _client = client
 
-def analyze_product_with_claude(product: Dict[str, Any]) -> List[Dict[str, Any]]:
+def load_products() -> List[ProductRecord]:
+    """Load all products from the shared catalog cache"""
+    return load_catalog(JSON_PATH)
+
+@tracing.traced('analyze.product')
+def analyze_product_with_claude(product: ProductRecord, raise_errors: bool = False) -> List[Dict[str, Any]]:
     """
     Analyze a single product using Claude Haiku 4.5
-    Returns list of AI services found in this product
+    Returns list of AI services found in this product; a failed request or
+    unparseable response counts as none unless raise_errors is set
     """
     # Extract product details
-    product_id = product.get('id', '')
-    product_name = product.get('cso', '')
-    provider = product.get('csp', '')
-    description = product.get('service_desc', '')
-    services = product.get('all_others', [])
-    status = product.get('status', '')
-    impact_level = product.get('impact_level', [])
-    if isinstance(impact_level, list):
-        impact_level = ', '.join(impact_level)
-    auth_date = product.get('auth_date', '')
+    product_id = product.id
+    product_name = product.cso
+    provider = product.csp
+    description = product.service_desc
+    services = product.services
+    status = product.status
+    impact_level = product.impact_level
+    auth_date = product.auth_date
 
     # Handle agencies field - can be string, list, dict, or None
-    agencies = product.get('agency_authorizations', '')
+    agencies = product.agency_authorizations
     if isinstance(agencies, list):
         agencies = ', '.join(str(a) for a in agencies)
     elif isinstance(agencies, dict):
@@ -56,11 +74,12 @@ def analyze_product_with_claude(product: Dict[str, Any]) -> List[Dict[str, Any]]
     else:
         agencies = str(agencies)
 
+    tracing.current_span().set_attributes(product_id=product_id, services=len(services))
     if not services:
         return []
 
     # Create prompt for Claude
-    services_list = '\n'.join([f"- {s.strip()}" for s in services[:100]])  # Limit to first 100 services
+    services_list = '\n'.join([f"- {s}" for s in services[:100]])  # Limit to first 100 services
 
     prompt = f"""Analyze this FedRAMP cloud product and identify which of its services relate to AI, Generative AI, or Large Language Models.
 
@@ -95,15 +114,22 @@ Example format:
 
 IMPORTANT: Only include services that are clearly AI, GenAI, or LLM related. Do not include general cloud services."""
 
+    client = get_client()
+
     try:
-        message = client.messages.create(
-            model="claude-haiku-4-5",
-            max_tokens=4096,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }]
-        )
+        with tracing.span('llm.messages.create', model="claude-haiku-4-5") as span:
+            message = client.messages.create(
+                model="claude-haiku-4-5",
+                max_tokens=4096,
+                messages=[{
+                    "role": "user",
+                    "content": prompt
+                }]
+            )
+            usage = getattr(message, 'usage', None)
+            if usage is not None:
+                span.set_attributes(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+                metrics.record_llm_usage(usage.input_tokens, usage.output_tokens)
 
         # Parse Claude's response
         response_text = message.content[0].text.strip()
@@ -137,15 +163,35 @@ IMPORTANT: Only include services that are clearly AI, GenAI, or LLM related. Do
         return results
 
     except json.JSONDecodeError as e:
+        tracing.current_span().record_error(e)
+        metrics.add('stage_errors', error_class=type(e).__name__)
         print(f"❌ Error parsing JSON for {product_name}: {e}")
         print(f"Response was: {response_text[:200]}...")
+        if raise_errors:
+            raise
         return []
     except Exception as e:
+        tracing.current_span().record_error(e)
+        metrics.add('stage_errors', error_class=type(e).__name__)
         print(f"❌ Error analyzing {product_name}: {e}")
+        if raise_errors:
+            raise
         return []
 
-def analyze_all_products(max_workers: int = 10, clear_existing: bool = True):
-    """Analyze all products in parallel"""
+@tracing.traced('analyze_all_products')
+def analyze_all_products(max_workers: int = 10, clear_existing: bool = True,
+                         product_ids: Optional[Iterable[str]] = None) -> Set[str]:
+    """
+    Analyze all products in parallel and return the ids of the products that failed
+
+    If product_ids is given, only those products are analyzed and only their
+    previous results are replaced; everything else is left untouched. A
+    product's old results are replaced in the same transaction that writes its
+    new ones, so a failed analysis keeps whatever was there before.
+    """
+
+    # Fail fast on missing credentials before touching the database
+    get_client()
 
     # Initialize database
     initialize_database()
@@ -154,8 +200,11 @@ def analyze_all_products(max_workers: int = 10, clear_existing: bool = True):
     products = load_products()
     print(f"📊 Loaded {len(products)} products")
 
-    # Clear existing analysis if requested
-    if clear_existing:
+    if product_ids is not None:
+        wanted = set(product_ids)
+        products = [p for p in products if p.id in wanted]
+        print(f"🔎 Analyzing {len(products)} changed products")
+    elif clear_existing:
         conn = get_connection()
         clear_ai_analysis(conn)
         conn.close()
@@ -168,11 +217,12 @@ def analyze_all_products(max_workers: int = 10, clear_existing: bool = True):
     conn = get_connection()
     total_ai_services = 0
     processed_count = 0
+    failed: Set[str] = set()
 
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         # Submit all tasks
         future_to_product = {
-            executor.submit(analyze_product_with_claude, product): product
+            executor.submit(tracing.propagate(analyze_product_with_claude), product, True): product
             for product in products
         }
 
@@ -183,35 +233,40 @@ def analyze_all_products(max_workers: int = 10, clear_existing: bool = True):
 
             try:
                 ai_services = future.result()
+            except Exception as e:
+                # Already logged and counted by analyze_product_with_claude
+                failed.add(product.id)
+                print(f"[{processed_count}/{len(products)}] ❌ Error processing {product.cso or 'Unknown'}: {e}")
+                continue
 
-                # Record that this product was analyzed
-                record_product_analysis_run(
-                    conn,
-                    product.get('id', ''),
-                    product.get('cso', ''),
-                    product.get('csp', ''),
-                    len(ai_services)
-                )
-
-                # Save results to database
-                for service in ai_services:
-                    insert_ai_analysis(conn, service)
-                    total_ai_services += 1
+            try:
+                # Replace this product's results and record the run in one transaction
+                with conn:
+                    if product_ids is not None:
+                        delete_ai_analysis_for_products(conn, [product.id])
+                    record_product_analysis_run(
+                        conn,
+                        product.id,
+                        product.cso,
+                        product.csp,
+                        len(ai_services)
+                    )
+                    for service in ai_services:
+                        insert_ai_analysis(conn, service)
+                total_ai_services += len(ai_services)
+                metrics.add('stage_items_processed')
+                metrics.record_rows('product_ai_analysis_runs', 'insert', 1)
+                metrics.record_rows('ai_service_analysis', 'insert', len(ai_services))
 
                 if ai_services:
-                    print(f"[{processed_count}/{len(products)}] ✅ {product.get('csp', 'Unknown')} - {product.get('cso', 'Unknown')}: Found {len(ai_services)} AI services")
+                    print(f"[{processed_count}/{len(products)}] ✅ {product.csp or 'Unknown'} - {product.cso or 'Unknown'}: Found {len(ai_services)} AI services")
                 else:
-                    print(f"[{processed_count}/{len(products)}] ⚪ {product.get('csp', 'Unknown')} - {product.get('cso', 'Unknown')}: No AI services")
-
-                # Commit every 10 products
-                if processed_count % 10 == 0:
-                    conn.commit()
+                    print(f"[{processed_count}/{len(products)}] ⚪ {product.csp or 'Unknown'} - {product.cso or 'Unknown'}: No AI services")
 
             except Exception as e:
-                print(f"[{processed_count}/{len(products)}] ❌ Error processing {product.get('cso', 'Unknown')}: {e}")
-
-    # Final commit
-    conn.commit()
+                failed.add(product.id)
+                metrics.add('stage_errors', error_class=type(e).__name__)
+                print(f"[{processed_count}/{len(products)}] ❌ Error saving {product.cso or 'Unknown'}: {e}")
 
     # Print statistics
     stats = get_ai_stats(conn)
@@ -226,8 +281,12 @@ def analyze_all_products(max_workers: int = 10, clear_existing: bool = True):
     print(f"   - LLM Services: {stats['count_llm']}")
     print(f"\n📦 Products with AI: {stats['products_with_ai']} out of {len(products)}")
     print(f"🏢 Providers with AI: {stats['providers_with_ai']}")
+    if failed:
+        print(f"⚠️  {len(failed)} products failed and kept their previous results")
     print(f"{'='*70}")
 
+    return failed
+
 if __name__ == "__main__":
     import argparse
 
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Read-only JSON API over the pipeline database
+
+The data only changes when the pipeline commits, so responses are cached:
+every request reads SQLite's ``PRAGMA data_version`` (which moves whenever
+another connection commits) and serves the encoded body from an in-process
+LRU cache keyed by that version and the request URL. A commit by any stage
+therefore invalidates the cache without the pipeline having to notify the
+server. Each body carries a content ETag, so clients revalidating with
+``If-None-Match`` get an empty 304.
+
+Queries run on a small pool of read-only connections in worker threads and
+go through the projected, paginated query functions in db.py.
+
+Endpoints (list endpoints take ``fields``, ``limit`` and ``offset``):
+
+    GET /api/stats
+    GET /api/products?q=
+    GET /api/products/{fedramp_id}
+    GET /api/ai-services?type=ai|genai|llm&provider=&product_id=
+    GET /api/agencies?category=staff_llm|specialized&q=&slug=
+    GET /api/matches?agency_id=&product_id=&confidence=high|medium|low
+    GET /api/health          (never cached)
+"""
+import asyncio
+import hashlib
+import json
+import queue
+import sqlite3
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+import db
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+POOL_SIZE = 4
+CACHE_ENTRIES = 2048
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# resource -> (columns clients may select, columns returned by default)
+FIELDS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    'products': (
+        ('id', 'fedramp_id', 'cloud_service_provider', 'cloud_service_offering', 'service_description',
+         'business_categories', 'service_model', 'status', 'independent_assessor', 'authorizations', 'reuse',
+         'parent_agency', 'sub_agency', 'ato_issuance_date', 'fedramp_authorization_date',
+         'annual_assessment_date', 'ato_expiration_date', 'impact_level', 'html_scraped', 'updated_at'),
+        ('fedramp_id', 'cloud_service_provider', 'cloud_service_offering', 'service_model', 'status',
+         'impact_level', 'authorizations'),
+    ),
+    'ai-services': (
+        ('id', 'product_id', 'product_name', 'provider_name', 'service_name', 'has_ai', 'has_genai', 'has_llm',
+         'relevant_excerpt', 'fedramp_status', 'impact_level', 'agencies', 'auth_date', 'analyzed_at'),
+        ('product_id', 'product_name', 'provider_name', 'service_name', 'has_ai', 'has_genai', 'has_llm'),
+    ),
+    'agencies': (
+        ('id', 'agency_name', 'agency_category', 'has_staff_llm', 'llm_name', 'has_coding_assistant', 'scope',
+         'solution_type', 'non_public_allowed', 'other_ai_present', 'tool_name', 'tool_purpose', 'notes',
+         'sources', 'analyzed_at', 'slug', 'agency_id'),
+        ('id', 'slug', 'agency_name', 'agency_category', 'has_staff_llm', 'llm_name', 'solution_type',
+         'tool_name'),
+    ),
+    'matches': (
+        ('id', 'agency_id', 'product_id', 'provider_name', 'product_name', 'confidence', 'match_reason',
+         'created_at', 'updated_at'),
+        ('agency_id', 'product_id', 'provider_name', 'product_name', 'confidence', 'match_reason'),
+    ),
+}
+
+
+class ReadPool:
+    """Read-only SQLite connections shared by a fixed set of worker threads"""
+
+    def __init__(self, path: Path, size: int = POOL_SIZE):
+        self.path = Path(path)
+        self.size = size
+        self.connections: queue.Queue = queue.Queue()
+        for _ in range(size):
+            self.connections.put(self._connect())
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='api-read')
+        # data_version is per connection, so one connection is kept just for reading it
+        self._version_conn = self._connect()
+        self._version_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def data_version(self) -> int:
+        """Changes whenever another connection (a pipeline stage) commits"""
+        with self._version_lock:
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict):
+        conn = self.connections.get()
+        try:
+            return fn(conn, *args, **kwargs)
+        finally:
+            self.connections.put(conn)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run fn(conn, *args, **kwargs) on a pooled connection"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call, fn, args, kwargs)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        while not self.connections.empty():
+            self.connections.get().close()
+        self._version_conn.close()
+
+
+class ResponseCache:
+    """LRU of encoded responses for one data version; a new version empties it"""
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.version: Optional[int] = None
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: int, key: str) -> Optional[Tuple[str, bytes]]:
+        if version != self.version:
+            self.version = version
+            self.entries.clear()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, version: int, key: str, entry: Tuple[str, bytes]):
+        if version != self.version or self.max_entries <= 0:
+            return
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def _bad_request(message: str) -> web.HTTPBadRequest:
+    return web.HTTPBadRequest(text=json.dumps({'error': message}), content_type='application/json')
+
+def _fields(request: web.Request, resource: str) -> List[str]:
+    allowed, default = FIELDS[resource]
+    requested = request.query.get('fields')
+    if not requested:
+        return list(default)
+    fields = [f.strip() for f in requested.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise _bad_request(f"Unknown fields for {resource}: {', '.join(unknown)} (allowed: {', '.join(allowed)})")
+    return fields
+
+def _int_param(request: web.Request, name: str, default: Optional[int], minimum: int = 0,
+               maximum: Optional[int] = None) -> Optional[int]:
+    value = request.query.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise _bad_request(f"{name} must be an integer")
+    if number < minimum:
+        raise _bad_request(f"{name} must be at least {minimum}")
+    if maximum is not None and number > maximum:
+        raise _bad_request(f"{name} must be at most {maximum}")
+    return number
+
+def _choice_param(request: web.Request, name: str, choices: Tuple[str, ...]) -> Optional[str]:
+    value = request.query.get(name) or None
+    if value is not None and value not in choices:
+        raise _bad_request(f"{name} must be one of: {', '.join(choices)}")
+    return value
+
+def _paged(page: Dict[str, Any], limit: int, offset: int) -> Dict[str, Any]:
+    next_offset = offset + limit if offset + limit < page['total'] else None
+    return {**page, 'limit': limit, 'offset': offset, 'next_offset': next_offset}
+
+def _paging(request: web.Request) -> Tuple[int, int]:
+    return (_int_param(request, 'limit', DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT),
+            _int_param(request, 'offset', 0))
+
+
+# ---------------------------------------------------------------------------
+# Resources: validate parameters, then return (query function, args, kwargs)
+# ---------------------------------------------------------------------------
+
+def _stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+    return {
+        'products': db.get_scrape_stats(conn),
+        'ai': db.get_ai_stats(conn),
+        'analysis': db.get_analysis_run_stats(conn),
+    }
+
+def _product_or_404(conn: sqlite3.Connection, fedramp_id: str) -> Dict[str, Any]:
+    product = db.get_product(conn, fedramp_id)
+    if product is None:
+        raise web.HTTPNotFound(text=json.dumps({'error': f"No product {fedramp_id}"}),
+                               content_type='application/json')
+    return product
+
+def _page_query(fn: Callable, limit: int, offset: int) -> Callable:
+    def query(conn: sqlite3.Connection, *args, **kwargs):
+        return _paged(fn(conn, *args, limit=limit, offset=offset, **kwargs), limit, offset)
+    return query
+
+def stats_query(request: web.Request):
+    return _stats, (), {}
+
+def products_query(request: web.Request):
+    limit, offset = _paging(request)
+    return _page_query(db.get_products_page, limit, offset), (_fields(request, 'products'),), {
+        'search': request.query.get('q') or None,
+    }
+
+def product_query(request: web.Request):
+    return _product_or_404, (request.match_info['fedramp_id'],), {}
+
+def ai_services_query(request: web.Request):
+    limit, offset = _paging(request)
+    return _page_query(db.get_ai_services_page, limit, offset), (_fields(request, 'ai-services'),), {
+        'filter_type': _choice_param(request, 'type', ('ai', 'genai', 'llm')),
+        'provider': request.query.get('provider') or None,
+        'product_id': request.query.get('product_id') or None,
+    }
+
+def agencies_query(request: web.Request):
+    limit, offset = _paging(request)
+    return _page_query(db.get_agency_usage_page, limit, offset), (_fields(request, 'agencies'),), {
+        'category': _choice_param(request, 'category', ('staff_llm', 'specialized')),
+        'search': request.query.get('q') or None,
+        'slug': request.query.get('slug') or None,
+    }
+
+def matches_query(request: web.Request):
+    limit, offset = _paging(request)
+    return _page_query(db.get_agency_matches_page, limit, offset), (_fields(request, 'matches'),), {
+        'agency_id': _int_param(request, 'agency_id', None),
+        'product_id': request.query.get('product_id') or None,
+        'confidence': _choice_param(request, 'confidence', ('high', 'medium', 'low')),
+    }
+
+
+class ReadApi:
+    """Serves cached, ETagged JSON for the query functions above"""
+
+    def __init__(self, pool: ReadPool, cache: ResponseCache):
+        self.pool = pool
+        self.cache = cache
+
+    def handler(self, build_query: Callable):
+        async def handle(request: web.Request) -> web.Response:
+            version = self.pool.data_version()
+            key = request.path_qs
+            entry = self.cache.get(version, key)
+            if entry is None:
+                fn, args, kwargs = build_query(request)
+                payload = await self.pool.run(fn, *args, **kwargs)
+                body = json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+                entry = (f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+                self.cache.put(version, key, entry)
+
+            etag, body = entry
+            headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+            if etag in request.headers.get('If-None-Match', ''):
+                return web.Response(status=304, headers=headers)
+            return web.Response(body=body, content_type='application/json', headers=headers)
+        return handle
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'data_version': self.pool.data_version(),
+            'cache_entries': len(self.cache.entries),
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+        })
+
+
+def create_app(db_path: Optional[Path] = None, pool_size: int = POOL_SIZE,
+               cache_entries: int = CACHE_ENTRIES) -> web.Application:
+    """Build the application; the pool is closed on cleanup"""
+    db_path = Path(db_path or db.DB_PATH)
+    if not db_path.exists():
+        raise FileNotFoundError(f"Database not found: {db_path}")
+
+    api = ReadApi(ReadPool(db_path, pool_size), ResponseCache(cache_entries))
+    app = web.Application()
+    app['api'] = api
+    app.router.add_get('/api/stats', api.handler(stats_query))
+    app.router.add_get('/api/products', api.handler(products_query))
+    app.router.add_get('/api/products/{fedramp_id}', api.handler(product_query))
+    app.router.add_get('/api/ai-services', api.handler(ai_services_query))
+    app.router.add_get('/api/agencies', api.handler(agencies_query))
+    app.router.add_get('/api/matches', api.handler(matches_query))
+    app.router.add_get('/api/health', api.health)
+
+    async def close_pool(app: web.Application):
+        api.pool.close()
+    app.on_cleanup.append(close_pool)
+    return app
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, db_path: Optional[Path] = None,
+          pool_size: int = POOL_SIZE, cache_entries: int = CACHE_ENTRIES):
+    app = create_app(db_path, pool_size, cache_entries)
+    print(f"🌐 Serving {db_path or db.DB_PATH} on http://{host}:{port}/api/")
+    web.run_app(app, host=host, port=port, print=None, access_log=None)
+
+
+# ---------------------------------------------------------------------------
+# Load testing
+# ---------------------------------------------------------------------------
+
+DEFAULT_PATHS = [
+    '/api/stats',
+    '/api/products',
+    '/api/products?offset=50',
+    '/api/products?q=cloud&fields=fedramp_id,cloud_service_offering',
+    '/api/ai-services',
+    '/api/ai-services?type=llm',
+    '/api/agencies',
+    '/api/matches?confidence=high',
+]
+
+async def load_test(base_url: str, paths: List[str], requests: int = 2000, concurrency: int = 32,
+                    revalidate: bool = False) -> Dict[str, float]:
+    """Drive the API with ``concurrency`` clients; returns requests/s and latency percentiles in ms"""
+    import aiohttp
+
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    etags: Dict[str, str] = {}
+    counter = iter(range(requests))
+
+    async def client(session: aiohttp.ClientSession):
+        for i in counter:
+            path = paths[i % len(paths)]
+            headers = {'If-None-Match': etags[path]} if revalidate and path in etags else {}
+            start = time.perf_counter()
+            async with session.get(base_url + path, headers=headers) as response:
+                await response.read()
+                if 'ETag' in response.headers:
+                    etags[path] = response.headers['ETag']
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies),
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'statuses': statuses,
+    }
+
+async def _benchmark(db_path: Optional[Path], requests: int, concurrency: int, pool_size: int,
+                     paths: List[str]) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for label, cache_entries, revalidate in (('uncached', 0, False), ('cached', CACHE_ENTRIES, False),
+                                             ('revalidated (304)', CACHE_ENTRIES, True)):
+        runner = web.AppRunner(create_app(db_path, pool_size, cache_entries), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, DEFAULT_HOST, 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            base_url = f"http://{DEFAULT_HOST}:{port}"
+            await load_test(base_url, paths, requests=len(paths), concurrency=1, revalidate=revalidate)  # warm up
+            results[label] = await load_test(base_url, paths, requests, concurrency, revalidate)
+        finally:
+            await runner.cleanup()
+    return results
+
+def benchmark(db_path: Optional[Path] = None, requests: int = 2000, concurrency: int = 32,
+              pool_size: int = POOL_SIZE, paths: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """Serve the database on a local port and load-test it uncached, cached and with ETag revalidation"""
+    paths = paths or DEFAULT_PATHS
+    results = asyncio.run(_benchmark(db_path, requests, concurrency, pool_size, paths))
+
+    print(f"⏱️  {requests} requests over {len(paths)} URLs, {concurrency} concurrent clients")
+    print(f"{'mode':<20} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}  statuses")
+    for label, result in results.items():
+        statuses = ', '.join(f"{status}×{count}" for status, count in sorted(result['statuses'].items()))
+        print(f"{label:<20} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}  {statuses}")
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the pipeline database as a cached JSON API')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--db', type=Path, help='Database to serve (default: data/fedramp.db)')
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE, help='Pooled read connections')
+    parser.add_argument('--cache-entries', type=int, default=CACHE_ENTRIES, help='Cached responses (0 disables)')
+    parser.add_argument('--bench', action='store_true', help='Load-test the API on a local port instead')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per load-test mode')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent load-test clients')
+
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.db, requests=args.requests, concurrency=args.concurrency, pool_size=args.pool_size)
+    else:
+        serve(args.host, args.port, args.db, args.pool_size, args.cache_entries)
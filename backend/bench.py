@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the FedRAMP AI data pipeline
+
+Generates a synthetic catalog, marketplace CSV and agency workbook (see
+synthetic.py) in a scratch directory and times the hot paths against them:
+catalog parsing and cache loads, per-row ``insert_product`` vs. the streaming
+CSV load, the dashboard queries (``get_ai_services`` and the stats helpers),
+agency matching, and the analyzer driven by a stand-in Anthropic client that
+sleeps for a configurable latency instead of calling the API. Nothing touches
+the real database or catalog.
+
+Results are written as JSON to data/bench/, tagged with the git commit, so a
+run can be compared with an earlier one (``--compare``).
+"""
+import contextlib
+import io
+import json
+import platform
+import random
+import re
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import catalog
+import db
+import product_index
+import synthetic
+
+RESULTS_DIR = Path(__file__).parent.parent / "data" / "bench"
+RESULTS_VERSION = 1
+REGRESSION_THRESHOLD = 0.2  # flag benchmarks more than 20% slower than the baseline
+MIN_COMPARABLE_SECONDS = 0.005  # anything faster is timer noise
+
+AI_SERVICE_RE = re.compile(
+    r'\b(ai|gpt|llm|copilot|bedrock|sagemaker|vertex|gemini|watson\w*|einstein|firefly|sensei|'
+    r'generative|machine learning|chatbot|assist|q|comprehend|dialogflow|speech|vision|translation)\b',
+    re.IGNORECASE
+)
+GENAI_RE = re.compile(r'\b(gpt|llm|copilot|bedrock|gemini|generative|firefly|chatbot|assist|q)\b', re.IGNORECASE)
+
+
+def classify_services(services: List[str]) -> List[Dict[str, Any]]:
+    """What the stand-in client 'finds': services whose names sound AI-related"""
+    found = []
+    for name in services:
+        if AI_SERVICE_RE.search(name):
+            genai = bool(GENAI_RE.search(name))
+            found.append({
+                'service_name': name,
+                'has_ai': True,
+                'has_genai': genai,
+                'has_llm': genai,
+                'relevant_excerpt': f"{name} is an AI service.",
+            })
+    return found
+
+
+class FakeAnthropicClient:
+    """
+    Stands in for ``anthropic.Anthropic`` in benchmarks
+
+    ``messages.create`` sleeps for ``latency`` seconds (+/- ``jitter`` as a
+    fraction) and answers with the AI-sounding services listed in the prompt,
+    in the JSON format the analyzer expects.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.25, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, model: str, max_tokens: int, messages: List[Dict[str, str]]):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * (1 + self.jitter * self._rng.uniform(-1, 1))
+        time.sleep(max(0.0, delay))
+
+        prompt = messages[0]['content']
+        listed = prompt.split('**Services to Analyze:**')[-1].split('**Instructions:**')[0]
+        services = [line[2:] for line in listed.splitlines() if line.startswith('- ')]
+        text = f"```json\n{json.dumps(classify_services(services))}\n```"
+        usage = SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4)  # ~4 chars per token
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=usage)
+
+
+class Workspace:
+    """Scratch files for one run; module paths point here while benchmarks run"""
+
+    def __init__(self, root: Path, products: int, agencies: int, seed: int):
+        self.root = root
+        self.catalog = root / "catalog.json"
+        self.csv = root / "marketplace.csv"
+        self.workbook = root / "agencies.xlsx"
+
+        start = time.perf_counter()
+        self.counts = synthetic.write_catalog(self.catalog, products, seed)
+        self.counts['csv_rows'] = synthetic.write_marketplace_csv(self.csv, products, seed)
+        self.counts['workbook_rows'] = synthetic.write_agency_workbook(self.workbook, agencies, seed)
+        self.generate_seconds = time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def database(self, name: str):
+        """Point db.DB_PATH at a fresh database for one benchmark"""
+        import analyze_ai_services
+
+        path = self.root / f"{name}.db"
+        saved = (db.DB_PATH, catalog.CACHE_DIR, product_index.CACHE_DIR, analyze_ai_services.JSON_PATH)
+        db.DB_PATH = path
+        catalog.CACHE_DIR = product_index.CACHE_DIR = self.root / "cache"
+        analyze_ai_services.JSON_PATH = self.catalog
+        try:
+            with _quiet():
+                db.initialize_database()
+            yield path
+        finally:
+            db.DB_PATH, catalog.CACHE_DIR, product_index.CACHE_DIR, analyze_ai_services.JSON_PATH = saved
+
+
+class Recorder:
+    """Collects timings and prints one line per benchmark"""
+
+    def __init__(self):
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def time(self, name: str, fn: Callable[[], Any], items: int, unit: str, repeat: int = 1,
+             quiet: bool = False, **extra) -> Any:
+        """Median time of ``repeat`` calls of fn; quiet hides fn's own output"""
+        runs = []
+        value = None
+        for _ in range(repeat):
+            with _quiet() if quiet else contextlib.nullcontext():
+                start = time.perf_counter()
+                value = fn()
+                runs.append(time.perf_counter() - start)
+        seconds = statistics.median(runs)
+        self.add(name, seconds, items, unit, **extra)
+        return value
+
+    def add(self, name: str, seconds: float, items: int, unit: str, **extra):
+        per_item = seconds / items * 1e6 if items else 0.0
+        self.results[name] = {
+            'seconds': round(seconds, 6),
+            'items': items,
+            'unit': unit,
+            'per_item_us': round(per_item, 3),
+            **extra,
+        }
+        print(f"   {name:<26} {seconds:9.3f}s  {items:>10,} {unit:<9} {per_item:12.1f} µs each")
+
+
+@contextlib.contextmanager
+def _quiet():
+    """Silence the progress output of the code being measured"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def bench_catalog(ws: Workspace, rec: Recorder, options: Dict[str, Any]):
+    with ws.database('catalog'):
+        catalog._loaded.clear()
+        rec.time('catalog_parse', lambda: catalog.load_catalog(ws.catalog), ws.counts['products'], 'products')
+        catalog._loaded.clear()
+        rec.time('catalog_cache_load', lambda: catalog.load_catalog(ws.catalog), ws.counts['products'], 'products')
+
+def bench_insert_product(ws: Workspace, rec: Recorder, options: Dict[str, Any]):
+    rows = [{
+        'fedramp_id': p['id'],
+        'cloud_service_provider': p['csp'],
+        'cloud_service_offering': p['cso'],
+        'service_description': p['service_desc'],
+        'status': p['status'],
+        'ato_issuance_date': p['auth_date'],
+    } for p in synthetic.iter_synthetic_products(ws.counts['products'], options['seed'])]
+
+    with ws.database('insert_product'):
+        conn = db.get_connection()
+
+        def insert_all():
+            for row in rows:
+                db.insert_product(conn, row)
+            conn.commit()
+
+        rec.time('insert_product', insert_all, len(rows), 'products')
+        conn.close()
+
+def bench_bulk_load(ws: Workspace, rec: Recorder, options: Dict[str, Any]):
+    from load_csv import load_csv_to_database
+
+    with ws.database('bulk_load'):
+        rec.time('bulk_load_csv', lambda: load_csv_to_database(csv_path=ws.csv, json_path=ws.catalog),
+                 ws.counts['csv_rows'], 'rows', quiet=True)
+
+def bench_queries(ws: Workspace, rec: Recorder, options: Dict[str, Any]):
+    with ws.database('queries'):
+        conn = db.get_connection()
+        analysis, runs = [], []
+        for product in catalog.load_catalog(ws.catalog):
+            found = classify_services(list(product.services))
+            runs.append((product.id, product.cso, product.csp, len(found)))
+            analysis.extend(
+                (product.id, product.cso, product.csp, s['service_name'], 1, int(s['has_genai']),
+                 int(s['has_llm']), s['relevant_excerpt'], product.status, product.impact_level, '', product.auth_date)
+                for s in found
+            )
+        with conn:
+            conn.executemany('''
+                INSERT INTO ai_service_analysis (
+                    product_id, product_name, provider_name, service_name, has_ai, has_genai, has_llm,
+                    relevant_excerpt, fedramp_status, impact_level, agencies, auth_date
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', analysis)
+            conn.executemany('''
+                INSERT INTO product_ai_analysis_runs (product_id, product_name, provider_name, ai_services_found)
+                VALUES (?, ?, ?, ?)
+            ''', runs)
+
+        repeat = options['repeat']
+        for filter_type in (None, 'genai', 'llm'):
+            name = f"get_ai_services_{filter_type or 'all'}"
+            rows = rec.time(name, lambda: db.get_ai_services(conn, filter_type), len(analysis), 'rows', repeat)
+            rec.results[name]['returned'] = len(rows)
+        rec.time('get_ai_stats', lambda: db.get_ai_stats(conn), len(analysis), 'rows', repeat)
+        rec.time('get_analysis_run_stats', lambda: db.get_analysis_run_stats(conn), len(runs), 'runs', repeat)
+        rec.time('get_scrape_stats', lambda: db.get_scrape_stats(conn), len(runs), 'products', repeat)
+        conn.close()
+
+def bench_match(ws: Workspace, rec: Recorder, options: Dict[str, Any]):
+    from load_agency_data import read_workbook
+    from match_agencies_to_services import RULES_PATH, match_agency_to_products
+    from rule_matcher import load_rules
+
+    with ws.database('match'):
+        rules = load_rules(RULES_PATH)
+        products = catalog.load_catalog(ws.catalog)
+        with _quiet():
+            agencies = [dict(record, id=i) for i, (_, record) in enumerate(read_workbook(ws.workbook))]
+
+        def build():
+            index = product_index.ProductIndex(products)
+            index.annotate(rules)
+            return index
+
+        index = rec.time('match_index_build', build, len(products), 'products')
+        matches = rec.time('match_agency_to_products',
+                           lambda: sum(len(match_agency_to_products(a, index, rules)) for a in agencies),
+                           len(agencies), 'agencies', options['repeat'])
+        rec.results['match_agency_to_products']['matches'] = matches
+
+def bench_analyze(ws: Workspace, rec: Recorder, options: Dict[str, Any]):
+    import analyze_ai_services
+
+    count, workers, latency = options['analyze_products'], options['workers'], options['latency']
+    client = FakeAnthropicClient(latency=latency, seed=options['seed'])
+    with ws.database('analyze'):
+        ids = [product.id for product in catalog.load_catalog(ws.catalog)[:count]]
+        analyze_ai_services.set_client(client)
+        try:
+            rec.time('analyze_products', lambda: analyze_ai_services.analyze_all_products(
+                max_workers=workers, product_ids=ids), len(ids), 'products', quiet=True,
+                latency=latency, workers=workers)
+        finally:
+            analyze_ai_services.set_client(None)
+        rec.results['analyze_products'].update(
+            api_calls=client.calls,
+            ideal_seconds=round(latency * client.calls / workers, 3),  # perfect overlap, zero overhead
+        )
+
+
+BENCHMARKS: Dict[str, Callable[[Workspace, Recorder, Dict[str, Any]], None]] = {
+    'catalog': bench_catalog,
+    'insert_product': bench_insert_product,
+    'bulk_load': bench_bulk_load,
+    'queries': bench_queries,
+    'match': bench_match,
+    'analyze': bench_analyze,
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_suite(products: int = synthetic.REAL_CATALOG_SIZE, agencies: int = 200, latency: float = 0.5,
+              analyze_products: int = 100, workers: int = 10, repeat: int = 3, seed: int = 0,
+              only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Run the selected benchmarks on freshly generated data and return the result document"""
+    options = {'products': products, 'agencies': agencies, 'latency': latency,
+               'analyze_products': analyze_products, 'workers': workers, 'repeat': repeat, 'seed': seed}
+    recorder = Recorder()
+
+    with tempfile.TemporaryDirectory(prefix='fedai-bench-') as tmp:
+        print(f"🧪 Generating {products:,} products and {agencies:,} agencies...")
+        ws = Workspace(Path(tmp), products, agencies, seed)
+        print(f"   {ws.counts['services']:,} services, {ws.counts['csv_rows']:,} CSV rows, "
+              f"{ws.counts['workbook_rows']:,} workbook rows in {ws.generate_seconds:.1f}s")
+        print()
+
+        for name, bench in BENCHMARKS.items():
+            if only and name not in only:
+                continue
+            print(f"⏱️  {name}")
+            bench(ws, recorder, options)
+
+    return {
+        'version': RESULTS_VERSION,
+        'commit': _git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': options,
+        'data': ws.counts,
+        'results': recorder.results,
+    }
+
+def save_results(document: Dict[str, Any], output_dir: Path = RESULTS_DIR) -> Path:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = document['created_at'].replace(':', '').replace('+0000', 'Z')
+    path = output_dir / f"{stamp}-{document['commit']}-{document['options']['products']}.json"
+    path.write_text(json.dumps(document, indent=2) + '\n', encoding='utf-8')
+    return path
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = REGRESSION_THRESHOLD) -> int:
+    """
+    Print per-benchmark changes against a baseline; returns the number of regressions
+
+    Time per item is compared, so runs at different scales are roughly comparable.
+    """
+    if baseline.get('options', {}).get('products') != current['options']['products']:
+        print("⚠️  Baseline was run at a different scale; comparing time per item")
+
+    regressions = 0
+    print(f"📊 Compared with {baseline.get('commit', '?')} ({baseline.get('created_at', '?')})")
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before or not before['per_item_us']:
+            print(f"   {name:<26} {'new':>12}")
+            continue
+        change = result['per_item_us'] / before['per_item_us'] - 1
+        if max(result['seconds'], before['seconds']) < MIN_COMPARABLE_SECONDS:
+            flag = '  '
+        else:
+            flag = '❌' if change > threshold else '✅' if change < -threshold else '  '
+            regressions += change > threshold
+        print(f"   {name:<26} {before['per_item_us']:10.1f} → {result['per_item_us']:10.1f} µs  {change:+7.1%} {flag}")
+    return regressions
+
+def main(products: int = synthetic.REAL_CATALOG_SIZE, agencies: int = 200, latency: float = 0.5,
+         analyze_products: int = 100, workers: int = 10, repeat: int = 3, seed: int = 0,
+         only: Optional[List[str]] = None, baseline: Optional[Path] = None,
+         output_dir: Path = RESULTS_DIR) -> int:
+    document = run_suite(products=products, agencies=agencies, latency=latency, analyze_products=analyze_products,
+                         workers=workers, repeat=repeat, seed=seed, only=only)
+    path = save_results(document, output_dir)
+    print()
+    print(f"💾 Results saved to {path}")
+
+    if baseline:
+        print()
+        if compare(json.loads(Path(baseline).read_text(encoding='utf-8')), document):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on synthetic data')
+    parser.add_argument('--products', default='real',
+                        help=f"Catalog size: a number or one of {', '.join(synthetic.SCALES)}")
+    parser.add_argument('--agencies', type=int, default=200, help='Agencies in the synthetic workbook')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds per fake Claude call')
+    parser.add_argument('--analyze-products', type=int, default=100, help='Products sent through the analyzer')
+    parser.add_argument('--workers', type=int, default=10, help='Analyzer worker threads')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per query benchmark (median is kept)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='Run only these benchmarks')
+    parser.add_argument('--compare', type=Path, metavar='RESULTS_JSON', help='Baseline results to compare with')
+    parser.add_argument('--output-dir', type=Path, default=RESULTS_DIR, help='Where to write results')
+
+    args = parser.parse_args()
+    exit(main(products=synthetic.SCALES.get(args.products) or int(args.products), agencies=args.agencies,
+              latency=args.latency, analyze_products=args.analyze_products, workers=args.workers,
+              repeat=args.repeat, seed=args.seed, only=args.only, baseline=args.compare,
+              output_dir=args.output_dir))
@@ -0,0 +1,130 @@
+"""
+Shared loader for the FedRAMP product catalog
+
+Parses ``fedramp_products.json`` once into compact ``ProductRecord`` objects and
+keeps a pickle cache next to the data, keyed by the SHA-256 of the JSON file.
+Every script that needs the catalog gets a cache load instead of a full JSON
+parse, and the records hold only the fields the pipeline uses.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fetch_json import OUTPUT_FILE as JSON_PATH, file_sha256, iter_products
+
+CACHE_DIR = Path(__file__).parent.parent / "data" / "cache"
+CACHE_VERSION = 1  # bump when ProductRecord changes shape
+
+# In-process memo so repeated loads in one run don't touch the disk again
+_loaded: Dict[Tuple[str, str], List['ProductRecord']] = {}
+
+
+class ProductRecord:
+    """A catalog product with normalized service names"""
+
+    __slots__ = (
+        'id', 'csp', 'cso', 'service_desc', 'status', 'impact_level', 'auth_date',
+        'agency_authorizations', 'services', 'services_lower', 'content_hash',
+    )
+
+    def __init__(self, id: str, csp: str, cso: str, service_desc: str, status: str,
+                 impact_level: str, auth_date: str, agency_authorizations: Any,
+                 services: Tuple[str, ...], services_lower: Tuple[str, ...], content_hash: str):
+        self.id = id
+        self.csp = csp
+        self.cso = cso
+        self.service_desc = service_desc
+        self.status = status
+        self.impact_level = impact_level
+        self.auth_date = auth_date
+        self.agency_authorizations = agency_authorizations
+        self.services = services
+        self.services_lower = services_lower
+        self.content_hash = content_hash
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f"ProductRecord({self.id!r}, {self.csp!r}, {self.cso!r})"
+
+    @classmethod
+    def from_json(cls, product: Dict[str, Any]) -> 'ProductRecord':
+        """Build a record from one product object of the GSA catalog"""
+        encoded = json.dumps(product, sort_keys=True, ensure_ascii=False, default=str)
+
+        impact_level = product.get('impact_level') or ''
+        if isinstance(impact_level, list):
+            impact_level = ', '.join(impact_level)
+
+        services = tuple(s.strip() for s in (product.get('all_others') or []) if s and s.strip())
+
+        return cls(
+            id=product.get('id') or '',
+            csp=product.get('csp') or '',
+            cso=product.get('cso') or '',
+            service_desc=product.get('service_desc') or '',
+            status=product.get('status') or '',
+            impact_level=impact_level,
+            auth_date=product.get('auth_date') or '',
+            agency_authorizations=product.get('agency_authorizations'),
+            services=services,
+            services_lower=tuple(s.lower() for s in services),
+            content_hash=hashlib.sha256(encoded.encode('utf-8')).hexdigest(),
+        )
+
+
+def _cache_path(json_path: Path) -> Path:
+    return CACHE_DIR / f"{json_path.stem}.pickle"
+
+def read_cache(cache_path: Path, version: int, sha256: str) -> Optional[Any]:
+    """Load a pickle cache if it was written with this version for this catalog"""
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_version, cached_sha, value = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+        return None
+    if cached_version != version or cached_sha != sha256:
+        return None
+    return value
+
+def write_cache(cache_path: Path, version: int, sha256: str, value: Any):
+    """Atomically write a pickle cache tagged with its version and catalog checksum"""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=cache_path.name + '.', dir=cache_path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((version, sha256, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, cache_path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+def catalog_version(json_path: Path = JSON_PATH) -> str:
+    """SHA-256 of the catalog file, used to key every derived cache"""
+    return file_sha256(json_path)
+
+def load_catalog(json_path: Path = JSON_PATH) -> List[ProductRecord]:
+    """Load all products, from the binary cache when the JSON file is unchanged"""
+    sha256 = catalog_version(json_path)
+    key = (str(json_path), sha256)
+    if key in _loaded:
+        return _loaded[key]
+
+    cache_path = _cache_path(json_path)
+    records = read_cache(cache_path, CACHE_VERSION, sha256)
+    if records is None:
+        records = [ProductRecord.from_json(p) for p in iter_products(json_path)]
+        write_cache(cache_path, CACHE_VERSION, sha256, records)
+
+    _loaded.clear()
+    _loaded[key] = records
+    return records
@@ -1,50 +1,49 @@
 """
 Quick script to check if Amazon Bedrock is included in AWS GovCloud FedRAMP authorization
 """
-import json
 from pathlib import Path
 
+from catalog import load_catalog
+from lookup import lookup_services
+
 JSON_PATH = Path(__file__).parent.parent / "data" / "fedramp_products.json"
 
 def check_bedrock():
-    with open(JSON_PATH, 'r') as f:
-        data = json.load(f)
-
-    products = data['data']['Products']
+    products = load_catalog(JSON_PATH)
 
     # Find AWS products
-    aws_products = [p for p in products if 'AWS' in p.get('csp', '').upper() or 'AMAZON' in p.get('csp', '').upper()]
+    aws_products = [p for p in products if 'AWS' in p.csp.upper() or 'AMAZON' in p.csp.upper()]
 
     print("=" * 80)
     print("CHECKING FOR AMAZON BEDROCK IN AWS FEDRAMP AUTHORIZATIONS")
     print("=" * 80)
 
     for product in aws_products:
-        print(f"\nProduct: {product['cso']}")
-        print(f"Provider: {product['csp']}")
-        print(f"FedRAMP ID: {product['id']}")
+        print(f"\nProduct: {product.cso}")
+        print(f"Provider: {product.csp}")
+        print(f"FedRAMP ID: {product.id}")
 
-        if product.get('all_others'):
-            services = product['all_others']
+        if product.services:
+            services = list(zip(product.services, product.services_lower))
             print(f"Total Services: {len(services)}")
 
             # Check for Bedrock
-            bedrock_services = [s for s in services if 'bedrock' in s.lower()]
+            bedrock_services = [s for s, lower in services if 'bedrock' in lower]
 
             if bedrock_services:
                 print("\n✅ AMAZON BEDROCK FOUND!")
                 for service in bedrock_services:
-                    print(f"   - {service.strip()}")
+                    print(f"   - {service}")
             else:
                 print("\n❌ Amazon Bedrock NOT found in this product")
 
             # Also show some other AI/ML services
-            ai_services = [s for s in services if any(term in s.lower() for term in ['ai', 'sagemaker', 'comprehend', 'rekognition', 'lex', 'polly', 'transcribe', 'translate', 'kendra'])]
+            ai_services = [s for s, lower in services if any(term in lower for term in ['ai', 'sagemaker', 'comprehend', 'rekognition', 'lex', 'polly', 'transcribe', 'translate', 'kendra'])]
 
             if ai_services:
                 print(f"\n🤖 Other AI/ML Services Found ({len(ai_services)}):")
                 for service in ai_services[:10]:  # Show first 10
-                    print(f"   - {service.strip()}")
+                    print(f"   - {service}")
                 if len(ai_services) > 10:
                     print(f"   ... and {len(ai_services) - 10} more")
         else:
@@ -56,12 +55,8 @@ def check_bedrock():
     print("SUMMARY")
     print("=" * 80)
 
-    # Check all products for Bedrock
-    products_with_bedrock = []
-    for product in products:
-        if product.get('all_others'):
-            if any('bedrock' in s.lower() for s in product['all_others']):
-                products_with_bedrock.append(product)
+    # Check all products for Bedrock (`fedai lookup <service>` answers this for any service)
+    products_with_bedrock = lookup_services(['bedrock'], json_path=JSON_PATH)['bedrock']
 
     print(f"\nTotal FedRAMP products: {len(products)}")
     print(f"Products with Amazon Bedrock: {len(products_with_bedrock)}")
@@ -69,7 +64,7 @@ def check_bedrock():
     if products_with_bedrock:
         print("\nProducts that include Amazon Bedrock:")
         for p in products_with_bedrock:
-            print(f"  - {p['csp']} - {p['cso']} (ID: {p['id']})")
+            print(f"  - {p['provider']} - {p['product']} (ID: {p['fedramp_id']})")
 
 if __name__ == "__main__":
     check_bedrock()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+fedai - single entry point for the FedRAMP AI data pipeline
+
+Usage:
+    python3 cli.py <command> [options]     (or ./fedai <command>)
+
+Each subcommand imports its module only when it runs, so cheap commands such
+as ``stats`` and ``--help`` never load anthropic, playwright, openpyxl or
+requests.
+"""
+import argparse
+import contextlib
+import sys
+from pathlib import Path
+
+DEFAULT_PUBLISH_PATH = Path(__file__).parent.parent / "data" / "publish" / "fedramp.db"
+
+
+def cmd_fetch(args) -> int:
+    from fetch_json import fetch_and_save_json
+    fetch_and_save_json(expected_sha256=args.sha256)
+    return 0
+
+def cmd_load(args) -> int:
+    if args.what in ('products', 'all'):
+        from load_csv import load_csv_to_database
+        load_csv_to_database(csv_path=args.csv)
+    if args.what in ('agencies', 'all'):
+        import load_agency_data
+        if load_agency_data.main(args.workbook) != 0:
+            return 1
+    return 0
+
+def cmd_analyze(args) -> int:
+    from analyze_ai_services import analyze_all_products
+    analyze_all_products(max_workers=args.workers, clear_existing=not args.no_clear)
+    return 0
+
+def cmd_queue(args) -> int:
+    import job_queue
+    return job_queue.main(args.action, product_ids=args.products, failed_only=args.failed,
+                          processes=args.processes, concurrency=args.concurrency, lease_seconds=args.lease,
+                          max_attempts=args.max_attempts, keep_running=args.keep_running,
+                          watch_seconds=args.watch)
+
+def cmd_agencies(args) -> int:
+    import agencies
+    return agencies.main()
+
+def cmd_services(args) -> int:
+    import services
+    return services.main(threshold=args.threshold)
+
+def cmd_lookup(args) -> int:
+    import lookup
+    queries = list(args.queries)
+    if args.file:
+        queries += [line.strip() for line in args.file.read_text(encoding='utf-8').splitlines() if line.strip()]
+    if not queries:
+        print("❌ Give at least one service name or --file")
+        return 1
+    return lookup.main(queries, mode=args.mode, provider=args.provider, limit=args.limit, as_json=args.json)
+
+def cmd_match(args) -> int:
+    import match_agencies_to_services
+    if args.bench:
+        match_agencies_to_services.benchmark(scale=args.scale)
+        return 0
+    return match_agencies_to_services.main(full=args.full)
+
+def cmd_similarity(args) -> int:
+    import similarity
+    if args.bench:
+        similarity.benchmark(agencies=args.agencies, products=args.products, top_k=args.top_k)
+        return 0
+    return similarity.main(top_k=args.top_k, min_score=args.min_score)
+
+def cmd_bench(args) -> int:
+    import bench
+    import synthetic
+    return bench.main(products=synthetic.SCALES.get(args.products) or int(args.products), agencies=args.agencies,
+                      latency=args.latency, analyze_products=args.analyze_products, workers=args.workers,
+                      repeat=args.repeat, only=args.only, baseline=args.compare)
+
+def cmd_scrape(args) -> int:
+    import scraper
+    if args.stats:
+        scraper.get_stats()
+    else:
+        scraper.scrape_all_products(max_workers=args.workers, base_url=args.base_url,
+                                    tiers=tuple(args.tiers.split(',')), ignore_backoff=args.ignore_backoff)
+    return 0
+
+def cmd_extract(args) -> int:
+    import extract_pages
+    if args.bench:
+        fixture_dir = extract_pages.FIXTURE_DIR if args.bench is True else args.bench
+        extract_pages.benchmark(fixture_dir, repeat=args.repeat, max_workers=args.workers)
+    else:
+        extract_pages.extract_all_pages(max_workers=args.workers, force=args.force)
+    return 0
+
+def cmd_export(args) -> int:
+    from db import DB_PATH
+    import export
+
+    if not DB_PATH.exists():
+        print(f"❌ Database not found: {DB_PATH}")
+        return 1
+    export.export_all(args.output, tables=args.tables, full=args.full, compression=args.compression)
+    return 0
+
+def cmd_serve(args) -> int:
+    import api
+    if args.bench:
+        api.benchmark(args.db, requests=args.requests, concurrency=args.concurrency, pool_size=args.pool_size)
+    else:
+        api.serve(args.host, args.port, args.db, args.pool_size, args.cache_entries)
+    return 0
+
+def cmd_stats(args) -> int:
+    from db import (
+        get_connection, get_scrape_stats, get_ai_stats, get_analysis_run_stats, table_exists, DB_PATH
+    )
+
+    if not DB_PATH.exists():
+        print(f"❌ Database not found: {DB_PATH}")
+        return 1
+
+    conn = get_connection()
+    try:
+        scrape = get_scrape_stats(conn)
+        ai = get_ai_stats(conn)
+        runs = get_analysis_run_stats(conn)
+
+        print("📦 Products")
+        print(f"   Total: {scrape['total']}")
+        print(f"   HTML scraped: {scrape['scraped']} (pending {scrape['pending']}, {scrape['backing_off']} waiting for retry)")
+        print()
+        print("🤖 AI analysis")
+        print(f"   AI services: {ai['total_ai_services']} (AI {ai['count_ai']}, GenAI {ai['count_genai']}, LLM {ai['count_llm']})")
+        print(f"   Products with AI: {ai['products_with_ai']}")
+        print(f"   Providers with AI: {ai['providers_with_ai']}")
+        print(f"   Products analyzed: {runs['products_analyzed']} (last run {runs['last_run'] or 'never'})")
+
+        if table_exists(conn, 'agency_ai_usage'):
+            row = conn.execute("""
+                SELECT COUNT(*) AS total, COUNT(DISTINCT agency_name) AS agencies
+                FROM agency_ai_usage
+            """).fetchone()
+            print()
+            print("🏛️  Agencies")
+            print(f"   Entries: {row['total']} across {row['agencies']} agencies")
+
+        if table_exists(conn, 'agency_service_matches'):
+            row = conn.execute("""
+                SELECT COUNT(*) AS total,
+                       SUM(CASE WHEN confidence = 'high' THEN 1 ELSE 0 END) AS high
+                FROM agency_service_matches
+            """).fetchone()
+            print(f"   Matches: {row['total']} ({row['high'] or 0} high confidence)")
+    finally:
+        conn.close()
+    return 0
+
+def cmd_publish(args) -> int:
+    from db import backup_database, DB_PATH
+
+    if not DB_PATH.exists():
+        print(f"❌ Database not found: {DB_PATH}")
+        return 1
+
+    dest = backup_database(Path(args.output))
+    print(f"✓ Published database snapshot to: {dest} ({dest.stat().st_size / 1024 / 1024:.1f} MiB)")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='fedai', description='FedRAMP AI data pipeline')
+    parser.add_argument('--trace', action='store_true', help='Write tracing spans as OTLP JSON lines to data/traces/')
+    parser.add_argument('--trace-file', type=Path, metavar='PATH', help='Write tracing spans to PATH instead')
+    parser.add_argument('--profile', type=Path, metavar='PATH',
+                        help='Profile the command: folded stacks, or cProfile stats for .pstats/.prof paths')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Write Prometheus textfile metrics for the command to data/metrics/')
+    parser.add_argument('--metrics-dir', type=Path, metavar='DIR', help='Write the metrics to DIR instead')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('fetch', help='Fetch the FedRAMP catalog from the GSA JSON API')
+    p.add_argument('--sha256', help='Expected SHA-256 of the downloaded file')
+    p.set_defaults(func=cmd_fetch)
+
+    p = subparsers.add_parser('load', help='Load the marketplace CSV and/or agency workbook into the database')
+    p.add_argument('what', nargs='?', choices=['products', 'agencies', 'all'], default='all')
+    p.add_argument('--csv', type=Path, help='Marketplace CSV export')
+    p.add_argument('--workbook', type=Path, help='Agency GenAI provisioning workbook (.xlsx)')
+    p.set_defaults(func=cmd_load)
+
+    p = subparsers.add_parser('analyze', help='Classify AI services with Claude')
+    p.add_argument('--workers', type=int, default=10, help='Number of parallel workers')
+    p.add_argument('--no-clear', action='store_true', help='Don\'t clear existing analysis')
+    p.set_defaults(func=cmd_analyze)
+
+    p = subparsers.add_parser('queue', help='Run AI analysis through a durable job queue shared by worker processes')
+    p.add_argument('action', choices=['enqueue', 'work', 'status', 'bench'])
+    p.add_argument('--products', nargs='*', help='Product ids to enqueue (default: whole catalog)')
+    p.add_argument('--failed', action='store_true', help='Requeue only failed jobs')
+    p.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+    p.add_argument('--concurrency', type=int, default=4, help='Concurrent Claude requests per worker')
+    p.add_argument('--lease', type=float, default=60.0, help='Visibility timeout in seconds')
+    p.add_argument('--max-attempts', type=int, default=3, help='Attempts before a job is marked failed')
+    p.add_argument('--keep-running', action='store_true', help='Keep polling after the queue drains')
+    p.add_argument('--watch', type=float, metavar='SECONDS', help='Refresh status until the queue drains')
+    p.set_defaults(func=cmd_queue)
+
+    p = subparsers.add_parser('agencies', help='Build the canonical agency dimension and authorization index')
+    p.set_defaults(func=cmd_agencies)
+
+    p = subparsers.add_parser('services', help='Build the canonical service dictionary and product/service links')
+    p.add_argument('--threshold', type=float, default=0.85,
+                   help='Trigram cosine at which two spellings are clustered as one service')
+    p.set_defaults(func=cmd_services)
+
+    p = subparsers.add_parser('lookup', help='Find the products that include a service (substring, prefix or exact)')
+    p.add_argument('queries', nargs='*', help='Service names or fragments, e.g. bedrock "azure openai"')
+    p.add_argument('--file', type=Path, help='Read one query per line from this file')
+    p.add_argument('--mode', choices=['substring', 'prefix', 'exact'], default='substring')
+    p.add_argument('--provider', help='Only products whose provider contains this text')
+    p.add_argument('--limit', type=int, default=20, help='Services and products shown per query')
+    p.add_argument('--json', action='store_true', help='Print results as JSON')
+    p.set_defaults(func=cmd_lookup)
+
+    p = subparsers.add_parser('match', help='Match agency AI usage to FedRAMP products')
+    p.add_argument('--bench', action='store_true', help='Benchmark matching instead of writing matches')
+    p.add_argument('--scale', type=int, default=100, help='Catalog and agency multiplier for --bench')
+    p.add_argument('--full', action='store_true', help='Rematch every agency, changed or not')
+    p.set_defaults(func=cmd_match)
+
+    p = subparsers.add_parser('similarity', help='Recommend products to agencies by TF-IDF text similarity')
+    p.add_argument('--top-k', type=int, default=10, help='Products kept per agency')
+    p.add_argument('--min-score', type=float, default=0.1, help='Minimum cosine similarity')
+    p.add_argument('--bench', action='store_true', help='Benchmark on a synthetic corpus instead')
+    p.add_argument('--agencies', type=int, default=5000, help='Synthetic agencies for --bench')
+    p.add_argument('--products', type=int, default=50000, help='Synthetic products for --bench')
+    p.set_defaults(func=cmd_similarity)
+
+    p = subparsers.add_parser('bench', help='Benchmark the pipeline on a synthetic catalog and workbook')
+    p.add_argument('--products', default='real', help='Catalog size: a number or real/small/medium/large')
+    p.add_argument('--agencies', type=int, default=200, help='Agencies in the synthetic workbook')
+    p.add_argument('--latency', type=float, default=0.5, help='Seconds per fake Claude call')
+    p.add_argument('--analyze-products', type=int, default=100, help='Products sent through the analyzer')
+    p.add_argument('--workers', type=int, default=10, help='Analyzer worker threads')
+    p.add_argument('--repeat', type=int, default=3, help='Runs per query benchmark (median is kept)')
+    p.add_argument('--only', nargs='*', help='Run only these benchmarks')
+    p.add_argument('--compare', type=Path, metavar='RESULTS_JSON', help='Baseline results to compare with')
+    p.set_defaults(func=cmd_bench)
+
+    p = subparsers.add_parser('scrape', help='Scrape FedRAMP marketplace product pages')
+    p.add_argument('--stats', action='store_true', help='Show scraping statistics')
+    p.add_argument('--workers', type=int, default=5, help='Number of concurrent pages')
+    p.add_argument('--base-url', default='https://marketplace.fedramp.gov/products', help='Product page base URL')
+    p.add_argument('--tiers', default='http,browser', help='Comma-separated fetch tiers to try in order')
+    p.add_argument('--ignore-backoff', action='store_true', help='Retry failed products before their backoff expires')
+    p.set_defaults(func=cmd_scrape)
+
+    p = subparsers.add_parser('extract', help='Extract structured fields from scraped pages')
+    p.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    p.add_argument('--force', action='store_true', help='Re-extract every page, changed or not')
+    p.add_argument('--bench', type=Path, metavar='DIR', nargs='?', const=True,
+                   help='Benchmark parsing the .html fixtures in DIR (default: the checked-in fixtures/product_pages)')
+    p.add_argument('--repeat', type=int, default=1, help='Repeat the fixture corpus N times when benchmarking')
+    p.set_defaults(func=cmd_extract)
+
+    p = subparsers.add_parser('export', help='Export tables as partitioned Parquet datasets for analysis')
+    p.add_argument('--output', type=Path, default=Path(__file__).parent.parent / "data" / "export",
+                   help='Export directory')
+    p.add_argument('--tables', nargs='*', help='Tables to export (default: all)',
+                   choices=['products', 'services', 'ai_service_analysis', 'agency_ai_usage', 'agency_service_matches'])
+    p.add_argument('--full', action='store_true', help='Rewrite every partition, changed or not')
+    p.add_argument('--compression', default='zstd', help='Parquet codec (zstd, snappy, gzip, none)')
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser('serve', help='Serve the database as a cached read-only JSON API')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8765)
+    p.add_argument('--db', type=Path, help='Database to serve (default: data/fedramp.db)')
+    p.add_argument('--pool-size', type=int, default=4, help='Pooled read connections')
+    p.add_argument('--cache-entries', type=int, default=2048, help='Cached responses (0 disables)')
+    p.add_argument('--bench', action='store_true', help='Load-test the API on a local port instead')
+    p.add_argument('--requests', type=int, default=2000, help='Requests per load-test mode')
+    p.add_argument('--concurrency', type=int, default=32, help='Concurrent load-test clients')
+    p.set_defaults(func=cmd_serve)
+
+    p = subparsers.add_parser('stats', help='Show database statistics')
+    p.set_defaults(func=cmd_stats)
+
+    p = subparsers.add_parser('publish', help='Write a single-file database snapshot for the frontend')
+    p.add_argument('--output', default=str(DEFAULT_PUBLISH_PATH), help='Destination database path')
+    p.set_defaults(func=cmd_publish)
+
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if not (args.trace or args.trace_file or args.profile or args.metrics or args.metrics_dir):
+        return args.func(args)
+
+    import metrics
+    import tracing
+    if args.trace or args.trace_file:
+        print(f"🔭 Tracing to {tracing.configure(args.trace_file)}")
+    with metrics.collect(args.command, args.metrics_dir) if args.metrics or args.metrics_dir \
+            else contextlib.nullcontext() as collected, \
+            tracing.span(f"fedai.{args.command}"), \
+            tracing.profile(args.profile) if args.profile else contextlib.nullcontext():
+        status = args.func(args)
+        if collected is not None and status:
+            collected.fail('exit_status')
+        return status
+
+if __name__ == '__main__':
+    sys.exit(main())
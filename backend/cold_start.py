@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start time of the cheap fedai commands.
+
+Each command is run in a fresh interpreter several times against a synthetic
+database and the median wall time is reported. The run fails if a command exits
+with an unexpected status, or if building the CLI pulls in any of the heavy
+dependencies, which would mean a lazy import has regressed.
+"""
+import contextlib
+import io
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+HEAVY_MODULES = ['anthropic', 'playwright', 'openpyxl', 'requests', 'numpy', 'scipy']
+# (arguments, expected exit status)
+COMMANDS = [
+    (['--help'], 0),
+    (['stats', '--help'], 0),
+    (['stats'], 0),
+]
+# Runs the CLI like cli.py does, with the database pointed at the synthetic one
+LAUNCHER = "import sys, db, cli; from pathlib import Path; db.DB_PATH = Path(sys.argv[1]); sys.exit(cli.main(sys.argv[2:]))"
+
+def build_database(path: Path, products: int) -> Path:
+    """A database loaded from a synthetic marketplace export of the given size"""
+    import db
+    import synthetic
+    from load_csv import load_csv_to_database
+
+    csv_path = path.parent / "marketplace.csv"
+    synthetic.write_marketplace_csv(csv_path, products)
+    db.DB_PATH = path
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_csv_to_database(csv_path, json_path=path.parent / "no-catalog.json")
+    return path
+
+def time_command(args, db_path: Path, expected: int, runs: int) -> tuple:
+    """(median wall ms, error) of `fedai <args>` in a fresh interpreter; error is None if every run exited as expected"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', LAUNCHER, str(db_path), *args], cwd=BACKEND_DIR,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        timings.append((time.perf_counter() - start) * 1000)
+        if result.returncode != expected:
+            detail = result.stderr.strip().splitlines()[-1:] or ['no output']
+            return statistics.median(timings), f"exit status {result.returncode}, expected {expected}: {detail[0]}"
+    return statistics.median(timings), None
+
+def heavy_imports() -> list:
+    """Heavy modules loaded by importing the CLI and building its parser"""
+    probe = (
+        "import sys, json, cli; cli.build_parser(); "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    output = subprocess.check_output([sys.executable, '-c', probe], cwd=BACKEND_DIR, text=True)
+    return json.loads(output)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measure fedai cold-start time')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per command')
+    parser.add_argument('--max-ms', type=float, help='Fail if any command\'s median exceeds this')
+    parser.add_argument('--products', type=int, default=600, help='Products in the synthetic database')
+
+    args = parser.parse_args()
+
+    failed = False
+
+    loaded = heavy_imports()
+    if loaded:
+        print(f"❌ CLI startup imported heavy modules: {', '.join(loaded)}")
+        failed = True
+    else:
+        print("✓ No heavy modules imported at startup")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = build_database(Path(tmp) / "fedramp.db", args.products)
+        for command, expected in COMMANDS:
+            median_ms, error = time_command(command, db_path, expected, args.runs)
+            over = args.max_ms is not None and median_ms > args.max_ms
+            failed = failed or over or error is not None
+            print(f"{'❌' if over or error else '✓'} fedai {' '.join(command)}: {median_ms:.0f} ms"
+                  + (f" ({error})" if error else ''))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
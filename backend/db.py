@@ -1,13 +1,18 @@
 """
 Database schema and operations for FedRAMP products
 """
+import random
 import sqlite3
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 
 DB_PATH = Path(__file__).parent.parent / "data" / "fedramp.db"
 
+# Scrape retry schedule: base * 2^(attempts-1), capped, with +/-50% jitter
+SCRAPE_BACKOFF_BASE_SECONDS = 15 * 60
+SCRAPE_BACKOFF_MAX_SECONDS = 7 * 24 * 60 * 60
+
 # Database schema matching CSV structure
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS products (
@@ -74,11 +79,229 @@ CREATE TABLE IF NOT EXISTS product_ai_analysis_runs (
 
 CREATE INDEX IF NOT EXISTS idx_analysis_runs_product_id ON product_ai_analysis_runs(product_id);
 CREATE INDEX IF NOT EXISTS idx_analysis_runs_date ON product_ai_analysis_runs(analyzed_at);
+
+CREATE TABLE IF NOT EXISTS product_services (
+    fedramp_id TEXT NOT NULL,
+    service_name TEXT NOT NULL,
+    source TEXT NOT NULL,  -- 'json', 'html'
+    PRIMARY KEY (fedramp_id, source, service_name),
+    FOREIGN KEY (fedramp_id) REFERENCES products(fedramp_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_services_name ON product_services(service_name);
+
+CREATE TABLE IF NOT EXISTS product_agency_authorizations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fedramp_id TEXT NOT NULL,
+    agency_name TEXT NOT NULL,
+    sub_agency TEXT,
+    ato_issuance_date TEXT,
+    ato_expiration_date TEXT,
+    source TEXT NOT NULL,  -- 'csv', 'html'
+    FOREIGN KEY (fedramp_id) REFERENCES products(fedramp_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_authorizations_product ON product_agency_authorizations(fedramp_id, source);
+CREATE INDEX IF NOT EXISTS idx_authorizations_agency ON product_agency_authorizations(agency_name);
+
+CREATE TABLE IF NOT EXISTS agencies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    canonical_name TEXT NOT NULL,
+    slug TEXT NOT NULL UNIQUE,
+    parent_id INTEGER,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (parent_id) REFERENCES agencies(id)
+);
+
+CREATE TABLE IF NOT EXISTS agency_aliases (
+    alias_key TEXT PRIMARY KEY,  -- normalized name or acronym; '<parent id>:<key>' for a sub-agency
+    agency_id INTEGER NOT NULL,
+    alias TEXT NOT NULL,         -- spelling it was first seen as
+    source TEXT NOT NULL,        -- 'seed', 'usage', 'catalog', 'csv', 'html', ...
+    FOREIGN KEY (agency_id) REFERENCES agencies(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_agency_aliases_agency ON agency_aliases(agency_id);
+
+CREATE TABLE IF NOT EXISTS agency_product_authorizations (
+    agency_id INTEGER NOT NULL,
+    product_id TEXT NOT NULL,
+    source TEXT NOT NULL,  -- 'catalog', 'csv', 'html', 'product'
+    ato_issuance_date TEXT,
+    PRIMARY KEY (agency_id, product_id, source),
+    FOREIGN KEY (agency_id) REFERENCES agencies(id),
+    FOREIGN KEY (product_id) REFERENCES products(fedramp_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_agency_product_authorizations_product ON agency_product_authorizations(product_id);
+
+CREATE TABLE IF NOT EXISTS canonical_services (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    canonical_name TEXT NOT NULL,
+    service_key TEXT NOT NULL UNIQUE,  -- normalized name the service was created from
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS service_aliases (
+    alias_key TEXT PRIMARY KEY,  -- normalized spelling or acronym
+    service_id INTEGER NOT NULL,
+    alias TEXT NOT NULL,         -- spelling it was first seen as
+    source TEXT NOT NULL,        -- 'seed', 'json', 'html', 'analysis', ...
+    similarity REAL,             -- n-gram cosine to the service it was clustered into, NULL if exact
+    FOREIGN KEY (service_id) REFERENCES canonical_services(id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_service_aliases_service ON service_aliases(service_id);
+
+CREATE TABLE IF NOT EXISTS product_service_links (
+    service_id INTEGER NOT NULL,
+    product_id TEXT NOT NULL,
+    source TEXT NOT NULL,  -- 'json', 'html'
+    PRIMARY KEY (service_id, product_id, source),
+    FOREIGN KEY (service_id) REFERENCES canonical_services(id),
+    FOREIGN KEY (product_id) REFERENCES products(fedramp_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_product_service_links_product ON product_service_links(product_id);
+
+CREATE TABLE IF NOT EXISTS html_extractions (
+    fedramp_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    extractor_version INTEGER NOT NULL,
+    fields_found INTEGER DEFAULT 0,
+    extracted_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (fedramp_id) REFERENCES products(fedramp_id)
+);
+
+-- Product fields read from the product's page; they take precedence over the CSV export's values
+CREATE TABLE IF NOT EXISTS product_extracted_fields (
+    fedramp_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (fedramp_id, field),
+    FOREIGN KEY (fedramp_id) REFERENCES products(fedramp_id)
+);
+
+CREATE TABLE IF NOT EXISTS html_blobs (
+    content_hash TEXT PRIMARY KEY,  -- SHA-256 of the page's UTF-8 bytes
+    size_bytes INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS html_snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fedramp_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    last_fetched_at TEXT NOT NULL,
+    FOREIGN KEY (fedramp_id) REFERENCES products(fedramp_id),
+    FOREIGN KEY (content_hash) REFERENCES html_blobs(content_hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_product ON html_snapshots(fedramp_id, id);
+CREATE INDEX IF NOT EXISTS idx_snapshots_hash ON html_snapshots(content_hash);
+
+CREATE TABLE IF NOT EXISTS scrape_failures (
+    fedramp_id TEXT PRIMARY KEY,
+    error_class TEXT NOT NULL,
+    last_error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    first_failed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    last_attempt_at TEXT,
+    next_eligible_at TEXT,
+    FOREIGN KEY (fedramp_id) REFERENCES products(fedramp_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_scrape_failures_next ON scrape_failures(next_eligible_at);
+
+CREATE TABLE IF NOT EXISTS scrape_tier_stats (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_started_at TEXT NOT NULL,
+    tier TEXT NOT NULL,  -- 'http' or 'browser'
+    attempts INTEGER DEFAULT 0,
+    hits INTEGER DEFAULT 0,
+    errors INTEGER DEFAULT 0,
+    total_latency_ms REAL DEFAULT 0,
+    max_latency_ms REAL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_tier_stats_run ON scrape_tier_stats(run_started_at);
+
+CREATE TABLE IF NOT EXISTS pipeline_stage_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    fingerprint TEXT,
+    status TEXT NOT NULL,  -- 'success', 'partial' (some products failed), 'skipped', 'failed'
+    items_changed INTEGER DEFAULT 0,
+    error TEXT,
+    started_at TEXT,
+    finished_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_stage_runs_stage ON pipeline_stage_runs(stage, status);
+
+-- Durable analysis job queue (see job_queue.py); times are Unix seconds so leases compare across processes
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT NOT NULL UNIQUE,
+    state TEXT NOT NULL DEFAULT 'queued',  -- 'queued', 'leased', 'done', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,                        -- holder of the lease, then the worker that finished the job
+    lease_expires_at REAL,
+    available_at REAL NOT NULL,            -- not leased before this (retry backoff)
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    ai_services_found INTEGER,
+    last_error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_claim ON analysis_jobs(state, available_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_lease ON analysis_jobs(state, lease_expires_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_finished ON analysis_jobs(finished_at);
+
+CREATE TABLE IF NOT EXISTS queue_workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    stopped_at REAL,
+    jobs_done INTEGER NOT NULL DEFAULT 0,
+    jobs_failed INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS pipeline_product_state (
+    stage TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (stage, product_id)
+);
 """
 
+# Columns added after the first release; created on existing databases by initialize_database
+ADDED_COLUMNS = {
+    'products': {
+        'impact_level': 'TEXT',
+    },
+    'product_services': {
+        'service_id': 'INTEGER',
+    },
+    'ai_service_analysis': {
+        'service_id': 'INTEGER',
+    },
+}
+
+# Product columns that the HTML extraction stage may fill in
+EXTRACTED_PRODUCT_FIELDS = (
+    'status', 'service_model', 'independent_assessor', 'impact_level', 'ato_issuance_date',
+    'fedramp_authorization_date', 'annual_assessment_date', 'ato_expiration_date',
+)
+
 def get_connection() -> sqlite3.Connection:
     """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -86,11 +309,22 @@ def initialize_database():
     """Initialize database with schema"""
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = get_connection()
+    # WAL lets pipeline stages read while another stage is writing
+    conn.execute("PRAGMA journal_mode=WAL")
     conn.executescript(SCHEMA)
+    _add_missing_columns(conn)
     conn.commit()
     conn.close()
     print(f"Database initialized at: {DB_PATH}")
 
+def _add_missing_columns(conn: sqlite3.Connection):
+    """Bring tables created by older versions of the schema up to date"""
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
 def insert_product(conn: sqlite3.Connection, product_data: Dict[str, Any]) -> int:
     """Insert or update a product record"""
     cursor = conn.cursor()
@@ -177,36 +411,168 @@ def update_scrape_status(conn: sqlite3.Connection, fedramp_id: str, html_path: s
         WHERE fedramp_id = ?
     """, (html_path, fedramp_id))
 
+def update_extracted_fields(conn: sqlite3.Connection, fedramp_id: str, fields: Dict[str, Any]):
+    """Record the values extracted from a product's page and copy them onto its columns (empty values are ignored)"""
+    values = {k: v for k, v in fields.items() if k in EXTRACTED_PRODUCT_FIELDS and v}
+    conn.execute("DELETE FROM product_extracted_fields WHERE fedramp_id = ?", (fedramp_id,))
+    conn.executemany(
+        "INSERT INTO product_extracted_fields (fedramp_id, field, value) VALUES (?, ?, ?)",
+        [(fedramp_id, field, value) for field, value in values.items()]
+    )
+    if not values:
+        return
+    assignments = ', '.join(f"{column} = ?" for column in values)
+    conn.execute(
+        f"UPDATE products SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE fedramp_id = ?",
+        (*values.values(), fedramp_id)
+    )
+
+def replace_product_services(conn: sqlite3.Connection, fedramp_id: str, source: str, services: List[str]):
+    """Replace the service list a source recorded for a product"""
+    conn.execute("DELETE FROM product_services WHERE fedramp_id = ? AND source = ?", (fedramp_id, source))
+    conn.executemany(
+        "INSERT OR IGNORE INTO product_services (fedramp_id, service_name, source) VALUES (?, ?, ?)",
+        [(fedramp_id, name, source) for name in services]
+    )
+
+def replace_product_authorizations(conn: sqlite3.Connection, fedramp_id: str, source: str,
+                                   authorizations: List[Dict[str, Any]]):
+    """Replace the agency authorizations a source recorded for a product"""
+    conn.execute("DELETE FROM product_agency_authorizations WHERE fedramp_id = ? AND source = ?", (fedramp_id, source))
+    conn.executemany("""
+        INSERT INTO product_agency_authorizations (
+            fedramp_id, agency_name, sub_agency, ato_issuance_date, ato_expiration_date, source
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        (fedramp_id, a['agency_name'], a.get('sub_agency'), a.get('ato_issuance_date'),
+         a.get('ato_expiration_date'), source)
+        for a in authorizations
+    ])
+
 def get_all_products(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
     """Get all products"""
     cursor = conn.execute("SELECT * FROM products ORDER BY cloud_service_provider")
     return [dict(row) for row in cursor.fetchall()]
 
-def get_unscraped_products(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
-    """Get products that haven't been scraped yet"""
+def get_unscraped_products(conn: sqlite3.Connection, ignore_backoff: bool = False) -> List[Dict[str, Any]]:
+    """Get products that haven't been scraped yet and are not waiting out a retry backoff"""
     cursor = conn.execute("""
-        SELECT * FROM products
-        WHERE html_scraped = 0
-        ORDER BY fedramp_id
-    """)
+        SELECT p.* FROM products p
+        LEFT JOIN scrape_failures f ON f.fedramp_id = p.fedramp_id
+        WHERE p.html_scraped = 0
+          AND (? OR f.next_eligible_at IS NULL OR f.next_eligible_at <= datetime('now'))
+        ORDER BY p.fedramp_id
+    """, (1 if ignore_backoff else 0,))
     return [dict(row) for row in cursor.fetchall()]
 
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    """Parse the date formats used by the marketplace CSV and JSON"""
+    if not value:
+        return None
+    for fmt in ('%m/%d/%Y', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%m/%d/%y'):
+        try:
+            return datetime.strptime(value.strip()[:19], fmt)
+        except ValueError:
+            continue
+    return None
+
+def get_scrape_priorities(conn: sqlite3.Connection, expiring_within_days: int = 90) -> Dict[str, float]:
+    """
+    Scrape priority per product (higher is fetched first)
+
+    +2 if the product has AI services, +1 if its ATO expires within the window
+    (or has already expired). Products with neither are left at the default of 0.
+    """
+    cursor = conn.execute("""
+        SELECT p.fedramp_id, p.ato_expiration_date,
+               EXISTS (
+                   SELECT 1 FROM ai_service_analysis a
+                   WHERE a.product_id = p.fedramp_id AND (a.has_ai = 1 OR a.has_genai = 1 OR a.has_llm = 1)
+               ) AS has_ai
+        FROM products p
+    """)
+    horizon = datetime.now() + timedelta(days=expiring_within_days)
+    priorities = {}
+    for row in cursor:
+        score = 2.0 if row['has_ai'] else 0.0
+        expires = _parse_date(row['ato_expiration_date'])
+        if expires and expires <= horizon:
+            score += 1.0
+        if score:
+            priorities[row['fedramp_id']] = score
+    return priorities
+
 def get_scrape_stats(conn: sqlite3.Connection) -> Dict[str, int]:
     """Get scraping statistics"""
     cursor = conn.execute("""
         SELECT
             COUNT(*) as total,
-            SUM(CASE WHEN html_scraped = 1 THEN 1 ELSE 0 END) as scraped,
-            SUM(CASE WHEN html_scraped = 0 THEN 1 ELSE 0 END) as pending
-        FROM products
+            SUM(CASE WHEN p.html_scraped = 1 THEN 1 ELSE 0 END) as scraped,
+            SUM(CASE WHEN p.html_scraped = 0 THEN 1 ELSE 0 END) as pending,
+            SUM(CASE WHEN p.html_scraped = 0 AND f.next_eligible_at > datetime('now') THEN 1 ELSE 0 END) as backing_off
+        FROM products p
+        LEFT JOIN scrape_failures f ON f.fedramp_id = p.fedramp_id
     """)
     row = cursor.fetchone()
     return {
         'total': row['total'],
-        'scraped': row['scraped'],
-        'pending': row['pending']
+        'scraped': row['scraped'] or 0,
+        'pending': row['pending'] or 0,
+        'backing_off': row['backing_off'] or 0
     }
 
+def record_scrape_failure(conn: sqlite3.Connection, fedramp_id: str, error_class: str, error: str) -> Tuple[int, str]:
+    """
+    Record a failed scrape and schedule the next attempt
+
+    Uses exponential backoff with jitter so dead pages are retried less and
+    less often. Returns (attempts, next_eligible_at).
+    """
+    row = conn.execute("SELECT attempts FROM scrape_failures WHERE fedramp_id = ?", (fedramp_id,)).fetchone()
+    attempts = (row['attempts'] if row else 0) + 1
+
+    delay = min(SCRAPE_BACKOFF_MAX_SECONDS, SCRAPE_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    delay *= random.uniform(0.5, 1.5)
+    now = datetime.now(timezone.utc)
+    next_eligible_at = (now + timedelta(seconds=delay)).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn.execute("""
+        INSERT INTO scrape_failures (fedramp_id, error_class, last_error, attempts, last_attempt_at, next_eligible_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(fedramp_id) DO UPDATE SET
+            error_class = excluded.error_class,
+            last_error = excluded.last_error,
+            attempts = excluded.attempts,
+            last_attempt_at = excluded.last_attempt_at,
+            next_eligible_at = excluded.next_eligible_at
+    """, (fedramp_id, error_class, error, attempts, now.strftime('%Y-%m-%d %H:%M:%S'), next_eligible_at))
+    return attempts, next_eligible_at
+
+def clear_scrape_failure(conn: sqlite3.Connection, fedramp_id: str):
+    """Forget earlier failures once a product scrapes successfully"""
+    conn.execute("DELETE FROM scrape_failures WHERE fedramp_id = ?", (fedramp_id,))
+
+def get_scrape_failure_summary(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Count outstanding scrape failures by error class"""
+    cursor = conn.execute("""
+        SELECT error_class, COUNT(*) as products, MAX(attempts) as max_attempts
+        FROM scrape_failures
+        GROUP BY error_class
+        ORDER BY products DESC
+    """)
+    return [dict(row) for row in cursor.fetchall()]
+
+def record_scrape_tier_stats(conn: sqlite3.Connection, run_started_at: str, tier: str, attempts: int,
+                             hits: int, errors: int, total_latency_ms: float, max_latency_ms: float) -> int:
+    """Record hit rate and latency of one fetch tier for a scrape run"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO scrape_tier_stats (
+            run_started_at, tier, attempts, hits, errors, total_latency_ms, max_latency_ms
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (run_started_at, tier, attempts, hits, errors, total_latency_ms, max_latency_ms))
+    return cursor.lastrowid
+
 def insert_ai_analysis(conn: sqlite3.Connection, analysis_data: Dict[str, Any]) -> int:
     """Insert AI service analysis result"""
     cursor = conn.cursor()
@@ -232,24 +598,18 @@ def insert_ai_analysis(conn: sqlite3.Connection, analysis_data: Dict[str, Any])
     ))
     return cursor.lastrowid
 
+def _ai_filter(filter_type: Optional[str]) -> str:
+    if filter_type in ('ai', 'genai', 'llm'):
+        return f"has_{filter_type} = 1"
+    # All AI-related services (at least one flag is true)
+    return "(has_ai = 1 OR has_genai = 1 OR has_llm = 1)"
+
 def get_ai_services(conn: sqlite3.Connection, filter_type: Optional[str] = None) -> List[Dict[str, Any]]:
     """Get AI service analysis results with optional filtering"""
-    query = "SELECT * FROM ai_service_analysis WHERE 1=1"
-    params = []
-
-    if filter_type == 'ai':
-        query += " AND has_ai = 1"
-    elif filter_type == 'genai':
-        query += " AND has_genai = 1"
-    elif filter_type == 'llm':
-        query += " AND has_llm = 1"
-    else:
-        # Get all AI-related services (at least one flag is true)
-        query += " AND (has_ai = 1 OR has_genai = 1 OR has_llm = 1)"
-
+    query = f"SELECT * FROM ai_service_analysis WHERE {_ai_filter(filter_type)}"
     query += " ORDER BY provider_name, product_name, service_name"
 
-    cursor = conn.execute(query, params)
+    cursor = conn.execute(query)
     return [dict(row) for row in cursor.fetchall()]
 
 def get_ai_stats(conn: sqlite3.Connection) -> Dict[str, int]:
@@ -280,6 +640,10 @@ def clear_ai_analysis(conn: sqlite3.Connection):
     conn.execute("DELETE FROM ai_service_analysis")
     conn.commit()
 
+def delete_ai_analysis_for_products(conn: sqlite3.Connection, product_ids: List[str]):
+    """Remove AI analysis results for specific products (for incremental re-analysis)"""
+    conn.executemany("DELETE FROM ai_service_analysis WHERE product_id = ?", [(pid,) for pid in product_ids])
+
 def record_product_analysis_run(conn: sqlite3.Connection, product_id: str, product_name: str, provider_name: str, ai_services_found: int) -> int:
     """Record that a product was analyzed for AI services"""
     cursor = conn.cursor()
@@ -317,6 +681,146 @@ def get_analysis_run_stats(conn: sqlite3.Connection) -> Dict[str, Any]:
         'total_services_found': row['total_services_found'] or 0
     }
 
+def get_last_stage_fingerprint(conn: sqlite3.Connection, stage: str) -> Optional[str]:
+    """Get the input fingerprint of the last successful run of a pipeline stage (None after a partial run)"""
+    cursor = conn.execute("""
+        SELECT fingerprint, status FROM pipeline_stage_runs
+        WHERE stage = ? AND status IN ('success', 'partial')
+        ORDER BY id DESC
+        LIMIT 1
+    """, (stage,))
+    row = cursor.fetchone()
+    return row['fingerprint'] if row and row['status'] == 'success' else None
+
+def record_stage_run(conn: sqlite3.Connection, stage: str, fingerprint: Optional[str], status: str,
+                     started_at: str, items_changed: int = 0, error: Optional[str] = None) -> int:
+    """Record the outcome of a pipeline stage"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO pipeline_stage_runs (stage, fingerprint, status, items_changed, error, started_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (stage, fingerprint, status, items_changed, error, started_at))
+    return cursor.lastrowid
+
+def get_stage_product_hashes(conn: sqlite3.Connection, stage: str) -> Dict[str, str]:
+    """Get the product content hashes a stage last processed successfully"""
+    cursor = conn.execute(
+        "SELECT product_id, content_hash FROM pipeline_product_state WHERE stage = ?", (stage,)
+    )
+    return {row['product_id']: row['content_hash'] for row in cursor}
+
+def replace_stage_product_hashes(conn: sqlite3.Connection, stage: str, hashes: Dict[str, str]):
+    """Replace the product content hashes recorded for a stage"""
+    conn.execute("DELETE FROM pipeline_product_state WHERE stage = ?", (stage,))
+    conn.executemany(
+        "INSERT INTO pipeline_product_state (stage, product_id, content_hash) VALUES (?, ?, ?)",
+        [(stage, product_id, content_hash) for product_id, content_hash in hashes.items()]
+    )
+
+def table_exists(conn: sqlite3.Connection, table: str) -> bool:
+    """Check whether a table exists (agency tables are created by their own loaders)"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+# ---------------------------------------------------------------------------
+# Projected, paginated reads (the read API). Column lists come from callers'
+# whitelists and are interpolated as-is; every value is a bound parameter.
+# ---------------------------------------------------------------------------
+
+def _page(conn: sqlite3.Connection, table: str, columns: List[str], conditions: List[str], params: List[Any],
+          order_by: str, limit: int, offset: int) -> Dict[str, Any]:
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    total = conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+    cursor = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {table}{where} ORDER BY {order_by} LIMIT ? OFFSET ?",
+        [*params, limit, offset]
+    )
+    return {'items': [dict(row) for row in cursor.fetchall()], 'total': total}
+
+def get_products_page(conn: sqlite3.Connection, columns: List[str], search: Optional[str] = None,
+                      limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """One page of products, optionally matching a search term"""
+    conditions, params = [], []
+    if search:
+        conditions.append("(cloud_service_provider LIKE ? OR cloud_service_offering LIKE ? OR fedramp_id LIKE ?)")
+        params += [f"%{search}%"] * 3
+    return _page(conn, 'products', columns, conditions, params, 'cloud_service_provider, fedramp_id', limit, offset)
+
+def get_product(conn: sqlite3.Connection, fedramp_id: str) -> Optional[Dict[str, Any]]:
+    """Get one product by FedRAMP id"""
+    row = conn.execute("SELECT * FROM products WHERE fedramp_id = ?", (fedramp_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_ai_services_page(conn: sqlite3.Connection, columns: List[str], filter_type: Optional[str] = None,
+                         provider: Optional[str] = None, product_id: Optional[str] = None,
+                         limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """One page of AI services, filtered like get_ai_services"""
+    conditions, params = [_ai_filter(filter_type)], []
+    if provider:
+        conditions.append("provider_name = ?")
+        params.append(provider)
+    if product_id:
+        conditions.append("product_id = ?")
+        params.append(product_id)
+    return _page(conn, 'ai_service_analysis', columns, conditions, params,
+                 'provider_name, product_name, service_name, id', limit, offset)
+
+def get_agency_usage_page(conn: sqlite3.Connection, columns: List[str], category: Optional[str] = None,
+                          search: Optional[str] = None, slug: Optional[str] = None,
+                          limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """One page of agency AI usage rows (empty until the agency workbook is loaded)"""
+    if not table_exists(conn, 'agency_ai_usage'):
+        return {'items': [], 'total': 0}
+    conditions, params = [], []
+    if category:
+        conditions.append("agency_category = ?")
+        params.append(category)
+    if slug:
+        conditions.append("slug = ?")
+        params.append(slug)
+    if search:
+        conditions.append("(agency_name LIKE ? OR llm_name LIKE ? OR tool_name LIKE ?)")
+        params += [f"%{search}%"] * 3
+    return _page(conn, 'agency_ai_usage', columns, conditions, params, 'agency_name, id', limit, offset)
+
+def get_agency_matches_page(conn: sqlite3.Connection, columns: List[str], agency_id: Optional[int] = None,
+                            product_id: Optional[str] = None, confidence: Optional[str] = None,
+                            limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    """One page of agency → product matches, strongest first"""
+    if not table_exists(conn, 'agency_service_matches'):
+        return {'items': [], 'total': 0}
+    conditions, params = [], []
+    for column, value in (('agency_id', agency_id), ('product_id', product_id), ('confidence', confidence)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    order_by = "CASE confidence WHEN 'high' THEN 1 WHEN 'medium' THEN 2 ELSE 3 END, provider_name, id"
+    return _page(conn, 'agency_service_matches', columns, conditions, params, order_by, limit, offset)
+
+def backup_database(dest: Path) -> Path:
+    """Write a consistent single-file snapshot of the database to dest"""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest.with_name(dest.name + '.tmp')
+    tmp_path.unlink(missing_ok=True)
+
+    src = get_connection()
+    dst = sqlite3.connect(tmp_path)
+    try:
+        src.backup(dst)
+        # Readers of the published copy should not need -wal/-shm files
+        dst.execute("PRAGMA journal_mode=DELETE")
+        dst.execute("VACUUM")
+        dst.close()
+        tmp_path.replace(dest)
+    except BaseException:
+        dst.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    finally:
+        src.close()
+
+    return dest
+
 if __name__ == "__main__":
     initialize_database()
     print("Database schema created successfully!")
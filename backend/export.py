@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Columnar export of the catalog, analysis and matches
+
+Writes the products, their service lists, the AI analysis, agency AI usage and
+agency matches as Hive-partitioned Parquet datasets:
+
+    data/export/
+        manifest.json
+        products/bucket=3/part-000007.parquet
+        services/bucket=3/part-000001.parquet
+        agency_service_matches/confidence=high/part-000004.parquet
+        ...
+
+Tables keyed by product are split into ``BUCKETS`` stable hash buckets of the
+FedRAMP id, so a changed product only rewrites its bucket; agency tables are
+partitioned by category and match confidence.
+
+Repeated strings (providers, agencies, statuses, service names) are
+dictionary-encoded Arrow columns, so engines read them back as categoricals.
+Rows stream out of SQLite in fixed-size batches and each batch becomes a
+Parquet row group, which keeps memory flat at any table size.
+
+Exports are incremental: each run is a new snapshot, but a partition is only
+rewritten when its rows changed since the snapshot that last wrote it (a
+first pass hashes every partition; unchanged ones are left as they are). The
+manifest is replaced atomically before superseded files are removed, and
+lists the snapshot, row count and hash of every partition. Read a table with
+``pyarrow.dataset.dataset('data/export/products', partitioning='hive')``,
+DuckDB ``read_parquet('data/export/products/*/*.parquet', hive_partitioning=true)``
+or polars ``scan_parquet``.
+"""
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import db
+import metrics
+import tracing
+
+EXPORT_DIR = Path(__file__).parent.parent / "data" / "export"
+MANIFEST_NAME = 'manifest.json'
+BATCH_ROWS = 65536  # rows per Arrow batch / Parquet row group
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+BUCKETS = 16  # hash partitions for tables keyed by product
+
+
+def product_bucket(fedramp_id: Optional[str]) -> int:
+    """Stable hash bucket of a product id (also registered in SQLite as fedai_bucket)"""
+    return zlib.crc32((fedramp_id or '').encode('utf-8')) % BUCKETS
+
+
+@dataclass
+class ExportTable:
+    """One exported dataset: its columns and a row source ordered by the partition column"""
+    name: str
+    partition_by: str
+    columns: Callable[[sqlite3.Connection], List[Tuple[str, str]]]  # (name, SQLite type), partition column first
+    rows: Callable[[sqlite3.Connection], Iterator[tuple]]
+    dictionary: Tuple[str, ...] = ()
+    source_table: Optional[str] = None  # skipped when this table doesn't exist
+
+
+def _fetch_batches(cursor: sqlite3.Cursor) -> Iterator[tuple]:
+    while True:
+        batch = cursor.fetchmany(BATCH_ROWS)
+        if not batch:
+            return
+        yield from (tuple(row) for row in batch)
+
+def _table_columns(table: str, partition_by: str) -> Callable[[sqlite3.Connection], List[Tuple[str, str]]]:
+    def columns(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+        info = [(row[1], (row[2] or '').upper()) for row in conn.execute(f"PRAGMA table_info({table})")]
+        partition_type = next((t for name, t in info if name == partition_by), 'INTEGER')
+        return [(partition_by, partition_type)] + [c for c in info if c[0] != partition_by]
+    return columns
+
+def _table_rows(table: str, partition_by: str, partition_sql: str,
+                order_by: str) -> Callable[[sqlite3.Connection], Iterator[tuple]]:
+    def rows(conn: sqlite3.Connection) -> Iterator[tuple]:
+        names = ', '.join(name for name, _ in _table_columns(table, partition_by)(conn)[1:])
+        return _fetch_batches(conn.execute(
+            f"SELECT {partition_sql}, {names} FROM {table} ORDER BY 1, {order_by}"
+        ))
+    return rows
+
+def _service_rows(conn: sqlite3.Connection) -> Iterator[tuple]:
+    """Catalog service lists (source 'json') and services extracted from scraped pages, by bucket"""
+    import analyze_ai_services
+
+    by_bucket: List[list] = [[] for _ in range(BUCKETS)]
+    if analyze_ai_services.JSON_PATH.exists():
+        for product in analyze_ai_services.load_products():
+            by_bucket[product_bucket(product.id)].append(product)
+
+    for bucket, products in enumerate(by_bucket):
+        for product in products:
+            for service in product.services:
+                yield (bucket, product.id, 'json', service)
+        yield from _fetch_batches(conn.execute("""
+            SELECT fedai_bucket(fedramp_id), fedramp_id, source, service_name FROM product_services
+            WHERE source != 'json' AND fedai_bucket(fedramp_id) = ? ORDER BY fedramp_id, source, service_name
+        """, (bucket,)))
+
+def _sql_table(name: str, partition_by: str, order_by: str, dictionary: Tuple[str, ...],
+               bucket_column: Optional[str] = None) -> ExportTable:
+    """A database table, partitioned by a column or by hash bucket of ``bucket_column``"""
+    partition_sql = f"fedai_bucket({bucket_column})" if bucket_column else partition_by
+    return ExportTable(name, partition_by, _table_columns(name, partition_by),
+                       _table_rows(name, partition_by, partition_sql, order_by), dictionary, source_table=name)
+
+
+TABLES: Dict[str, ExportTable] = {
+    'products': _sql_table('products', 'bucket', 'fedramp_id', bucket_column='fedramp_id', dictionary=(
+        'cloud_service_provider', 'service_model', 'status', 'independent_assessor', 'parent_agency', 'sub_agency',
+        'impact_level',
+    )),
+    'services': ExportTable(
+        'services', 'bucket',
+        lambda conn: [('bucket', 'INTEGER'), ('fedramp_id', 'TEXT'), ('source', 'TEXT'), ('service_name', 'TEXT')],
+        _service_rows, dictionary=('fedramp_id', 'source', 'service_name'),
+    ),
+    'ai_service_analysis': _sql_table('ai_service_analysis', 'bucket', 'product_id, id', bucket_column='product_id',
+                                      dictionary=('product_id', 'product_name', 'provider_name', 'service_name',
+                                                  'fedramp_status', 'impact_level', 'agencies')),
+    'agency_ai_usage': _sql_table('agency_ai_usage', 'agency_category', 'id', dictionary=(
+        'agency_name', 'has_staff_llm', 'llm_name', 'has_coding_assistant', 'scope', 'solution_type',
+        'non_public_allowed', 'other_ai_present', 'slug',
+    )),
+    'agency_service_matches': _sql_table('agency_service_matches', 'confidence', 'agency_id, product_id', dictionary=(
+        'product_id', 'provider_name', 'product_name', 'match_reason',
+    )),
+}
+
+
+def _arrow_schema(columns: List[Tuple[str, str]], dictionary: Tuple[str, ...]):
+    import pyarrow as pa
+
+    fields = []
+    for name, sqlite_type in columns:
+        if name in dictionary:
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif 'INT' in sqlite_type:
+            arrow_type = pa.int64()
+        elif any(t in sqlite_type for t in ('REAL', 'FLOA', 'DOUB')):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+def _record_batch(rows: List[tuple], schema):
+    """Arrow batch from rows whose first value (the partition) is dropped"""
+    import pyarrow as pa
+
+    arrays = []
+    for field, values in zip(schema, list(zip(*rows))[1:]):
+        try:
+            arrays.append(pa.array(values, type=field.type))
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            # SQLite columns are loosely typed; fall back to text for stray values
+            if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+                raise
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _partitions(rows: Iterator[tuple]) -> Iterator[Tuple[Optional[str], Iterator[tuple]]]:
+    """Group rows by their first column (the partition value), which the source keeps contiguous"""
+    return itertools.groupby(rows, key=lambda row: row[0])
+
+def _partition_hashes(table: ExportTable, conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """First pass: row count and content hash of every partition"""
+    partitions: Dict[str, Dict[str, Any]] = {}
+    for value, rows in _partitions(table.rows(conn)):
+        key = NULL_PARTITION if value is None else str(value)
+        if key in partitions:
+            raise RuntimeError(f"{table.name}: rows for {table.partition_by}={key} are not contiguous")
+        digest = hashlib.sha256()
+        count = 0
+        for row in rows:
+            digest.update(repr(row[1:]).encode('utf-8'))
+            count += 1
+        partitions[key] = {'rows': count, 'sha256': digest.hexdigest()}
+    return partitions
+
+def _write_partitions(table: ExportTable, conn: sqlite3.Connection, output_dir: Path, changed: Dict[str, str],
+                      schema, compression: str) -> int:
+    """Second pass: stream the changed partitions to the files named in ``changed``; returns rows written"""
+    import pyarrow.parquet as pq
+
+    written = 0
+    for value, rows in _partitions(table.rows(conn)):
+        key = NULL_PARTITION if value is None else str(value)
+        if key not in changed:
+            continue
+        path = output_dir / changed[key]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with pq.ParquetWriter(tmp_path, schema, compression=compression, use_dictionary=True) as writer:
+            while True:
+                batch = list(itertools.islice(rows, BATCH_ROWS))
+                if not batch:
+                    break
+                writer.write_batch(_record_batch(batch, schema))
+                written += len(batch)
+        os.replace(tmp_path, path)
+    return written
+
+def read_manifest(output_dir: Path = EXPORT_DIR) -> Dict[str, Any]:
+    path = output_dir / MANIFEST_NAME
+    if not path.exists():
+        return {'snapshot': 0, 'tables': {}}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+def _write_manifest(output_dir: Path, manifest: Dict[str, Any]):
+    path = output_dir / MANIFEST_NAME
+    tmp_path = path.with_name(f".{MANIFEST_NAME}.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+@tracing.traced('export_all')
+def export_all(output_dir: Path = EXPORT_DIR, tables: Optional[List[str]] = None, full: bool = False,
+               compression: str = 'zstd') -> Dict[str, Dict[str, int]]:
+    """Export the selected tables as a new snapshot, rewriting only changed partitions"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(output_dir)
+    snapshot = manifest['snapshot'] + 1
+    superseded: List[Path] = []
+    added: List[str] = []
+    summary: Dict[str, Dict[str, int]] = {}
+
+    conn = sqlite3.connect(f"file:{db.DB_PATH}?mode=ro", uri=True)
+    conn.create_function('fedai_bucket', 1, product_bucket, deterministic=True)
+    try:
+        # One read transaction, so every table comes from the same database state
+        conn.execute("BEGIN")
+        for name in tables or list(TABLES):
+            table = TABLES[name]
+            if table.source_table and not db.table_exists(conn, table.source_table):
+                print(f"⏭️  {name}: table not in the database yet")
+                continue
+
+            with tracing.span('export.table', table=name) as span:
+                start = time.perf_counter()
+                last = manifest['tables'].get(name)
+                if last is None:
+                    # First export of this table; recorded even if it has no rows yet
+                    added.append(name)
+                    last = {}
+                previous = last.get('partitions', {})
+                # A changed layout invalidates every old file, like --full
+                reuse = not full and last.get('partition_by') == table.partition_by
+                current = _partition_hashes(table, conn)
+
+                changed, partitions = {}, {}
+                for key, info in current.items():
+                    old = previous.get(key)
+                    if reuse and old and old['sha256'] == info['sha256']:
+                        partitions[key] = old
+                        continue
+                    changed[key] = f"{name}/{table.partition_by}={quote(key, safe='')}/part-{snapshot:06d}.parquet"
+                    partitions[key] = {**info, 'file': changed[key], 'snapshot': snapshot}
+                superseded += [output_dir / old['file'] for key, old in previous.items()
+                               if partitions.get(key, {}).get('file') != old['file']]
+
+                schema = _arrow_schema(table.columns(conn)[1:], table.dictionary)
+                rows = _write_partitions(table, conn, output_dir, changed, schema, compression) if changed else 0
+                manifest['tables'][name] = {
+                    'partition_by': table.partition_by,
+                    'snapshot': snapshot if changed or set(previous) != set(current) or not last
+                                else last['snapshot'],
+                    'rows': sum(info['rows'] for info in current.values()),
+                    'partitions': partitions,
+                }
+                elapsed = time.perf_counter() - start
+                span.set_attributes(partitions=len(current), changed=len(changed), rows_written=rows)
+
+            metrics.add('stage_items_processed', manifest['tables'][name]['rows'])
+            metrics.record_rows(f"export.{name}", 'write', rows)
+            summary[name] = {'rows': manifest['tables'][name]['rows'], 'partitions': len(current),
+                             'changed': len(changed), 'rows_written': rows}
+            print(f"✓ {name}: {len(changed)}/{len(current)} partitions rewritten "
+                  f"({rows:,} of {manifest['tables'][name]['rows']:,} rows) in {elapsed:.2f}s")
+    finally:
+        conn.close()
+
+    if any(s['changed'] for s in summary.values()) or superseded or added:
+        manifest['snapshot'] = snapshot
+        manifest['created_at'] = datetime.now(timezone.utc).isoformat()
+        _write_manifest(output_dir, manifest)
+        for path in superseded:
+            path.unlink(missing_ok=True)
+            if path.parent.exists() and not any(path.parent.iterdir()):
+                path.parent.rmdir()
+        print(f"📦 Snapshot {snapshot} written to {output_dir}")
+    else:
+        print(f"✓ Nothing changed since snapshot {manifest['snapshot']}")
+    return summary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export the database as partitioned Parquet datasets')
+    parser.add_argument('--output', type=Path, default=EXPORT_DIR, help='Export directory')
+    parser.add_argument('--tables', nargs='*', choices=list(TABLES), help='Tables to export (default: all)')
+    parser.add_argument('--full', action='store_true', help='Rewrite every partition, changed or not')
+    parser.add_argument('--compression', default='zstd', help='Parquet codec (zstd, snappy, gzip, none)')
+
+    args = parser.parse_args()
+    export_all(args.output, tables=args.tables, full=args.full, compression=args.compression)
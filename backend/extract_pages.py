@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Extract structured fields from scraped product pages.
+
+Reads the latest stored page of every product whose content hash changed since
+it was last extracted, parses it with lxml across a process pool, and upserts
+the results: product columns (status, dates, impact level, ...), the service
+list into ``product_services`` and authorizing agencies into
+``product_agency_authorizations`` (both with source 'html').
+"""
+
+import hashlib
+import multiprocessing
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import (
+    get_connection, initialize_database, update_extracted_fields,
+    replace_product_services, replace_product_authorizations
+)
+from html_store import blob_path, read_blob_file
+import metrics
+
+EXTRACTOR_VERSION = 1  # bump to re-extract every page after changing the rules
+SOURCE = 'html'
+FIXTURE_DIR = Path(__file__).parent / "fixtures" / "product_pages"
+# Workers are spawned, not forked: the extract stage runs on a pipeline thread, and forking a threaded
+# process can copy locks held by other threads (sqlite, logging, tracing) into the child
+START_METHOD = 'spawn'
+
+# Page label (normalized) -> products column
+FIELD_LABELS = {
+    'status': 'status',
+    'fedramp status': 'status',
+    'service model': 'service_model',
+    'deployment model': 'service_model',
+    'independent assessor': 'independent_assessor',
+    '3pao': 'independent_assessor',
+    'impact level': 'impact_level',
+    'ato issuance date': 'ato_issuance_date',
+    'authorization date': 'fedramp_authorization_date',
+    'fedramp authorization date': 'fedramp_authorization_date',
+    'annual assessment date': 'annual_assessment_date',
+    'ato expiration date': 'ato_expiration_date',
+    'expiration date': 'ato_expiration_date',
+}
+LABEL_TAGS = {'dt', 'th', 'label', 'strong', 'b', 'span', 'div', 'p', 'h5', 'h6'}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4'}
+SERVICES_HEADING_RE = re.compile(r'\bservices?\b', re.IGNORECASE)
+AGENCIES_HEADING_RE = re.compile(r'\bagenc(y|ies)\b|\bauthorizations?\b', re.IGNORECASE)
+IMPACT_LEVEL_RE = re.compile(r'\b(LI-SaaS|Low|Moderate|High)\s+Impact\b', re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _text(element) -> str:
+    return WHITESPACE_RE.sub(' ', element.text_content()).strip()
+
+def _label_key(text: str) -> str:
+    return text.rstrip(':').strip().lower()
+
+def _labeled_value(label) -> Optional[str]:
+    """Value that goes with a label element: its dd/td, next sibling, or trailing text"""
+    sibling = label.getnext()
+    if sibling is not None:
+        value = _text(sibling)
+        if value:
+            return value
+    if label.tail and label.tail.strip(' :\n\t'):
+        return label.tail.strip(' :\n\t')
+    return None
+
+def _section_items(heading) -> List[Any]:
+    """Elements that follow a heading up to the next heading of any level"""
+    items = []
+    for element in heading.itersiblings():
+        if element.tag in HEADING_TAGS:
+            break
+        items.append(element)
+    return items
+
+def _list_entries(elements) -> List[str]:
+    entries = []
+    for element in elements:
+        for li in element.iter('li'):
+            text = _text(li)
+            if text:
+                entries.append(text)
+    return entries
+
+def _table_rows(elements) -> List[Dict[str, str]]:
+    """Rows of the first table in a section, keyed by lowercased header text"""
+    for element in elements:
+        tables = [element] if element.tag == 'table' else element.findall('.//table')
+        for table in tables:
+            headers = [_text(th).lower() for th in table.iter('th')]
+            rows = []
+            for tr in table.iter('tr'):
+                cells = [_text(td) for td in tr.findall('td')]
+                if cells:
+                    rows.append(dict(zip(headers or [str(i) for i in range(len(cells))], cells)))
+            if rows:
+                return rows
+    return []
+
+def _authorization_from_row(row: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    agency = sub_agency = issued = expires = None
+    for header, value in row.items():
+        if 'sub' in header:
+            sub_agency = value
+        elif 'agency' in header or header == '0':
+            agency = value
+        elif 'issu' in header:
+            issued = value
+        elif 'expir' in header:
+            expires = value
+    if not agency:
+        return None
+    return {'agency_name': agency, 'sub_agency': sub_agency,
+            'ato_issuance_date': issued, 'ato_expiration_date': expires}
+
+def extract_fields(html: str) -> Dict[str, Any]:
+    """
+    Parse one product page
+
+    Returns {'fields': {column: value}, 'services': [...], 'authorizations': [...]}.
+    """
+    import lxml.html
+
+    result = {'fields': {}, 'services': [], 'authorizations': []}
+    if not html.strip():
+        return result
+
+    doc = lxml.html.fromstring(html)
+    fields = result['fields']
+
+    # Label/value pairs: <dt>/<dd>, <th>/<td>, "<strong>Label:</strong> value", ...
+    for element in doc.iter(*LABEL_TAGS):
+        if len(element) > 1:
+            continue
+        column = FIELD_LABELS.get(_label_key(_text(element)))
+        if column and column not in fields:
+            value = _labeled_value(element)
+            if value and _label_key(value) not in FIELD_LABELS:
+                fields[column] = value
+
+    if 'impact_level' not in fields:
+        match = IMPACT_LEVEL_RE.search(doc.text_content())
+        if match:
+            fields['impact_level'] = match.group(1)
+
+    # Sections introduced by a heading
+    for heading in doc.iter(*HEADING_TAGS):
+        title = _text(heading)
+        section = _section_items(heading)
+        if AGENCIES_HEADING_RE.search(title):
+            rows = _table_rows(section)
+            if rows:
+                authorizations = [_authorization_from_row(row) for row in rows]
+            else:
+                authorizations = [{'agency_name': name} for name in _list_entries(section)]
+            result['authorizations'].extend(a for a in authorizations if a)
+        elif SERVICES_HEADING_RE.search(title):
+            result['services'].extend(_list_entries(section))
+
+    # Keep first occurrence order, drop duplicates
+    result['services'] = list(dict.fromkeys(result['services']))
+    return result
+
+def _extract_blob(item: Tuple[str, str, Path]) -> Tuple[str, str, Optional[Dict[str, Any]], Optional[str]]:
+    """Worker: read and parse one stored page"""
+    fedramp_id, content_hash, path = item
+    try:
+        return fedramp_id, content_hash, extract_fields(read_blob_file(path)), None
+    except Exception as e:
+        return fedramp_id, content_hash, None, f"{type(e).__name__}: {e}"
+
+def _extract_file(path: Path) -> int:
+    """Worker for benchmarks: parse a fixture file, return number of values found"""
+    result = extract_fields(path.read_text(encoding='utf-8'))
+    return len(result['fields']) + len(result['services']) + len(result['authorizations'])
+
+def get_pending_pages(conn, force: bool = False) -> List[Tuple[str, str]]:
+    """(fedramp_id, content_hash) of latest snapshots not yet extracted with this extractor version"""
+    cursor = conn.execute("""
+        SELECT s.fedramp_id, s.content_hash
+        FROM html_snapshots s
+        JOIN (SELECT fedramp_id, MAX(id) AS id FROM html_snapshots GROUP BY fedramp_id) latest
+          ON latest.id = s.id
+        LEFT JOIN html_extractions e ON e.fedramp_id = s.fedramp_id
+        WHERE ? OR e.content_hash IS NULL OR e.content_hash != s.content_hash
+           OR e.extractor_version != ?
+        ORDER BY s.fedramp_id
+    """, (1 if force else 0, EXTRACTOR_VERSION))
+    return [(row[0], row[1]) for row in cursor]
+
+def extraction_inputs(conn) -> str:
+    """Digest of the extractor version and every product's latest page; it changes whenever a page needs extracting"""
+    digest = hashlib.sha256(f"extractor {EXTRACTOR_VERSION}\n".encode('utf-8'))
+    for fedramp_id, content_hash in conn.execute("""
+        SELECT s.fedramp_id, s.content_hash
+        FROM html_snapshots s
+        JOIN (SELECT fedramp_id, MAX(id) AS id FROM html_snapshots GROUP BY fedramp_id) latest
+          ON latest.id = s.id
+        ORDER BY s.fedramp_id
+    """):
+        digest.update(f"{fedramp_id} {content_hash}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _save_extraction(conn, fedramp_id: str, content_hash: str, result: Dict[str, Any]):
+    # Replaced even when empty, so values that disappeared from the page do not linger
+    update_extracted_fields(conn, fedramp_id, result['fields'])
+    replace_product_services(conn, fedramp_id, SOURCE, result['services'])
+    replace_product_authorizations(conn, fedramp_id, SOURCE, result['authorizations'])
+    found = len(result['fields']) + len(result['services']) + len(result['authorizations'])
+    conn.execute("""
+        INSERT INTO html_extractions (fedramp_id, content_hash, extractor_version, fields_found, extracted_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(fedramp_id) DO UPDATE SET
+            content_hash = excluded.content_hash,
+            extractor_version = excluded.extractor_version,
+            fields_found = excluded.fields_found,
+            extracted_at = excluded.extracted_at
+    """, (fedramp_id, content_hash, EXTRACTOR_VERSION, found))
+
+def _process_pool(max_workers: Optional[int]) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(START_METHOD))
+
+def extract_all_pages(max_workers: Optional[int] = None, force: bool = False) -> Dict[str, Any]:
+    """Extract every page whose content changed since its last extraction"""
+    initialize_database()
+    conn = get_connection()
+    pending = get_pending_pages(conn, force=force)
+
+    if not pending:
+        print("✓ No changed pages to extract")
+        conn.close()
+        return {'pages': 0, 'errors': 0, 'pages_per_second': 0.0}
+
+    print(f"🔎 Extracting {len(pending)} changed pages...")
+    start = time.perf_counter()
+    extracted = errors = 0
+
+    try:
+        with _process_pool(max_workers) as executor:
+            # Blob paths are resolved here; spawned workers start from a fresh import of html_store
+            items = [(fedramp_id, content_hash, blob_path(content_hash)) for fedramp_id, content_hash in pending]
+            for fedramp_id, content_hash, result, error in executor.map(_extract_blob, items, chunksize=16):
+                if error:
+                    errors += 1
+                    metrics.add('stage_errors', error_class=error.split(':', 1)[0])
+                    print(f"❌ {fedramp_id}: {error}", file=sys.stderr)
+                    continue
+                _save_extraction(conn, fedramp_id, content_hash, result)
+                extracted += 1
+                if extracted % 100 == 0:
+                    conn.commit()
+        conn.commit()
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    rate = len(pending) / elapsed if elapsed else 0.0
+    print(f"✓ Extracted {extracted} pages ({errors} errors) in {elapsed:.2f}s — {rate:.0f} pages/s")
+    metrics.add('stage_items_processed', len(pending))
+    metrics.record_rows('html_extractions', 'upsert', extracted)
+    return {'pages': extracted, 'errors': errors, 'pages_per_second': rate}
+
+def benchmark(fixture_dir: Path = FIXTURE_DIR, repeat: int = 1, max_workers: Optional[int] = None) -> float:
+    """Parse a directory of HTML fixtures (no database) and report pages per second"""
+    files: List[Path] = sorted(fixture_dir.glob('*.html')) * repeat
+    if not files:
+        print(f"❌ No .html fixtures in {fixture_dir}")
+        return 0.0
+
+    start = time.perf_counter()
+    with _process_pool(max_workers) as executor:
+        found = sum(executor.map(_extract_file, files, chunksize=16))
+    elapsed = time.perf_counter() - start
+
+    rate = len(files) / elapsed
+    print(f"📊 Parsed {len(files)} pages ({found} values) in {elapsed:.2f}s — {rate:.0f} pages/s")
+    return rate
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Extract structured fields from scraped product pages')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Re-extract every page, changed or not')
+    parser.add_argument('--bench', type=Path, metavar='DIR', nargs='?', const=FIXTURE_DIR,
+                        help='Benchmark parsing the .html fixtures in DIR (default: the checked-in fixtures/product_pages)')
+    parser.add_argument('--repeat', type=int, default=1, help='Repeat the fixture corpus N times when benchmarking')
+
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.bench, repeat=args.repeat, max_workers=args.workers)
+    else:
+        extract_all_pages(max_workers=args.workers, force=args.force)
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -1,41 +1,171 @@
 """
 Fetch FedRAMP marketplace data from official JSON API
 This is much better than scraping HTML pages!
+
+The response body is streamed straight to a temporary file next to the
+destination, hashed while it is written, checked, and then atomically renamed
+into place. Products are read back with an incremental parser, so memory use
+does not grow with the size of the catalog. Requests go through the shared
+politeness scheduler and are retried when the host throttles or fails.
 """
-import requests
-import json
+import hashlib
+import os
+import tempfile
 from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import metrics
+import tracing
+from politeness import scheduler, parse_retry_after
 
 JSON_URL = "https://raw.githubusercontent.com/GSA/marketplace-fedramp-gov-data/refs/heads/main/data.json"
 OUTPUT_FILE = Path(__file__).parent.parent / "data" / "fedramp_products.json"
+CHECKSUM_SUFFIX = ".sha256"
+CHUNK_SIZE = 1024 * 1024  # 1 MiB
+PRODUCTS_PREFIX = "data.Products.item"
+MAX_FETCH_ATTEMPTS = 4
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CATALOG_MODE = 0o644  # mkstemp creates 0600 files; the catalog is shared with the frontend and other users
 
-def fetch_and_save_json():
-    """Fetch JSON data from official source and save locally"""
-    print(f"Fetching data from: {JSON_URL}")
+def checksum_path(path: Path) -> Path:
+    """Path of the sidecar file holding the SHA-256 of a downloaded catalog"""
+    return path.with_name(path.name + CHECKSUM_SUFFIX)
+
+def file_sha256(path: Path) -> str:
+    """Compute the SHA-256 of a file without reading it into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_products(path: Path = OUTPUT_FILE) -> Iterator[Dict[str, Any]]:
+    """Yield products from the catalog one at a time using an incremental parser"""
+    import ijson
+
+    with open(path, 'rb') as f:
+        yield from ijson.items(f, PRODUCTS_PREFIX, use_float=True)
+
+def _stream_to_file(response, f) -> tuple[str, int]:
+    """Write a streamed response body to an open file, returning (sha256, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        if not chunk:
+            continue
+        f.write(chunk)
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+def _download(f) -> tuple[str, int]:
+    """
+    Download the catalog into an open file, retrying throttled or failed requests
+
+    Each attempt waits for a slot from the politeness scheduler, which also
+    applies the backoff (honouring Retry-After) after a throttling response.
+    """
+    import requests
+
+    for attempt in range(1, MAX_FETCH_ATTEMPTS + 1):
+        f.seek(0)
+        f.truncate()
+        with tracing.span('fetch.attempt', attempt=attempt) as span, scheduler.slot_sync(JSON_URL) as slot:
+            try:
+                with requests.get(JSON_URL, timeout=30, stream=True) as response:
+                    span.set('http.status_code', response.status_code)
+                    slot.report(response.status_code, retry_after=parse_retry_after(response.headers.get('Retry-After')))
+                    if response.status_code in RETRY_STATUSES and attempt < MAX_FETCH_ATTEMPTS:
+                        metrics.add('stage_errors', error_class=f"http_{response.status_code}")
+                        print(f"⚠️  HTTP {response.status_code}, retrying ({attempt}/{MAX_FETCH_ATTEMPTS})")
+                        continue
+                    response.raise_for_status()
+                    sha256, size = _stream_to_file(response, f)
+                    span.set('bytes', size)
 
-    response = requests.get(JSON_URL, timeout=30)
-    response.raise_for_status()
+                    content_length = response.headers.get('Content-Length')
+                    if content_length and not response.headers.get('Content-Encoding'):
+                        if int(content_length) != size:
+                            raise IOError(f"Truncated download: expected {content_length} bytes, got {size}")
+                    return sha256, size
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # Treat like a 503 so the scheduler backs off before the next attempt
+                slot.report(503)
+                if attempt == MAX_FETCH_ATTEMPTS:
+                    raise
+                metrics.add('stage_errors', error_class=type(e).__name__)
+                print(f"⚠️  {type(e).__name__}, retrying ({attempt}/{MAX_FETCH_ATTEMPTS})")
 
-    data = response.json()
+@tracing.traced('fetch_and_save_json')
+def fetch_and_save_json(expected_sha256: Optional[str] = None, output_file: Path = OUTPUT_FILE) -> Dict[str, Any]:
+    """
+    Fetch JSON data from official source and save locally
+
+    The download is verified before it replaces the existing catalog: the byte
+    count must match Content-Length (when the body is not re-encoded), the
+    SHA-256 must match ``expected_sha256`` if one is given, and the product
+    array must parse. Returns a summary with the path, checksum and counts.
+    """
+    print(f"Fetching data from: {JSON_URL}")
 
     # Ensure output directory exists
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp_name = tempfile.mkstemp(prefix=output_file.name + '.', suffix='.part', dir=output_file.parent)
+    tmp_path = Path(tmp_name)
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            sha256, size = _download(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if expected_sha256 and sha256 != expected_sha256.lower():
+            raise IOError(f"Checksum mismatch: expected {expected_sha256}, got {sha256}")
 
-    # Save to file
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+        # Parse the product array incrementally to make sure the file is usable
+        product_count = 0
+        first_product = None
+        with tracing.span('fetch.validate'):
+            for product in iter_products(tmp_path):
+                if first_product is None:
+                    first_product = product
+                product_count += 1
 
-    print(f"✓ Successfully saved JSON data to: {OUTPUT_FILE}")
+        # Atomically replace the previous catalog, then record its checksum
+        os.chmod(tmp_path, CATALOG_MODE)
+        os.replace(tmp_path, output_file)
+        checksum_path(output_file).write_text(f"{sha256}  {output_file.name}\n", encoding='utf-8')
+
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    tracing.current_span().set_attributes(bytes=size, products=product_count)
+    metrics.add('stage_items_processed', product_count)
+    print(f"✓ Successfully saved JSON data to: {output_file}")
+    print(f"✓ SHA-256: {sha256} ({size / 1024 / 1024:.1f} MiB)")
 
     # Print some stats
-    products = data.get('data', {}).get('Products', [])
-    print(f"✓ Total products: {len(products)}")
+    print(f"✓ Total products: {product_count}")
 
-    if products:
-        print(f"✓ Sample product ID: {products[0]['id']}")
-        print(f"✓ Available fields: {', '.join(products[0].keys())}")
+    if first_product:
+        print(f"✓ Sample product ID: {first_product['id']}")
+        print(f"✓ Available fields: {', '.join(first_product.keys())}")
 
-    return data
+    return {
+        'path': output_file,
+        'sha256': sha256,
+        'size': size,
+        'product_count': product_count,
+    }
 
 if __name__ == "__main__":
-    fetch_and_save_json()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fetch the FedRAMP marketplace catalog')
+    parser.add_argument('--sha256', help='Expected SHA-256 of the downloaded file')
+
+    args = parser.parse_args()
+
+    fetch_and_save_json(expected_sha256=args.sha256)
@@ -0,0 +1,151 @@
+"""
+Content-addressed store for scraped product pages
+
+Pages are stored once per distinct content as gzip blobs named by the SHA-256
+of the HTML. SQLite keeps the blob inventory and, per product, the history of
+content hashes with when each was first and last fetched. A rescrape that
+returns the same page only bumps ``last_fetched_at``; "did this page change"
+is a hash comparison against the latest snapshot.
+"""
+import gzip
+import hashlib
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional, Tuple
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+STORE_DIR = DATA_DIR / "html_store"
+COMPRESSION_LEVEL = 6
+
+def content_hash(html: str) -> str:
+    """SHA-256 of a page's UTF-8 bytes"""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+def blob_path(sha256: str) -> Path:
+    """Location of a blob, fanned out by the first two hex digits"""
+    return STORE_DIR / sha256[:2] / f"{sha256}.html.gz"
+
+def relative_blob_path(sha256: str) -> str:
+    """Blob path relative to the repository root, as stored in products.html_path"""
+    return str(blob_path(sha256).relative_to(DATA_DIR.parent))
+
+def _write_blob(sha256: str, data: bytes) -> int:
+    """Write a compressed blob if it doesn't exist yet; returns its size on disk"""
+    path = blob_path(sha256)
+    if path.exists():
+        return path.stat().st_size
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    compressed = gzip.compress(data, compresslevel=COMPRESSION_LEVEL, mtime=0)
+    fd, tmp_name = tempfile.mkstemp(prefix=path.name + '.', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return len(compressed)
+
+def get_latest_hash(conn: sqlite3.Connection, fedramp_id: str) -> Optional[str]:
+    """Content hash of the most recent snapshot of a product page"""
+    row = conn.execute("""
+        SELECT content_hash FROM html_snapshots
+        WHERE fedramp_id = ?
+        ORDER BY id DESC
+        LIMIT 1
+    """, (fedramp_id,)).fetchone()
+    return row[0] if row else None
+
+def put_page(conn: sqlite3.Connection, fedramp_id: str, html: str,
+             fetched_at: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    Store a fetched page for a product
+
+    Returns (content_hash, changed). Identical content is never written twice,
+    and an unchanged rescrape adds no snapshot row.
+    """
+    fetched_at = fetched_at or datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    data = html.encode('utf-8')
+    sha256 = hashlib.sha256(data).hexdigest()
+
+    stored_bytes = _write_blob(sha256, data)
+    conn.execute("""
+        INSERT OR IGNORE INTO html_blobs (content_hash, size_bytes, stored_bytes)
+        VALUES (?, ?, ?)
+    """, (sha256, len(data), stored_bytes))
+
+    changed = get_latest_hash(conn, fedramp_id) != sha256
+    if changed:
+        conn.execute("""
+            INSERT INTO html_snapshots (fedramp_id, content_hash, fetched_at, last_fetched_at)
+            VALUES (?, ?, ?, ?)
+        """, (fedramp_id, sha256, fetched_at, fetched_at))
+    else:
+        conn.execute("""
+            UPDATE html_snapshots SET last_fetched_at = ?
+            WHERE id = (SELECT MAX(id) FROM html_snapshots WHERE fedramp_id = ?)
+        """, (fetched_at, fedramp_id))
+
+    return sha256, changed
+
+def read_blob(sha256: str) -> str:
+    """Decompress a stored page"""
+    return read_blob_file(blob_path(sha256))
+
+def read_blob_file(path: Path) -> str:
+    """Decompress the blob at path (for worker processes, which may not share this process's STORE_DIR)"""
+    with gzip.open(path, 'rb') as f:
+        return f.read().decode('utf-8')
+
+def read_latest_page(conn: sqlite3.Connection, fedramp_id: str) -> Optional[str]:
+    """HTML of the latest snapshot of a product page, if any"""
+    sha256 = get_latest_hash(conn, fedramp_id)
+    return read_blob(sha256) if sha256 else None
+
+def get_store_stats(conn: sqlite3.Connection) -> dict:
+    """Blob and snapshot counts with raw vs on-disk size"""
+    row = conn.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM html_blobs) as blobs,
+            (SELECT COUNT(*) FROM html_snapshots) as snapshots,
+            (SELECT COUNT(DISTINCT fedramp_id) FROM html_snapshots) as products,
+            (SELECT COALESCE(SUM(size_bytes), 0) FROM html_blobs) as raw_bytes,
+            (SELECT COALESCE(SUM(stored_bytes), 0) FROM html_blobs) as stored_bytes
+    """).fetchone()
+    return dict(zip(('blobs', 'snapshots', 'products', 'raw_bytes', 'stored_bytes'), row))
+
+def import_directory(conn: sqlite3.Connection, html_dir: Path) -> int:
+    """Import legacy data/html/{fedramp_id}.html files into the store"""
+    count = 0
+    for path in sorted(html_dir.glob('*.html')):
+        fetched_at = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        put_page(conn, path.stem, path.read_text(encoding='utf-8'), fetched_at)
+        count += 1
+    conn.commit()
+    return count
+
+if __name__ == "__main__":
+    import argparse
+    from db import get_connection, initialize_database
+
+    parser = argparse.ArgumentParser(description='Manage the content-addressed HTML store')
+    parser.add_argument('--import-dir', type=Path, help='Import {FEDRAMP_ID}.html files from this directory')
+
+    args = parser.parse_args()
+
+    initialize_database()
+    conn = get_connection()
+
+    if args.import_dir:
+        imported = import_directory(conn, args.import_dir)
+        print(f"✓ Imported {imported} pages from {args.import_dir}")
+
+    stats = get_store_stats(conn)
+    conn.close()
+
+    print(f"Blobs: {stats['blobs']} ({stats['raw_bytes'] / 1024:.0f} KiB raw, {stats['stored_bytes'] / 1024:.0f} KiB on disk)")
+    print(f"Snapshots: {stats['snapshots']} across {stats['products']} products")
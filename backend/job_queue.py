@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Durable job queue for AI analysis
+
+Each product to analyze is one row in ``analysis_jobs``. Workers, in any
+number of processes and on any host that can open the database, claim
+jobs in batches under a lease. A claim is one ``BEGIN IMMEDIATE``
+transaction, so two workers never hold the same job. A heartbeat thread
+keeps extending a worker's leases while it is alive. If a worker crashes,
+its leases run out after the visibility timeout and the next claim takes
+the jobs back.
+
+Each claim counts one attempt. A failed attempt goes back in the queue
+with exponential backoff until ``max_attempts`` is reached, and then it is
+marked failed. A result is written in the same transaction that marks its
+job done, and only if this worker still holds the lease on that attempt.
+A worker whose lease was taken over therefore discards its late result
+instead of writing it twice.
+
+``fedai queue status`` shows queue depth, per-worker throughput and an
+ETA based on recent completions.
+"""
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import metrics
+import tracing
+from db import (
+    get_connection, initialize_database, insert_ai_analysis, delete_ai_analysis_for_products,
+    record_product_analysis_run,
+)
+
+LEASE_SECONDS = 60.0        # visibility timeout: a job whose lease is not renewed this long is reclaimed
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 30.0   # first retry delay, doubled per attempt
+RETRY_MAX_SECONDS = 900.0
+MAX_JOB_SECONDS = 900.0     # heartbeats stop renewing a job running longer than this, so a hung call is retried
+POLL_SECONDS = 1.0
+THROUGHPUT_WINDOW = 300.0   # seconds of completions the status rates and ETA are based on
+STATES = ('queued', 'leased', 'done', 'failed')
+
+
+@dataclass
+class Job:
+    id: int
+    product_id: str
+    attempts: int
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{random.getrandbits(16):04x}"
+
+
+# ---------------------------------------------------------------------------
+# Queue operations
+# ---------------------------------------------------------------------------
+
+def enqueue(conn: sqlite3.Connection, product_ids: Iterable[str], retry_failed_only: bool = False) -> int:
+    """
+    Queue products for analysis; returns how many jobs were added or requeued
+
+    Jobs already queued or leased are left alone. Finished jobs are requeued
+    with a fresh attempt count (failed ones only, with retry_failed_only).
+    """
+    now = time.time()
+    requeue = "('failed')" if retry_failed_only else "('done', 'failed')"
+    before = conn.total_changes
+    with conn:
+        conn.executemany(f"""
+            INSERT INTO analysis_jobs (product_id, available_at, enqueued_at) VALUES (?, ?, ?)
+            ON CONFLICT(product_id) DO UPDATE SET
+                state = 'queued', attempts = 0, worker_id = NULL, lease_expires_at = NULL,
+                available_at = excluded.available_at, enqueued_at = excluded.enqueued_at,
+                started_at = NULL, finished_at = NULL, ai_services_found = NULL, last_error = NULL
+            WHERE analysis_jobs.state IN {requeue}
+        """, [(product_id, now, now) for product_id in product_ids])
+    return conn.total_changes - before
+
+def claim(conn: sqlite3.Connection, worker_id: str, limit: int, lease_seconds: float = LEASE_SECONDS,
+          max_attempts: int = MAX_ATTEMPTS) -> List[Job]:
+    """Lease up to limit available jobs, including jobs whose lease expired"""
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # A lease that ran out on the last attempt means the job keeps killing its worker
+        conn.execute("""
+            UPDATE analysis_jobs SET state = 'failed', finished_at = ?, lease_expires_at = NULL,
+                last_error = 'lease expired on final attempt'
+            WHERE state = 'leased' AND lease_expires_at < ? AND attempts >= ?
+        """, (now, now, max_attempts))
+        reclaimed = conn.execute(
+            "SELECT COUNT(*) FROM analysis_jobs WHERE state = 'leased' AND lease_expires_at < ?", (now,)
+        ).fetchone()[0]
+        rows = conn.execute("""
+            UPDATE analysis_jobs SET state = 'leased', worker_id = ?, attempts = attempts + 1,
+                lease_expires_at = ?, started_at = ?
+            WHERE id IN (
+                SELECT id FROM analysis_jobs
+                WHERE (state = 'queued' AND available_at <= ?) OR (state = 'leased' AND lease_expires_at < ?)
+                ORDER BY available_at, id LIMIT ?
+            )
+            RETURNING id, product_id, attempts
+        """, (worker_id, now + lease_seconds, now, now, now, limit)).fetchall()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if reclaimed:
+        metrics.add('queue_leases_reclaimed', min(reclaimed, len(rows)))
+    return [Job(row[0], row[1], row[2]) for row in sorted(rows, key=lambda r: r[0])]
+
+def heartbeat(conn: sqlite3.Connection, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> int:
+    """Extend the worker's leases (except jobs running past MAX_JOB_SECONDS); returns leases held"""
+    now = time.time()
+    with conn:
+        cursor = conn.execute("""
+            UPDATE analysis_jobs SET lease_expires_at = ?
+            WHERE worker_id = ? AND state = 'leased' AND started_at > ?
+        """, (now + lease_seconds, worker_id, now - MAX_JOB_SECONDS))
+        conn.execute("UPDATE queue_workers SET heartbeat_at = ? WHERE worker_id = ?", (now, worker_id))
+    return cursor.rowcount
+
+def complete(conn: sqlite3.Connection, job: Job, worker_id: str, product: Any,
+             ai_services: List[Dict[str, Any]]) -> bool:
+    """Write a job's results and mark it done; False (nothing written) if the lease was lost"""
+    now = time.time()
+    with conn:
+        cursor = conn.execute("""
+            UPDATE analysis_jobs SET state = 'done', finished_at = ?, lease_expires_at = NULL,
+                ai_services_found = ?, last_error = NULL
+            WHERE id = ? AND worker_id = ? AND attempts = ? AND state = 'leased'
+        """, (now, len(ai_services), job.id, worker_id, job.attempts))
+        if cursor.rowcount != 1:
+            return False
+        delete_ai_analysis_for_products(conn, [job.product_id])
+        for service in ai_services:
+            insert_ai_analysis(conn, service)
+        record_product_analysis_run(conn, product.id, product.cso, product.csp, len(ai_services))
+        conn.execute("UPDATE queue_workers SET jobs_done = jobs_done + 1 WHERE worker_id = ?", (worker_id,))
+    return True
+
+def fail(conn: sqlite3.Connection, job: Job, worker_id: str, error: str, max_attempts: int = MAX_ATTEMPTS,
+         retry_base: float = RETRY_BASE_SECONDS) -> str:
+    """Record a failed attempt: back off and requeue, or give up after max_attempts; returns the new state"""
+    now = time.time()
+    final = job.attempts >= max_attempts
+    state = 'failed' if final else 'queued'
+    delay = min(retry_base * 2 ** (job.attempts - 1), RETRY_MAX_SECONDS)
+    with conn:
+        cursor = conn.execute("""
+            UPDATE analysis_jobs SET state = ?, lease_expires_at = NULL, available_at = ?,
+                finished_at = ?, last_error = ?
+            WHERE id = ? AND worker_id = ? AND attempts = ? AND state = 'leased'
+        """, (state, now + delay, now if final else None, error[:500], job.id, worker_id, job.attempts))
+        if cursor.rowcount != 1:
+            return 'lost'
+        conn.execute("UPDATE queue_workers SET jobs_failed = jobs_failed + 1 WHERE worker_id = ?", (worker_id,))
+    return state
+
+def outstanding(conn: sqlite3.Connection) -> int:
+    """Jobs still queued or leased"""
+    return conn.execute("SELECT COUNT(*) FROM analysis_jobs WHERE state IN ('queued', 'leased')").fetchone()[0]
+
+
+# ---------------------------------------------------------------------------
+# Workers
+# ---------------------------------------------------------------------------
+
+def _heartbeat_loop(worker_id: str, lease_seconds: float, stop: threading.Event):
+    conn = get_connection()
+    try:
+        while not stop.wait(lease_seconds / 3):
+            try:
+                heartbeat(conn, worker_id, lease_seconds)
+            except sqlite3.OperationalError as e:
+                # A busy database delays one beat; the lease has two more before it expires
+                print(f"⚠️  Heartbeat failed for {worker_id}: {e}")
+    finally:
+        conn.close()
+
+def run_worker(concurrency: int = 4, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+               poll_seconds: float = POLL_SECONDS, exit_when_idle: bool = True,
+               retry_base: float = RETRY_BASE_SECONDS) -> Dict[str, int]:
+    """
+    Claim and analyze jobs until the queue is drained (or forever without exit_when_idle)
+
+    ``concurrency`` Claude requests run at once in threads; run more worker
+    processes to scale past one interpreter.
+    """
+    import analyze_ai_services
+
+    analyze_ai_services.get_client()  # fail fast on missing credentials
+    products = {p.id: p for p in analyze_ai_services.load_products()}
+    worker_id = new_worker_id()
+
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute("""
+            INSERT INTO queue_workers (worker_id, host, pid, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)
+        """, (worker_id, socket.gethostname(), os.getpid(), now, now))
+    print(f"👷 Worker {worker_id} started ({concurrency} concurrent requests, {lease_seconds:.0f}s leases)")
+
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat_loop, args=(worker_id, lease_seconds, stop),
+                            name='queue-heartbeat', daemon=True)
+    beat.start()
+
+    counts = {'done': 0, 'retried': 0, 'failed': 0, 'lost': 0}
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                if len(in_flight) < concurrency:
+                    for job in claim(conn, worker_id, concurrency - len(in_flight), lease_seconds, max_attempts):
+                        product = products.get(job.product_id)
+                        if product is None:
+                            fail(conn, job, worker_id, 'product not in catalog', max_attempts=job.attempts)
+                            counts['failed'] += 1
+                            continue
+                        future = executor.submit(tracing.propagate(analyze_ai_services.analyze_product_with_claude),
+                                                 product, True)
+                        in_flight[future] = job
+
+                if not in_flight:
+                    if exit_when_idle and not outstanding(conn):
+                        break
+                    time.sleep(poll_seconds)
+                    continue
+
+                finished, _ = wait(in_flight, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = in_flight.pop(future)
+                    product = products[job.product_id]
+                    try:
+                        ai_services = future.result()
+                    except Exception as e:
+                        state = fail(conn, job, worker_id, f"{type(e).__name__}: {e}", max_attempts, retry_base)
+                        counts['lost' if state == 'lost' else 'retried' if state == 'queued' else 'failed'] += 1
+                        print(f"❌ {product.cso} (attempt {job.attempts}/{max_attempts}): {e} -> {state}")
+                        continue
+
+                    if complete(conn, job, worker_id, product, ai_services):
+                        counts['done'] += 1
+                        metrics.add('stage_items_processed')
+                        metrics.record_rows('ai_service_analysis', 'insert', len(ai_services))
+                        metrics.record_rows('product_ai_analysis_runs', 'insert', 1)
+                        marker = '✅' if ai_services else '⚪'
+                        print(f"{marker} {product.csp or 'Unknown'} - {product.cso or 'Unknown'}: "
+                              f"{len(ai_services)} AI services")
+                    else:
+                        counts['lost'] += 1
+                        metrics.add('stage_errors', error_class='lease_lost')
+                        print(f"⚠️  Lease on {product.cso} was lost; result discarded")
+    finally:
+        stop.set()
+        beat.join()
+        with conn:
+            conn.execute("UPDATE queue_workers SET stopped_at = ? WHERE worker_id = ?", (time.time(), worker_id))
+        conn.close()
+
+    print(f"👷 Worker {worker_id} finished: {counts['done']} done, {counts['retried']} retried, "
+          f"{counts['failed']} failed, {counts['lost']} leases lost")
+    return counts
+
+def _worker_process(kwargs: Dict[str, Any]):
+    run_worker(**kwargs)
+
+def start_workers(processes: int, start_method: Optional[str] = None, **kwargs) -> List[int]:
+    """Run ``processes`` workers as child processes and wait for them; returns their exit codes"""
+    import multiprocessing
+
+    context = multiprocessing.get_context(start_method)
+    children = [context.Process(target=_worker_process, args=(kwargs,), name=f"queue-worker-{i}")
+                for i in range(processes)]
+    for child in children:
+        child.start()
+    for child in children:
+        child.join()
+    return [child.exitcode for child in children]
+
+
+# ---------------------------------------------------------------------------
+# Coordinator
+# ---------------------------------------------------------------------------
+
+def queue_status(conn: sqlite3.Connection, window: float = THROUGHPUT_WINDOW,
+                 lease_seconds: float = LEASE_SECONDS) -> Dict[str, Any]:
+    """Queue depth by state, per-worker throughput over the last window seconds, and an ETA"""
+    now = time.time()
+    depth = {state: 0 for state in STATES}
+    for state, count in conn.execute("SELECT state, COUNT(*) FROM analysis_jobs GROUP BY state"):
+        depth[state] = count
+    expired = conn.execute(
+        "SELECT COUNT(*) FROM analysis_jobs WHERE state = 'leased' AND lease_expires_at < ?", (now,)
+    ).fetchone()[0]
+    backing_off = conn.execute(
+        "SELECT COUNT(*) FROM analysis_jobs WHERE state = 'queued' AND available_at > ?", (now,)
+    ).fetchone()[0]
+
+    recent = dict(conn.execute("""
+        SELECT worker_id, COUNT(*) FROM analysis_jobs
+        WHERE state = 'done' AND finished_at >= ? GROUP BY worker_id
+    """, (now - window,)).fetchall())
+    leased = dict(conn.execute(
+        "SELECT worker_id, COUNT(*) FROM analysis_jobs WHERE state = 'leased' GROUP BY worker_id"
+    ).fetchall())
+
+    workers = []
+    for row in conn.execute("""
+        SELECT worker_id, host, pid, started_at, heartbeat_at, stopped_at, jobs_done, jobs_failed
+        FROM queue_workers WHERE stopped_at IS NULL OR stopped_at >= ? ORDER BY started_at
+    """, (now - window,)):
+        if row['stopped_at'] is not None:
+            status = 'stopped'
+        elif now - row['heartbeat_at'] > lease_seconds:
+            status = 'dead'
+        else:
+            status = 'alive'
+        active = max(1.0, min(window, (row['stopped_at'] or now) - max(row['started_at'], now - window)))
+        workers.append({
+            'worker_id': row['worker_id'],
+            'host': row['host'],
+            'pid': row['pid'],
+            'status': status,
+            'leased': leased.get(row['worker_id'], 0),
+            'jobs_done': row['jobs_done'],
+            'jobs_failed': row['jobs_failed'],
+            'jobs_per_minute': recent.get(row['worker_id'], 0) / active * 60,
+        })
+
+    rate = sum(w['jobs_per_minute'] for w in workers if w['status'] == 'alive') / 60
+    remaining = depth['queued'] + depth['leased']
+    return {
+        'depth': depth,
+        'expired_leases': expired,
+        'backing_off': backing_off,
+        'workers': workers,
+        'jobs_per_second': rate,
+        'eta_seconds': remaining / rate if rate > 0 else None,
+    }
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+def print_status(status: Dict[str, Any]):
+    depth = status['depth']
+    total = sum(depth.values())
+    print(f"📬 Jobs: {total} total | {depth['queued']} queued ({status['backing_off']} backing off) | "
+          f"{depth['leased']} leased ({status['expired_leases']} expired) | {depth['done']} done | "
+          f"{depth['failed']} failed")
+    if status['workers']:
+        print(f"\n{'Worker':<36} {'Status':<8} {'Leased':>6} {'Done':>6} {'Failed':>6} {'Jobs/min':>9}")
+        for w in status['workers']:
+            print(f"{w['worker_id']:<36} {w['status']:<8} {w['leased']:>6} {w['jobs_done']:>6} "
+                  f"{w['jobs_failed']:>6} {w['jobs_per_minute']:>9.1f}")
+    remaining = depth['queued'] + depth['leased']
+    if not remaining:
+        print("\n✓ Queue drained")
+    elif status['eta_seconds'] is not None:
+        print(f"\n⏱️  {status['jobs_per_second'] * 60:.1f} jobs/min, ETA {_duration(status['eta_seconds'])} "
+              f"for {remaining} jobs")
+    else:
+        print(f"\n⏸️  {remaining} jobs waiting and no live worker has finished one recently")
+
+def watch(interval: float = 5.0, window: float = THROUGHPUT_WINDOW):
+    """Print the queue status every interval seconds until the queue drains"""
+    conn = get_connection()
+    try:
+        while True:
+            status = queue_status(conn, window)
+            print(f"\n--- {time.strftime('%H:%M:%S')} ---")
+            print_status(status)
+            if not status['depth']['queued'] and not status['depth']['leased']:
+                break
+            time.sleep(interval)
+    finally:
+        conn.close()
+
+
+def benchmark(products: int = 300, processes: int = 4, concurrency: int = 4, latency: float = 0.2,
+              lease_seconds: float = 3.0, kill_after: Optional[float] = 1.0):
+    """
+    Drain a queue of synthetic products with worker processes and a stand-in Claude client
+
+    With kill_after set (and more than one process), the first worker is
+    killed that many seconds in, and the survivors reclaim its jobs once its
+    leases expire.
+    """
+    import multiprocessing
+    import signal
+    import tempfile
+
+    import analyze_ai_services
+    import bench
+    import catalog
+
+    with tempfile.TemporaryDirectory(prefix='fedai-queue-') as tmp:
+        ws = bench.Workspace(Path(tmp), products, agencies=10, seed=0)
+        with ws.database('queue'):
+            analyze_ai_services.set_client(bench.FakeAnthropicClient(latency=latency))
+            try:
+                conn = get_connection()
+                queued = enqueue(conn, [p.id for p in catalog.load_catalog(ws.catalog)])
+                print(f"📬 Queued {queued} jobs; {processes} workers x {concurrency} requests, "
+                      f"{latency * 1000:.0f} ms per request")
+
+                # Fork so the children inherit the stand-in client and the scratch paths
+                context = multiprocessing.get_context('fork')
+                kwargs = dict(concurrency=concurrency, lease_seconds=lease_seconds, poll_seconds=0.1)
+                start = time.perf_counter()
+                children = [context.Process(target=_worker_process, args=(kwargs,)) for _ in range(processes)]
+                for child in children:
+                    child.start()
+                if kill_after is not None and processes > 1:
+                    time.sleep(kill_after)
+                    os.kill(children[0].pid, signal.SIGKILL)
+                    print(f"💥 Killed worker process {children[0].pid} after {kill_after:.1f}s")
+                for child in children:
+                    child.join()
+                elapsed = time.perf_counter() - start
+
+                print()
+                print_status(queue_status(conn, window=elapsed + 1, lease_seconds=lease_seconds))
+                reattempted = conn.execute("SELECT COUNT(*) FROM analysis_jobs WHERE attempts > 1").fetchone()[0]
+                runs, analyzed = conn.execute(
+                    "SELECT COUNT(*), COUNT(DISTINCT product_id) FROM product_ai_analysis_runs"
+                ).fetchone()
+                print(f"\n⏱️  {queued} jobs in {elapsed:.2f}s ({queued / elapsed:.1f} jobs/s); "
+                      f"{reattempted} reclaimed or retried; {runs} results written for {analyzed} products")
+                conn.close()
+            finally:
+                analyze_ai_services.set_client(None)
+
+
+def main(action: str, product_ids: Optional[List[str]] = None, failed_only: bool = False, processes: int = 1,
+         concurrency: int = 4, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS,
+         keep_running: bool = False, watch_seconds: Optional[float] = None) -> int:
+    if action == 'bench':
+        # At least two workers, so the survivors can reclaim the killed one's jobs
+        benchmark(processes=max(2, processes), concurrency=concurrency)
+        return 0
+
+    initialize_database()
+
+    if action == 'enqueue':
+        conn = get_connection()
+        try:
+            if product_ids:
+                ids = product_ids
+            elif failed_only:
+                ids = [row[0] for row in conn.execute("SELECT product_id FROM analysis_jobs WHERE state = 'failed'")]
+            else:
+                import analyze_ai_services
+                ids = [p.id for p in analyze_ai_services.load_products()]
+            count = enqueue(conn, ids, retry_failed_only=failed_only)
+            print(f"📬 Queued {count} jobs ({len(ids) - count} already queued, leased or unchanged)")
+            print_status(queue_status(conn))
+        finally:
+            conn.close()
+        return 0
+
+    if action == 'work':
+        kwargs = dict(concurrency=concurrency, lease_seconds=lease_seconds, max_attempts=max_attempts,
+                      exit_when_idle=not keep_running)
+        if processes > 1:
+            codes = start_workers(processes, **kwargs)
+            return 0 if all(code == 0 for code in codes) else 1
+        run_worker(**kwargs)
+        return 0
+
+    if action == 'status':
+        if watch_seconds:
+            watch(watch_seconds)
+            return 0
+        conn = get_connection()
+        try:
+            print_status(queue_status(conn, lease_seconds=lease_seconds))
+        finally:
+            conn.close()
+        return 0
+
+    raise ValueError(f"Unknown queue action {action!r}")
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Durable job queue for AI analysis')
+    parser.add_argument('action', choices=['enqueue', 'work', 'status', 'bench'])
+    parser.add_argument('--products', nargs='*', help='Product ids to enqueue (default: whole catalog)')
+    parser.add_argument('--failed', action='store_true', help='Requeue only failed jobs')
+    parser.add_argument('--processes', type=int, default=1, help='Worker processes to start')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent Claude requests per worker')
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS, help='Visibility timeout in seconds')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    parser.add_argument('--keep-running', action='store_true', help='Keep polling after the queue drains')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='Refresh status until the queue drains')
+    args = parser.parse_args()
+    exit(main(args.action, product_ids=args.products, failed_only=args.failed, processes=args.processes,
+              concurrency=args.concurrency, lease_seconds=args.lease, max_attempts=args.max_attempts,
+              keep_running=args.keep_running, watch_seconds=args.watch))
@@ -4,12 +4,21 @@ Load Federal Agency GenAI Provisioning data from Excel into SQLite database.
 
 This script processes the Excel file containing information about how federal agencies
 are adopting AI internally (staff LLMs, coding assistants, specialized tools).
+
+The workbook is streamed in read-only mode and every sheet is recognized by its
+header row, so any number of staff LLM / specialized AI sheets can be loaded from
+any path. Rows are upserted on their natural key (agency slug, category, tool
+name): unchanged rows keep their ids and timestamps, and only rows that are new,
+changed or gone from the workbook are written, so downstream matching can stay
+incremental.
 """
 
-import openpyxl
+import re
 import sqlite3
-from datetime import datetime
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import metrics
 
 # Paths
 SCRIPT_DIR = Path(__file__).parent
@@ -17,6 +26,42 @@ DATA_DIR = SCRIPT_DIR.parent / 'data'
 DB_PATH = DATA_DIR / 'fedramp.db'
 EXCEL_PATH = Path.home() / 'Downloads' / 'Federal_Agency_GenAI_Provisioning.xlsx'
 
+LLM_NAME_RE = re.compile(r"['\u2018\u2019]([\w\s-]+GPT|[\w\s-]+Chat)[\u2019']")
+SLUG_STRIP_RE = re.compile(r'[^\w\s-]')
+SLUG_SEPARATOR_RE = re.compile(r'[-\s]+')
+HEADER_RE = re.compile(r'\s+')
+
+# Columns that come from the workbook (agency_id and analyzed_at are managed elsewhere)
+USAGE_COLUMNS = (
+    'agency_name', 'agency_category', 'has_staff_llm', 'llm_name', 'has_coding_assistant',
+    'scope', 'solution_type', 'non_public_allowed', 'other_ai_present', 'tool_name',
+    'tool_purpose', 'notes', 'sources', 'slug',
+)
+
+# Sheet layouts: a sheet belongs to the first layout whose marker header it has
+SHEET_LAYOUTS = (
+    ('staff_llm', 'Has staff LLM chatbot?', {
+        'Agency/Department': 'agency_name',
+        'Has staff LLM chatbot?': 'has_staff_llm',
+        'Has AI coding assistant?': 'has_coding_assistant',
+        'Scope': 'scope',
+        'Solution type': 'solution_type',
+        'Non-public info allowed?': 'non_public_allowed',
+        'Other AI (non-chat) present?': 'other_ai_present',
+        'Notes/Comments': 'notes',
+        'Sources': 'sources',
+    }),
+    ('specialized', 'Tool / Capability', {
+        'Agency/Department': 'agency_name',
+        'Tool / Capability': 'tool_name',
+        'Purpose': 'tool_purpose',
+        'Custom or Commercial': 'solution_type',
+        'Scope': 'scope',
+        'Non-public info allowed?': 'non_public_allowed',
+        'Sources': 'sources',
+    }),
+)
+
 def create_tables(conn):
     """Create database tables for agency AI usage data."""
     cursor = conn.cursor()
@@ -43,125 +88,156 @@ def create_tables(conn):
         )
     ''')
 
+    # Natural key; older databases may hold duplicates from repeated full loads
+    cursor.execute('''
+        DELETE FROM agency_ai_usage WHERE id NOT IN (
+            SELECT MIN(id) FROM agency_ai_usage
+            GROUP BY slug, agency_category, COALESCE(tool_name, '')
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_agency_ai_usage_key
+        ON agency_ai_usage(slug, agency_category, COALESCE(tool_name, ''))
+    ''')
+
     conn.commit()
     print("✅ Database tables created")
 
 def generate_slug(agency_name):
     """Generate URL-friendly slug from agency name."""
-    import re
     # Convert to lowercase, replace spaces and special chars with hyphens
-    slug = agency_name.lower()
-    slug = re.sub(r'[^\w\s-]', '', slug)
-    slug = re.sub(r'[-\s]+', '-', slug)
+    slug = SLUG_STRIP_RE.sub('', agency_name.lower())
+    slug = SLUG_SEPARATOR_RE.sub('-', slug)
     return slug.strip('-')
 
-def load_staff_llm_data(conn, wb):
-    """Load staff LLM and coding assistant data."""
-    cursor = conn.cursor()
-    ws = wb['Staff LLMs & Coding']
-
-    # Get headers from first row
-    headers = []
-    for cell in ws[1]:
-        headers.append(cell.value)
-
-    count = 0
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if not any(row):  # Skip empty rows
+def _header_key(value: Any) -> str:
+    """Comparison key for a header cell (the workbook uses a non-breaking hyphen in places)"""
+    return HEADER_RE.sub(' ', str(value or '').replace('\u2011', '-')).strip().lower()
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+def _extract_llm_name(notes: Any) -> Optional[str]:
+    """LLM product name quoted in the notes, e.g. 'NIPRGPT'"""
+    if not isinstance(notes, str) or ('GPT' not in notes and 'Chat' not in notes):
+        return None
+    match = LLM_NAME_RE.search(notes)
+    return match.group(1) if match else None
+
+def _sheet_layout(headers: List[Any]) -> Optional[Tuple[str, Dict[int, str]]]:
+    """(category, column index -> field) for a header row, or None if the sheet isn't recognized"""
+    keys = [_header_key(h) for h in headers]
+    for category, marker, columns in SHEET_LAYOUTS:
+        if _header_key(marker) in keys:
+            wanted = {_header_key(header): field for header, field in columns.items()}
+            return category, {i: wanted[key] for i, key in enumerate(keys) if key in wanted}
+    return None
+
+def read_workbook(path: Path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stream (sheet title, usage row) pairs from every recognized sheet of a workbook"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            layout = _sheet_layout(list(next(rows, ())))
+            if layout is None:
+                print(f"   ⏭️  Skipping sheet '{ws.title}' (unrecognized headers)")
+                continue
+
+            category, columns = layout
+            for row in rows:
+                if not row or not any(row):  # Skip empty rows
+                    continue
+                record = dict.fromkeys(USAGE_COLUMNS)
+                for i, field in columns.items():
+                    if i < len(row):
+                        record[field] = _cell(row[i])
+                if not record['agency_name']:
+                    continue
+                record['agency_name'] = str(record['agency_name'])
+                record['agency_category'] = category
+                record['slug'] = generate_slug(record['agency_name'])
+                record['llm_name'] = _extract_llm_name(record['notes'])
+                yield ws.title, record
+    finally:
+        wb.close()
+
+def _natural_key(record) -> Tuple[str, str, str]:
+    return record['slug'], record['agency_category'], record['tool_name'] or ''
+
+def upsert_workbook(conn: sqlite3.Connection, path: Path) -> Dict[str, Any]:
+    """Upsert every workbook row on its natural key and remove rows no longer in the workbook"""
+    columns = ', '.join(USAGE_COLUMNS)
+    existing: Dict[Tuple[str, str, str], Tuple[int, tuple]] = {}
+    for row in conn.execute(f"SELECT id, {columns} FROM agency_ai_usage"):
+        values = tuple(row[1:])
+        record = dict(zip(USAGE_COLUMNS, values))
+        existing[_natural_key(record)] = (row[0], values)
+
+    upserts: List[tuple] = []
+    stats = {'sheets': {}, 'inserted': [], 'updated': [], 'unchanged': 0, 'deleted': [], 'duplicates': 0}
+    pending: Dict[Tuple[str, str, str], tuple] = {}
+
+    for sheet, record in read_workbook(path):
+        stats['sheets'][sheet] = stats['sheets'].get(sheet, 0) + 1
+        key = _natural_key(record)
+        if key in pending:
+            stats['duplicates'] += 1  # the last occurrence in the workbook wins
+        pending[key] = tuple(record[c] for c in USAGE_COLUMNS)
+
+    for key, values in pending.items():
+        old = existing.get(key)
+        if old is None:
+            stats['inserted'].append(key)
+        elif old[1] != values:
+            stats['updated'].append(key)
+        else:
+            stats['unchanged'] += 1
             continue
-
-        data = dict(zip(headers, row))
-
-        # Extract LLM name from notes if mentioned
-        llm_name = None
-        notes = data.get('Notes/Comments', '')
-        if notes and ('GPT' in notes or 'Chat' in notes):
-            # Try to extract tool name from quotes
-            import re
-            match = re.search(r"['\u2018\u2019]([\w\s-]+GPT|[\w\s-]+Chat)[\u2019']", notes)
-            if match:
-                llm_name = match.group(1)
-
-        cursor.execute('''
-            INSERT INTO agency_ai_usage
-            (agency_name, agency_category, has_staff_llm, llm_name, has_coding_assistant,
-             scope, solution_type, non_public_allowed, other_ai_present, notes, sources, slug)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('Agency/Department'),
-            'staff_llm',
-            data.get('Has staff LLM chatbot?'),
-            llm_name,
-            data.get('Has AI coding assistant?'),
-            data.get('Scope'),
-            data.get('Solution type'),
-            data.get('Non-public info allowed?'),
-            data.get('Other AI (non‑chat) present?'),
-            data.get('Notes/Comments'),
-            data.get('Sources'),
-            generate_slug(data.get('Agency/Department', ''))
-        ))
-        count += 1
-
-    conn.commit()
-    print(f"✅ Loaded {count} staff LLM/coding assistant entries")
-
-def load_specialized_ai_data(conn, wb):
-    """Load specialized AI (non-chat) data."""
-    cursor = conn.cursor()
-    ws = wb['Specialized AI (Non-chat)']
-
-    # Get headers from first row
-    headers = []
-    for cell in ws[1]:
-        headers.append(cell.value)
-
-    count = 0
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        if not any(row):  # Skip empty rows
-            continue
-
-        data = dict(zip(headers, row))
-
-        cursor.execute('''
-            INSERT INTO agency_ai_usage
-            (agency_name, agency_category, tool_name, tool_purpose,
-             solution_type, scope, non_public_allowed, sources, slug)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data.get('Agency/Department'),
-            'specialized',
-            data.get('Tool / Capability'),
-            data.get('Purpose'),
-            data.get('Custom or Commercial'),
-            data.get('Scope'),
-            data.get('Non-public info allowed?'),
-            data.get('Sources'),
-            generate_slug(data.get('Agency/Department', ''))
-        ))
-        count += 1
-
-    conn.commit()
-    print(f"✅ Loaded {count} specialized AI tool entries")
-
-def main():
+        upserts.append(values)
+
+    removed = [(old_id, key) for key, (old_id, _) in existing.items() if key not in pending]
+    stats['deleted'] = [key for _, key in removed]
+
+    assignments = ', '.join(f"{c} = excluded.{c}" for c in USAGE_COLUMNS)
+    with conn:
+        conn.executemany(f'''
+            INSERT INTO agency_ai_usage ({columns})
+            VALUES ({', '.join('?' * len(USAGE_COLUMNS))})
+            ON CONFLICT(slug, agency_category, COALESCE(tool_name, '')) DO UPDATE SET
+                {assignments},
+                analyzed_at = CURRENT_TIMESTAMP
+        ''', upserts)
+        conn.executemany('DELETE FROM agency_ai_usage WHERE id = ?', [(old_id,) for old_id, _ in removed])
+
+    metrics.add('stage_items_processed', sum(stats['sheets'].values()))
+    metrics.record_rows('agency_ai_usage', 'insert', len(stats['inserted']))
+    metrics.record_rows('agency_ai_usage', 'update', len(stats['updated']))
+    metrics.record_rows('agency_ai_usage', 'delete', len(stats['deleted']))
+    return stats
+
+def _describe(key: Tuple[str, str, str]) -> str:
+    slug, category, tool = key
+    return f"{slug} [{category}{': ' + tool if tool else ''}]"
+
+def main(path: Optional[Path] = None):
     """Main execution function."""
+    path = Path(path) if path else EXCEL_PATH
     print("🚀 Loading Federal Agency AI data into database...")
-    print(f"   Excel file: {EXCEL_PATH}")
+    print(f"   Excel file: {path}")
     print(f"   Database: {DB_PATH}")
     print()
 
     # Check if Excel file exists
-    if not EXCEL_PATH.exists():
-        print(f"❌ Excel file not found: {EXCEL_PATH}")
-        print("   Please ensure the file is in your Downloads folder")
+    if not path.exists():
+        print(f"❌ Excel file not found: {path}")
+        print("   Pass --workbook or place the file in your Downloads folder")
         return 1
 
-    # Open Excel file
-    wb = openpyxl.load_workbook(EXCEL_PATH)
-    print(f"📊 Excel sheets found: {wb.sheetnames}")
-    print()
-
     # Connect to database
     conn = sqlite3.connect(DB_PATH)
 
@@ -169,19 +245,27 @@ def main():
     create_tables(conn)
     print()
 
-    # Clear existing data (optional - comment out to keep existing data)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM agency_ai_usage')
-    conn.commit()
-    print("🗑️  Cleared existing agency data")
+    stats = upsert_workbook(conn, path)
+    for sheet, count in stats['sheets'].items():
+        print(f"📊 {sheet}: {count} rows")
+    if stats['duplicates']:
+        print(f"⚠️  {stats['duplicates']} duplicate rows (same agency, category and tool); kept the last")
     print()
 
-    # Load data
-    load_staff_llm_data(conn, wb)
-    load_specialized_ai_data(conn, wb)
+    print("🔄 Changes:")
+    print(f"   Inserted: {len(stats['inserted'])}")
+    print(f"   Updated: {len(stats['updated'])}")
+    print(f"   Deleted: {len(stats['deleted'])}")
+    print(f"   Unchanged: {stats['unchanged']}")
+    for label, keys in (('+', stats['inserted']), ('~', stats['updated']), ('-', stats['deleted'])):
+        for key in keys[:10]:
+            print(f"   {label} {_describe(key)}")
+        if len(keys) > 10:
+            print(f"   {label} ... and {len(keys) - 10} more")
     print()
 
     # Show summary
+    cursor = conn.cursor()
     cursor.execute('SELECT COUNT(*) FROM agency_ai_usage')
     total = cursor.fetchone()[0]
 
@@ -218,4 +302,10 @@ def main():
     return 0
 
 if __name__ == '__main__':
-    exit(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load the agency GenAI provisioning workbook')
+    parser.add_argument('--workbook', type=Path, default=EXCEL_PATH, help='Path to the .xlsx workbook')
+
+    args = parser.parse_args()
+    exit(main(args.workbook))
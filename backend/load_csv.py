@@ -1,15 +1,87 @@
 """
 Load FedRAMP products from CSV into database
+
+The marketplace export has one row per (product, authorizing agency). The file
+is streamed: each product is upserted once, from its first row, and every row
+that names an agency is kept in ``product_agency_authorizations`` (source
+'csv'). Writes go out in large ``executemany`` batches inside a single
+transaction, so memory stays flat however many rows the export has and a
+failed load leaves the previous data in place. Product ids are then reconciled
+against the JSON catalog.
 """
 import csv
 import sys
 from pathlib import Path
-from db import get_connection, initialize_database, insert_product
+from typing import Any, Dict, List, Optional
+
+import metrics
+import tracing
+from db import EXTRACTED_PRODUCT_FIELDS, get_connection, initialize_database
 
 CSV_PATH = Path("/Users/michaelboyce/Downloads/marketplace-20251025-111714.csv")
+CHUNK_SIZE = 5000  # rows per executemany batch
+
+# CSV header -> products column
+PRODUCT_COLUMNS = {
+    'FedRAMP ID': 'fedramp_id',
+    'Cloud Service Provider': 'cloud_service_provider',
+    'Cloud Service Offering': 'cloud_service_offering',
+    'Service Description': 'service_description',
+    'Business Categories': 'business_categories',
+    'Service Model': 'service_model',
+    'Status': 'status',
+    'Independent Assessor': 'independent_assessor',
+    'Authorizations': 'authorizations',
+    'Reuse': 'reuse',
+    'Parent Agency': 'parent_agency',
+    'Sub Agency': 'sub_agency',
+    'ATO Issuance Date': 'ato_issuance_date',
+    'FedRAMP Authorization Date': 'fedramp_authorization_date',
+    'Annual Assessment Date': 'annual_assessment_date',
+    'ATO Expiration Date': 'ato_expiration_date',
+}
+
+_COLUMNS = list(PRODUCT_COLUMNS.values())
+
+def _update_value(column: str) -> str:
+    # A value extracted from the product's page is newer than the export, so it wins over the CSV
+    if column not in EXTRACTED_PRODUCT_FIELDS:
+        return f"excluded.{column}"
+    return (f"COALESCE((SELECT value FROM product_extracted_fields e "
+            f"WHERE e.fedramp_id = excluded.fedramp_id AND e.field = '{column}'), excluded.{column})")
+
+UPSERT_PRODUCT_SQL = f"""
+    INSERT INTO products ({', '.join(_COLUMNS)})
+    VALUES ({', '.join('?' * len(_COLUMNS))})
+    ON CONFLICT(fedramp_id) DO UPDATE SET
+        {', '.join(f'{c} = {_update_value(c)}' for c in _COLUMNS[1:])},
+        updated_at = CURRENT_TIMESTAMP
+"""
+INSERT_AUTHORIZATION_SQL = """
+    INSERT INTO product_agency_authorizations (
+        fedramp_id, agency_name, sub_agency, ato_issuance_date, ato_expiration_date, source
+    ) VALUES (?, ?, ?, ?, ?, 'csv')
+"""
+
+
+def reconcile_with_catalog(csv_ids: set, json_path: Optional[Path] = None) -> Optional[Dict[str, List[str]]]:
+    """Product ids only in the CSV and only in the JSON catalog (None without a catalog)"""
+    from catalog import JSON_PATH, load_catalog
 
-def load_csv_to_database():
-    """Parse CSV and load products into database"""
+    json_path = json_path or JSON_PATH
+    if not json_path.exists():
+        return None
+    catalog_ids = {product.id for product in load_catalog(json_path)}
+    return {
+        'csv_only': sorted(csv_ids - catalog_ids),
+        'catalog_only': sorted(catalog_ids - csv_ids),
+    }
+
+@tracing.traced('load_csv_to_database')
+def load_csv_to_database(csv_path: Optional[Path] = None, json_path: Optional[Path] = None,
+                         chunk_size: int = CHUNK_SIZE) -> Dict[str, Any]:
+    """Parse CSV and load products and their agency authorizations into database"""
+    csv_path = Path(csv_path) if csv_path else CSV_PATH
 
     # Initialize database
     initialize_database()
@@ -17,61 +89,101 @@ def load_csv_to_database():
     # Open connection
     conn = get_connection()
 
-    # Track unique products
+    # Product ids are the only per-product state kept; rows are never buffered beyond a chunk
     seen_ids = set()
     total_rows = 0
-    unique_products = 0
+    products: List[tuple] = []
+    authorizations: List[tuple] = []
+    authorization_rows = 0
+
+    def flush():
+        with tracing.span('load_csv.flush', products=len(products), authorizations=len(authorizations)):
+            conn.executemany(UPSERT_PRODUCT_SQL, products)
+            conn.executemany(INSERT_AUTHORIZATION_SQL, authorizations)
+        products.clear()
+        authorizations.clear()
 
     try:
-        with open(CSV_PATH, 'r', encoding='utf-8') as f:
+        with conn, open(csv_path, 'r', encoding='utf-8', newline='') as f:
             reader = csv.DictReader(f)
 
+            # The CSV is the only writer of 'csv' authorizations; replace them wholesale
+            deleted = conn.execute("DELETE FROM product_agency_authorizations WHERE source = 'csv'").rowcount
+
             for row in reader:
                 total_rows += 1
 
-                fedramp_id = row.get('FedRAMP ID', '').strip()
+                fedramp_id = (row.get('FedRAMP ID') or '').strip()
                 if not fedramp_id:
                     continue
 
-                # Only insert unique FedRAMP IDs (CSV has duplicates for different agencies)
+                # Products are written from their first row only
                 if fedramp_id not in seen_ids:
                     seen_ids.add(fedramp_id)
+                    products.append(tuple(
+                        fedramp_id if column == 'fedramp_id' else row.get(header, '')
+                        for header, column in PRODUCT_COLUMNS.items()
+                    ))
+
+                # Every row carries one agency's authorization
+                agency = (row.get('Parent Agency') or '').strip()
+                if agency:
+                    authorizations.append((
+                        fedramp_id,
+                        agency,
+                        (row.get('Sub Agency') or '').strip() or None,
+                        row.get('ATO Issuance Date') or None,
+                        row.get('ATO Expiration Date') or None,
+                    ))
+                    authorization_rows += 1
+
+                if len(products) + len(authorizations) >= chunk_size:
+                    flush()
+                    print(f"Loaded {total_rows} rows ({len(seen_ids)} products)...")
 
-                    product_data = {
-                        'fedramp_id': fedramp_id,
-                        'cloud_service_provider': row.get('Cloud Service Provider', ''),
-                        'cloud_service_offering': row.get('Cloud Service Offering', ''),
-                        'service_description': row.get('Service Description', ''),
-                        'business_categories': row.get('Business Categories', ''),
-                        'service_model': row.get('Service Model', ''),
-                        'status': row.get('Status', ''),
-                        'independent_assessor': row.get('Independent Assessor', ''),
-                        'authorizations': row.get('Authorizations', ''),
-                        'reuse': row.get('Reuse', ''),
-                        'parent_agency': row.get('Parent Agency', ''),
-                        'sub_agency': row.get('Sub Agency', ''),
-                        'ato_issuance_date': row.get('ATO Issuance Date', ''),
-                        'fedramp_authorization_date': row.get('FedRAMP Authorization Date', ''),
-                        'annual_assessment_date': row.get('Annual Assessment Date', ''),
-                        'ato_expiration_date': row.get('ATO Expiration Date', ''),
-                    }
-
-                    insert_product(conn, product_data)
-                    unique_products += 1
-
-                    if unique_products % 100 == 0:
-                        print(f"Loaded {unique_products} unique products...")
-                        conn.commit()
-
-        conn.commit()
-        print(f"\n✓ Successfully loaded {unique_products} unique products from {total_rows} total rows")
+            flush()
+
+        print(f"\n✓ Successfully loaded {len(seen_ids)} unique products from {total_rows} total rows")
+        print(f"✓ Kept {authorization_rows} agency authorizations")
 
     except Exception as e:
         print(f"Error loading CSV: {e}", file=sys.stderr)
-        conn.rollback()
         raise
     finally:
         conn.close()
 
+    tracing.current_span().set_attributes(rows=total_rows, products=len(seen_ids),
+                                          authorizations=authorization_rows)
+    metrics.add('stage_items_processed', total_rows)
+    metrics.record_rows('products', 'upsert', len(seen_ids))
+    metrics.record_rows('product_agency_authorizations', 'delete', deleted)
+    metrics.record_rows('product_agency_authorizations', 'insert', authorization_rows)
+    with tracing.span('load_csv.reconcile'):
+        reconciliation = reconcile_with_catalog(seen_ids, json_path)
+    if reconciliation is None:
+        print("⚠️  No JSON catalog to reconcile against; run fetch_json.py first")
+    else:
+        for label, ids in (('only in the CSV', reconciliation['csv_only']),
+                           ('only in the JSON catalog', reconciliation['catalog_only'])):
+            if ids:
+                sample = ', '.join(ids[:5]) + (' ...' if len(ids) > 5 else '')
+                print(f"⚠️  {len(ids)} products {label}: {sample}")
+        if not reconciliation['csv_only'] and not reconciliation['catalog_only']:
+            print("✓ CSV and JSON catalog list the same products")
+
+    return {
+        'rows': total_rows,
+        'products': len(seen_ids),
+        'authorizations': authorization_rows,
+        'reconciliation': reconciliation,
+    }
+
 if __name__ == "__main__":
-    load_csv_to_database()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load the FedRAMP marketplace CSV export')
+    parser.add_argument('--csv', type=Path, default=CSV_PATH, help='Path to the marketplace CSV')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per batch insert')
+
+    args = parser.parse_args()
+    load_csv_to_database(csv_path=args.csv, chunk_size=args.chunk_size)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Service → product lookups over the FedRAMP catalog
+
+Answers "which authorized products include service X" for any service, the
+question check_bedrock.py answers for Amazon Bedrock by scanning every service
+list. The index maps each distinct service name to the products listing it and
+is built once per catalog version and pickled next to the catalog cache. A
+query is matched against service names, not products:
+
+- ``substring`` (default): names containing the query, case-insensitively. The
+  rarest trigram of the query picks candidates from a trigram index and only
+  those are checked, so a query touches a handful of names.
+- ``prefix``: names, or names without their vendor prefix ("SageMaker" for
+  "Amazon SageMaker"), starting with the query; a binary search over sorted names.
+- ``exact``: names equal to the query after the service dictionary's
+  normalization (case, spacing, punctuation, trailing "Service"). A vendor in
+  the query must match the name's vendor, if it has one: "SageMaker" finds
+  "Amazon SageMaker", but "Amazon Translate" does not find "Google Translate".
+"""
+import bisect
+import json
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from catalog import CACHE_DIR, JSON_PATH, ProductRecord, catalog_version, load_catalog, read_cache, write_cache
+from services import display_name, split_service_name
+
+INDEX_VERSION = 2  # bump when the index layout changes
+NGRAM = 3
+MODES = ('substring', 'prefix', 'exact')
+
+
+def _grams(text: str) -> set:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class ServiceLookupIndex:
+    """Distinct service names, the products listing each, and trigram/prefix/key lookups over the names"""
+
+    def __init__(self, products: Sequence[ProductRecord]):
+        # (fedramp_id, product, provider, impact_level, status, auth_date) in catalog order
+        self.products = [(p.id, p.cso, p.csp, p.impact_level, p.status, p.auth_date) for p in products]
+
+        listed: Dict[str, set] = {}
+        for position, product in enumerate(products):
+            for service in product.services:
+                listed.setdefault(display_name(service), set()).add(position)
+        self.names = sorted(listed, key=lambda n: (n.lower(), n))
+        self.names_lower = [n.lower() for n in self.names]
+        self.postings = [array('i', sorted(listed[n])) for n in self.names]
+
+        # (vendor, normalized name without the vendor) of every service name
+        split = [split_service_name(name) for name in self.names]
+
+        # Lowercased names and normalized names without the vendor, sorted, for prefix search (name position alongside)
+        self.prefix_keys: List[Tuple[str, int]] = sorted(
+            {(text, i) for i, name in enumerate(self.names_lower)
+             for text in (name, split[i][1]) if text}
+        )
+        self.by_key: Dict[str, List[Tuple[str, int]]] = {}
+        for i, (vendor, key) in enumerate(split):
+            self.by_key.setdefault(key, []).append((vendor, i))
+
+        by_gram: Dict[str, List[int]] = {}
+        for i, name in enumerate(self.names_lower):
+            for gram in _grams(name):
+                by_gram.setdefault(gram, []).append(i)
+        self.by_gram = {gram: array('i', ids) for gram, ids in by_gram.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def match_names(self, query: str, mode: str = 'substring') -> List[int]:
+        """Positions of the service names matching query"""
+        if mode == 'exact':
+            vendor, key = split_service_name(query)
+            return [i for name_vendor, i in self.by_key.get(key, ())
+                    if not vendor or not name_vendor or name_vendor == vendor]
+
+        text = ' '.join(query.lower().split())
+        if not text:
+            return []
+        if mode == 'prefix':
+            found = set()
+            start = bisect.bisect_left(self.prefix_keys, (text, -1))
+            for key, i in self.prefix_keys[start:]:
+                if not key.startswith(text):
+                    break
+                found.add(i)
+            return sorted(found)
+        if mode != 'substring':
+            raise ValueError(f"Unknown lookup mode {mode!r}; expected one of {', '.join(MODES)}")
+
+        grams = _grams(text)
+        if not grams:
+            # Too short for a trigram; the distinct names are few enough to scan
+            return [i for i, name in enumerate(self.names_lower) if text in name]
+        if any(gram not in self.by_gram for gram in grams):
+            return []
+        rarest = min(grams, key=lambda gram: len(self.by_gram[gram]))
+        return [i for i in self.by_gram[rarest] if text in self.names_lower[i]]
+
+    def find(self, query: str, mode: str = 'substring', provider: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Products listing a service matching query, with the matching service names"""
+        matched: Dict[int, List[str]] = {}
+        for i in self.match_names(query, mode):
+            for position in self.postings[i]:
+                matched.setdefault(position, []).append(self.names[i])
+
+        provider_key = provider.lower() if provider else None
+        results = []
+        for position in sorted(matched):
+            fedramp_id, product, csp, impact_level, status, auth_date = self.products[position]
+            if provider_key and provider_key not in csp.lower():
+                continue
+            results.append({
+                'fedramp_id': fedramp_id,
+                'product': product,
+                'provider': csp,
+                'impact_level': impact_level,
+                'status': status,
+                'auth_date': auth_date,
+                'services': matched[position],
+            })
+        return results
+
+
+def _index_cache_path(json_path: Path) -> Path:
+    return CACHE_DIR / f"{json_path.stem}.lookup.pickle"
+
+_loaded: Dict[Tuple[str, str], ServiceLookupIndex] = {}
+
+def load_lookup_index(json_path: Path = JSON_PATH) -> ServiceLookupIndex:
+    """Load the lookup index for the current catalog, building and caching it if needed"""
+    sha256 = catalog_version(json_path)
+    key = (str(json_path), sha256)
+    if key in _loaded:
+        return _loaded[key]
+
+    cache_path = _index_cache_path(json_path)
+    index = read_cache(cache_path, INDEX_VERSION, sha256)
+    if index is None:
+        index = ServiceLookupIndex(load_catalog(json_path))
+        write_cache(cache_path, INDEX_VERSION, sha256, index)
+
+    _loaded.clear()
+    _loaded[key] = index
+    return index
+
+def lookup_services(queries: Iterable[str], mode: str = 'substring', provider: Optional[str] = None,
+                    json_path: Path = JSON_PATH) -> Dict[str, List[Dict[str, Any]]]:
+    """For each query, the products listing a matching service (see ServiceLookupIndex.find)"""
+    if mode not in MODES:
+        raise ValueError(f"Unknown lookup mode {mode!r}; expected one of {', '.join(MODES)}")
+    index = load_lookup_index(json_path)
+    return {query: index.find(query, mode, provider) for query in dict.fromkeys(queries)}
+
+
+def main(queries: List[str], mode: str = 'substring', provider: Optional[str] = None,
+         limit: Optional[int] = 20, as_json: bool = False) -> int:
+    start = time.perf_counter()
+    index = load_lookup_index()
+    loaded = time.perf_counter()
+    results = lookup_services(queries, mode, provider)
+    elapsed = time.perf_counter() - loaded
+
+    if as_json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    for query, products in results.items():
+        services = sorted({s for p in products for s in p['services']})
+        print(f"\n🔎 {query}: {len(products)} products, {len(services)} matching services")
+        for service in services[:limit]:
+            print(f"   • {service}")
+        if limit is not None and len(services) > limit:
+            print(f"   ... and {len(services) - limit} more services")
+        for product in products[:limit]:
+            details = ', '.join(v for v in (product['impact_level'], product['auth_date']) if v)
+            print(f"   {product['fedramp_id']}  {product['provider']} - {product['product']}"
+                  + (f"  [{details}]" if details else ''))
+        if limit is not None and len(products) > limit:
+            print(f"   ... and {len(products) - limit} more products")
+
+    print(f"\n⏱️  {len(results)} queries in {elapsed * 1000:.1f} ms "
+          f"(index of {len(index)} services loaded in {(loaded - start) * 1000:.1f} ms)")
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Which FedRAMP products include a service')
+    parser.add_argument('queries', nargs='*', help='Service names or fragments')
+    parser.add_argument('--file', type=Path, help='Read one query per line from this file')
+    parser.add_argument('--mode', choices=MODES, default='substring')
+    parser.add_argument('--provider', help='Only products whose provider contains this text')
+    parser.add_argument('--limit', type=int, default=20, help='Services and products shown per query')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    queries = list(args.queries)
+    if args.file:
+        queries += [line.strip() for line in args.file.read_text(encoding='utf-8').splitlines() if line.strip()]
+    if not queries:
+        parser.error('give at least one query or --file')
+    exit(main(queries, args.mode, args.provider, args.limit, args.json))
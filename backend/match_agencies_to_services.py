@@ -6,11 +6,21 @@ This script analyzes agency solution types and matches them to FedRAMP products
 based on provider names, keywords, and service descriptions.
 """
 
-import sqlite3
+import hashlib
 import json
+import sqlite3
 import re
+import time
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+
+from agencies import get_authorized_products
+from catalog import ProductRecord
+from db import get_stage_product_hashes, initialize_database, replace_stage_product_hashes
+from product_index import ProductIndex, load_index
+from rule_matcher import RuleSet, load_rules
+import metrics
+import tracing
 
 # Paths
 SCRIPT_DIR = Path(__file__).parent
@@ -18,15 +28,11 @@ DATA_DIR = SCRIPT_DIR.parent / 'data'
 DB_PATH = DATA_DIR / 'fedramp.db'
 JSON_PATH = DATA_DIR / 'fedramp_products.json'
 
-# Matching rules for provider identification
-PROVIDER_MATCHERS = {
-    'Microsoft': ['azure', 'microsoft', 'microsoft 365', 'm365', 'office 365', 'o365', 'copilot'],
-    'Amazon': ['aws', 'amazon', 'govcloud'],
-    'Google': ['google', 'gcp', 'google cloud'],
-    'IBM': ['ibm', 'watson'],
-    'Oracle': ['oracle'],
-    'Salesforce': ['salesforce'],
-}
+# Provider and AI service patterns plus confidence weights
+RULES_PATH = SCRIPT_DIR / 'rules' / 'matching_rules.json'
+
+# pipeline_product_state key for the catalog hashes matching last ran against
+MATCH_STATE_STAGE = 'match'
 
 def create_matching_table(conn):
     """Create table to store agency-to-service matches."""
@@ -42,99 +48,220 @@ def create_matching_table(conn):
             confidence TEXT NOT NULL,  -- 'high', 'medium', 'low'
             match_reason TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP,
             FOREIGN KEY (agency_id) REFERENCES agency_ai_usage(id)
         )
     ''')
 
+    # Databases from before incremental matching: add updated_at and drop duplicate pairs
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(agency_service_matches)')}
+    if 'updated_at' not in columns:
+        cursor.execute('ALTER TABLE agency_service_matches ADD COLUMN updated_at TIMESTAMP')
+    cursor.execute('''
+        DELETE FROM agency_service_matches
+        WHERE id NOT IN (SELECT MIN(id) FROM agency_service_matches GROUP BY agency_id, product_id)
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_agency_service_matches_pair
+        ON agency_service_matches(agency_id, product_id)
+    ''')
+
+    # Hash of each agency's matching inputs as of its last match
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS agency_match_inputs (
+            agency_id INTEGER PRIMARY KEY,
+            input_hash TEXT NOT NULL,
+            matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
     conn.commit()
     print("✅ Matching table created")
 
-def find_provider_in_text(text: str) -> Optional[str]:
-    """Find provider name in text using keyword matching."""
-    if not text:
-        return None
-
-    text_lower = text.lower()
+def find_provider_in_text(text: str, rules: Optional[RuleSet] = None) -> Optional[str]:
+    """Provider mentioned first in text, if any."""
+    providers = (rules or load_rules(RULES_PATH)).names(text, 'providers')
+    return providers[0] if providers else None
 
-    for provider, keywords in PROVIDER_MATCHERS.items():
-        for keyword in keywords:
-            if keyword in text_lower:
-                return provider
+def _agency_search_text(agency_data: dict) -> Optional[str]:
+    """Lowercased text to match on, or None for internally hosted custom tools"""
+    solution_type = agency_data.get('solution_type') or ''
+    notes = agency_data.get('notes') or ''
 
-    return None
+    # Skip if purely custom with no cloud provider mentioned
+    if solution_type and 'custom' in solution_type.lower() and 'hosted' in solution_type.lower():
+        # Check if it mentions being hosted internally (like NASA-GPT)
+        if 'internally hosted' in solution_type.lower() or 'non-cloud' in solution_type.lower():
+            return None
 
-def match_agency_to_products(agency_data: dict, products: List[dict]) -> List[Tuple[dict, str, str]]:
+    # Combine solution_type and notes for analysis
+    return f"{solution_type} {notes}".lower()
+
+class _AgencySignals:
+    """Provider and service mentions found in one agency's text"""
+
+    def __init__(self, search_text: str, rules: RuleSet):
+        self.rules = rules
+        self.provider_mentions: Dict[str, List[str]] = {}
+        self.service_mentions: Dict[str, List[str]] = {}
+        for hit in rules.find_all(search_text):
+            mentions = self.provider_mentions if hit.kind == 'providers' else self.service_mentions
+            mentions.setdefault(hit.name, []).append(search_text[hit.start:hit.end])
+
+    def score(self, provider: str, shared_services: List[str], authorized: bool = False) -> Tuple[str, str]:
+        """(confidence, reason) for a product of ``provider`` offering ``shared_services``"""
+        scoring = self.rules.scoring
+        mentions = self.provider_mentions[provider]
+        score = scoring.get('provider_mention', 1.0) * min(len(mentions), scoring.get('max_provider_mentions', 2))
+        score += scoring.get('service_match', 2.0) * len(shared_services)
+        if authorized:
+            score += scoring.get('authorized_product', 1.0)
+
+        if score >= scoring.get('high', 3.0):
+            confidence = 'high'
+        elif score >= scoring.get('medium', 1.0):
+            confidence = 'medium'
+        else:
+            confidence = 'low'
+
+        if shared_services:
+            names = ', '.join(f"'{name}'" for name in shared_services)
+            reason = f"Direct service match: {names} found in both agency data and product services"
+        else:
+            quoted = ', '.join(f"'{m}'" for m in dict.fromkeys(mentions))
+            reason = f"Provider match: {provider} mentioned in solution type ({quoted})"
+        if authorized:
+            reason += "; already authorized by this agency"
+        return confidence, f"{reason} [score {score:g}]"
+
+def match_agency_to_products(agency_data: dict, index: ProductIndex,
+                             rules: Optional[RuleSet] = None) -> List[Tuple[ProductRecord, str, str]]:
     """
     Match an agency's AI usage to FedRAMP products.
 
+    Every provider the agency mentions contributes its products; each product
+    is scored on how often its provider is mentioned, how many of the
+    agency's AI services it offers and whether the agency has already
+    authorized it (``agency_data['authorized_products']``). Provider-only matches stop at the
+    provider's first government offering. The index must be annotated with
+    the same rules (see load_index).
+
     Returns: List of (product, confidence, reason) tuples
     """
     matches = []
 
-    solution_type = agency_data.get('solution_type', '')
-    notes = agency_data.get('notes', '')
+    search_text = _agency_search_text(agency_data)
+    if search_text is None:
+        return matches
 
-    # Skip if purely custom with no cloud provider mentioned
-    if solution_type and 'custom' in solution_type.lower() and 'hosted' in solution_type.lower():
-        # Check if it mentions being hosted internally (like NASA-GPT)
-        if 'internally hosted' in solution_type.lower() or 'non-cloud' in solution_type.lower():
-            return matches
+    signals = _AgencySignals(search_text, rules or load_rules(RULES_PATH))
+    authorized = agency_data.get('authorized_products') or ()
+    seen = set()
 
-    # Combine solution_type and notes for analysis
-    search_text = f"{solution_type} {notes}".lower()
+    for provider in signals.provider_mentions:
+        # Products from this provider, in catalog order
+        for position in index.provider_positions(provider):
+            if position in seen:
+                continue
+            seen.add(position)
 
-    # Find provider
-    provider_name = find_provider_in_text(search_text)
+            shared = [s for s in signals.service_mentions if position in index.service_rule_positions(s)]
+            product = index.products[position]
+            confidence, reason = signals.score(provider, shared, product.id in authorized)
+            matches.append((product, confidence, reason))
 
-    if not provider_name:
-        return matches
+            # For provider-only matches, stop at the first GovCloud/Government version
+            if not shared and position in index.gov_positions:
+                break
 
-    # Find products from this provider
-    for product in products:
-        product_provider = product.get('csp', '')
-        product_name = product.get('cso', '')
+    return matches
 
-        # Check if provider matches
-        if provider_name.lower() in product_provider.lower():
-            confidence = 'medium'  # Default for provider match
-            reason = f"Provider match: {provider_name} mentioned in solution type"
+def _match_agency_linear(agency_data: dict, products: List[ProductRecord],
+                         rules: Optional[RuleSet] = None) -> List[Tuple[ProductRecord, str, str]]:
+    """Reference implementation scanning every product; used by the benchmark to check the index"""
+    matches = []
 
-            # Check for specific service mentions
-            product_services = product.get('all_others', [])
+    search_text = _agency_search_text(agency_data)
+    if search_text is None:
+        return matches
 
-            # Look for specific AI services in the search text
-            ai_keywords = ['openai', 'gpt', 'bedrock', 'sagemaker', 'copilot', 'vertex']
+    rules = rules or load_rules(RULES_PATH)
+    signals = _AgencySignals(search_text, rules)
+    authorized = agency_data.get('authorized_products') or ()
+    seen = set()
 
-            for keyword in ai_keywords:
-                if keyword in search_text:
-                    # Check if this product has services matching the keyword
-                    for service in product_services:
-                        if keyword in service.lower():
-                            confidence = 'high'
-                            reason = f"Direct service match: '{keyword}' found in both agency data and product services"
-                            break
+    for provider in signals.provider_mentions:
+        for product in products:
+            if provider.lower() not in product.csp.lower() or product.id in seen:
+                continue
+            seen.add(product.id)
 
-            # Add match
+            offered = {name for service in product.services for name in rules.names(service, 'services')}
+            shared = [s for s in signals.service_mentions if s in offered]
+            confidence, reason = signals.score(provider, shared, product.id in authorized)
             matches.append((product, confidence, reason))
 
-            # For provider-only matches, only return the main/gov products
-            if confidence == 'medium':
-                # Prioritize GovCloud/Government versions
-                if 'gov' in product_name.lower():
-                    break  # Use this one
+            if not shared and 'gov' in product.cso.lower():
+                break
 
     return matches
 
-def run_matching(conn):
-    """Run the matching algorithm for all agencies."""
+def _agency_input_hash(agency: dict, rules: RuleSet) -> str:
+    """Everything an agency's matches depend on besides the catalog"""
+    payload = json.dumps([agency['solution_type'], agency['notes'], rules.fingerprint,
+                          sorted(agency.get('authorized_products') or ())])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _dirty_agencies(conn, agencies: List[dict], index: ProductIndex, rules: RuleSet,
+                    full: bool = False) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Agencies whose matches may have changed, plus the current product hashes
+
+    An agency is rematched when its own inputs (or the rules) changed, when
+    one of its matched products changed or left the catalog, or when a
+    changed product belongs to a provider it mentions.
+    """
+    current = {p.id: p.content_hash for p in index.products}
+    previous = get_stage_product_hashes(conn, MATCH_STATE_STAGE)
+    changed_ids = {pid for pid, h in current.items() if previous.get(pid) != h} | (previous.keys() - current.keys())
+    changed_csps = {p.csp.lower() for p in index.products if p.id in changed_ids}
+
+    input_hashes = dict(conn.execute('SELECT agency_id, input_hash FROM agency_match_inputs'))
+    matched = {}
+    for agency_id, product_id in conn.execute('SELECT agency_id, product_id FROM agency_service_matches'):
+        matched.setdefault(agency_id, set()).add(product_id)
+
+    dirty = []
+    for agency in agencies:
+        agency['input_hash'] = _agency_input_hash(agency, rules)
+        if (full or input_hashes.get(agency['id']) != agency['input_hash']
+                or matched.get(agency['id'], set()) & changed_ids):
+            dirty.append(agency)
+            continue
+        search_text = _agency_search_text(agency)
+        if search_text and changed_csps:
+            providers = [p.lower() for p in rules.names(search_text, 'providers')]
+            if any(provider in csp for provider in providers for csp in changed_csps):
+                dirty.append(agency)
+
+    return dirty, current
+
+@tracing.traced('run_matching')
+def run_matching(conn, full: bool = False):
+    """
+    Rematch agencies whose inputs changed and apply only the differences.
+
+    New matches are inserted, changed ones updated in place (keeping their id
+    and created_at), and vanished ones deleted, all in one transaction.
+    """
     cursor = conn.cursor()
 
-    # Load FedRAMP products
-    with open(JSON_PATH, 'r') as f:
-        data = json.load(f)
-        products = data['data']['Products']
+    # Load the matching rules and the FedRAMP product index (cached per catalog and rules version)
+    rules = load_rules(RULES_PATH)
+    index = load_index(JSON_PATH, rules)
 
-    print(f"📊 Loaded {len(products)} FedRAMP products")
+    print(f"📏 Matching rules v{rules.version}")
+    print(f"📊 Loaded {len(index)} FedRAMP products")
 
     # Get all agencies
     cursor.execute('''
@@ -153,48 +280,87 @@ def run_matching(conn):
             'notes': row[4]
         })
 
-    print(f"🏛️  Processing {len(agencies)} agencies")
-    print()
-
-    # Clear existing matches
-    cursor.execute('DELETE FROM agency_service_matches')
-    conn.commit()
+    # Products each agency has already authorized, via the canonical agency index (agencies.py)
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(agency_ai_usage)')}
+    if 'agency_id' in columns:
+        canonical = dict(cursor.execute('SELECT id, agency_id FROM agency_ai_usage').fetchall())
+        authorized = get_authorized_products(conn, sorted({a for a in canonical.values() if a is not None}))
+        for agency in agencies:
+            agency['authorized_products'] = authorized.get(canonical.get(agency['id']), set())
 
-    total_matches = 0
-    agencies_with_matches = 0
+    dirty, product_hashes = _dirty_agencies(conn, agencies, index, rules, full=full)
+    print(f"🏛️  Processing {len(agencies)} agencies ({len(dirty)} with changed inputs)")
+    print()
 
-    for agency in agencies:
-        matches = match_agency_to_products(agency, products)
+    # New match set for the agencies being rematched
+    new_rows = {}
+    for agency in dirty:
+        with tracing.span('match.agency', agency_id=agency['id']) as span:
+            matches = match_agency_to_products(agency, index, rules)
+            span.set('matches', len(matches))
 
         if matches:
-            agencies_with_matches += 1
             print(f"✓ {agency['agency_name']}")
 
-            for product, confidence, reason in matches:
-                cursor.execute('''
-                    INSERT INTO agency_service_matches
-                    (agency_id, product_id, provider_name, product_name, confidence, match_reason)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    agency['id'],
-                    product['id'],
-                    product['csp'],
-                    product['cso'],
-                    confidence,
-                    reason
-                ))
-                total_matches += 1
-
-                # Show match details
-                print(f"  → {product['csp']} - {product['cso']} ({confidence} confidence)")
-
-    conn.commit()
+        for product, confidence, reason in matches:
+            new_rows[(agency['id'], product.id)] = (product.csp, product.cso, confidence, reason)
+
+            # Show match details
+            print(f"  → {product.csp} - {product.cso} ({confidence} confidence)")
+
+    # Diff against what is stored for those agencies, plus agencies that no longer exist
+    dirty_ids = {agency['id'] for agency in dirty}
+    current_ids = {agency['id'] for agency in agencies}
+    old_rows = {}
+    for agency_id, product_id, provider, product_name, confidence, reason in cursor.execute('''
+        SELECT agency_id, product_id, provider_name, product_name, confidence, match_reason
+        FROM agency_service_matches
+    '''):
+        if agency_id in dirty_ids or agency_id not in current_ids:
+            old_rows[(agency_id, product_id)] = (provider, product_name, confidence, reason)
+
+    inserts = [key + new_rows[key] for key in new_rows.keys() - old_rows.keys()]
+    updates = [key + row for key, row in new_rows.items() if key in old_rows and old_rows[key] != row]
+    deletes = list(old_rows.keys() - new_rows.keys())
+    stale_ids = [(agency_id,) for (agency_id,) in cursor.execute('SELECT agency_id FROM agency_match_inputs')
+                 if agency_id not in current_ids]
+
+    with conn:
+        conn.executemany('''
+            INSERT INTO agency_service_matches
+            (agency_id, product_id, provider_name, product_name, confidence, match_reason)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', inserts)
+        conn.executemany('''
+            UPDATE agency_service_matches
+            SET provider_name = ?, product_name = ?, confidence = ?, match_reason = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE agency_id = ? AND product_id = ?
+        ''', [row[2:] + row[:2] for row in updates])
+        conn.executemany(
+            'DELETE FROM agency_service_matches WHERE agency_id = ? AND product_id = ?', deletes
+        )
+        conn.executemany('''
+            INSERT INTO agency_match_inputs (agency_id, input_hash, matched_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(agency_id) DO UPDATE SET
+                input_hash = excluded.input_hash,
+                matched_at = excluded.matched_at
+        ''', [(agency['id'], agency['input_hash']) for agency in dirty])
+        conn.executemany('DELETE FROM agency_match_inputs WHERE agency_id = ?', stale_ids)
+        replace_stage_product_hashes(conn, MATCH_STATE_STAGE, product_hashes)
+
+    total_matches = cursor.execute('SELECT COUNT(*) FROM agency_service_matches').fetchone()[0]
+    agencies_with_matches = cursor.execute(
+        'SELECT COUNT(DISTINCT agency_id) FROM agency_service_matches'
+    ).fetchone()[0]
 
     print()
     print("📈 Matching Results:")
-    print(f"   Agencies processed: {len(agencies)}")
+    print(f"   Agencies processed: {len(agencies)} ({len(dirty)} rematched)")
     print(f"   Agencies with matches: {agencies_with_matches}")
     print(f"   Total matches found: {total_matches}")
+    print(f"   Changes: {len(inserts)} inserted, {len(updates)} updated, {len(deletes)} deleted")
 
     # Show confidence breakdown
     for conf_level in ['high', 'medium', 'low']:
@@ -202,21 +368,106 @@ def run_matching(conn):
         count = cursor.fetchone()[0]
         print(f"   {conf_level.capitalize()} confidence: {count}")
 
-def main():
+    metrics.add('stage_items_processed', len(dirty))
+    metrics.record_rows('agency_service_matches', 'insert', len(inserts))
+    metrics.record_rows('agency_service_matches', 'update', len(updates))
+    metrics.record_rows('agency_service_matches', 'delete', len(deletes))
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes), 'rematched': len(dirty)}
+
+# Agency entries used by the benchmark when the database has none
+SAMPLE_AGENCIES = [
+    {'solution_type': 'Commercial (Microsoft Copilot / Azure OpenAI)', 'notes': 'GPT-4 via Azure Government'},
+    {'solution_type': 'Commercial (AWS Bedrock)', 'notes': 'Claude models in GovCloud'},
+    {'solution_type': 'Google Gemini', 'notes': 'Vertex AI pilot'},
+    {'solution_type': 'Custom (internally hosted)', 'notes': 'Open-weight models on premises'},
+    {'solution_type': 'Salesforce Einstein', 'notes': None},
+    {'solution_type': 'IBM watsonx', 'notes': 'Assistant for HR questions'},
+]
+
+def _scaled_products(products: List[ProductRecord], scale: int) -> List[ProductRecord]:
+    """The catalog plus (scale - 1) copies from made-up providers"""
+    scaled = list(products)
+    for copy in range(1, scale):
+        for product in products:
+            state = list(product.__getstate__())
+            state[0] = f"{product.id}-{copy}"                      # id
+            state[1] = f"Vendor {len(scaled)} LLC"                  # csp
+            record = ProductRecord.__new__(ProductRecord)
+            record.__setstate__(tuple(state))
+            scaled.append(record)
+    return scaled
+
+def _load_benchmark_agencies() -> List[dict]:
+    if DB_PATH.exists():
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            rows = conn.execute('''
+                SELECT id, agency_name, solution_type, notes FROM agency_ai_usage
+                WHERE agency_category = 'staff_llm'
+            ''').fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        conn.close()
+        if rows:
+            return [{'id': r[0], 'agency_name': r[1], 'solution_type': r[2], 'notes': r[3]} for r in rows]
+    return [dict(a, id=i, agency_name=f"Agency {i}") for i, a in enumerate(SAMPLE_AGENCIES)]
+
+def benchmark(scale: int = 100, baseline_sample: int = 50):
+    """
+    Time index-based matching with the catalog and agency list at 1x and ``scale``x
+
+    The linear scan is timed on a sample of agencies for comparison, and both
+    implementations must return the same matches.
+    """
+    rules = load_rules(RULES_PATH)
+    products = load_index(JSON_PATH, rules).products
+    agencies = _load_benchmark_agencies()
+
+    print(f"📊 Benchmark: {len(agencies)} agencies x {len(products)} products, scaled up to {scale}x")
+    print(f"{'scale':>6} {'agencies':>9} {'products':>9} {'build s':>8} {'index µs/agency':>16} {'scan µs/agency':>15}")
+
+    for factor in sorted({1, scale}):
+        scaled_products = _scaled_products(products, factor)
+        scaled_agencies = agencies * factor
+
+        start = time.perf_counter()
+        index = ProductIndex(scaled_products)
+        index.annotate(rules)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = [match_agency_to_products(agency, index, rules) for agency in scaled_agencies]
+        index_us = (time.perf_counter() - start) / len(scaled_agencies) * 1e6
+
+        sample = scaled_agencies[:baseline_sample]
+        start = time.perf_counter()
+        scanned = [_match_agency_linear(agency, scaled_products, rules) for agency in sample]
+        scan_us = (time.perf_counter() - start) / len(sample) * 1e6
+
+        def ids(results):
+            return [[(p.id, c, r) for p, c, r in matches] for matches in results]
+        if ids(indexed[:len(sample)]) != ids(scanned):
+            raise AssertionError(f"Index and linear scan disagree at {factor}x")
+
+        print(f"{factor:>6} {len(scaled_agencies):>9} {len(scaled_products):>9} {build_s:>8.2f} {index_us:>16.1f} {scan_us:>15.1f}")
+
+def main(full: bool = False):
     """Main execution function."""
     print("🔗 Smart Matching: Agency AI Usage → FedRAMP Services")
     print("=" * 60)
     print()
 
-    # Connect to database
+    # Connect to database (the core schema holds the catalog hashes matching last saw)
+    initialize_database()
     conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
 
     # Create matching table
     create_matching_table(conn)
     print()
 
     # Run matching
-    run_matching(conn)
+    run_matching(conn, full=full)
     print()
 
     # Show some examples
@@ -246,4 +497,16 @@ def main():
     return 0
 
 if __name__ == '__main__':
-    exit(main())
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Match agency AI usage to FedRAMP products')
+    parser.add_argument('--bench', action='store_true', help='Benchmark matching instead of writing matches')
+    parser.add_argument('--scale', type=int, default=100, help='Catalog and agency multiplier for --bench')
+    parser.add_argument('--full', action='store_true', help='Rematch every agency, changed or not')
+
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(scale=args.scale)
+        exit(0)
+    exit(main(full=args.full))
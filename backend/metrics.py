@@ -0,0 +1,255 @@
+"""
+Prometheus textfile-collector metrics for pipeline runs
+
+Every stage (and, with ``fedai --metrics``, every CLI command) runs inside
+``metrics.collect(stage)``. Code inside the block reports what it did with
+``metrics.add``/``metrics.set_gauge`` (items processed, rows written, errors by
+class, LLM tokens, scrape outcomes); when the block ends the values are
+written to ``<dir>/fedai_<stage>.prom`` together with the stage's duration and
+outcome, and ``fedai_data.prom`` is refreshed with database size and the
+freshness of the catalog, analysis and matches. Point node_exporter's
+``--collector.textfile.directory`` at the directory.
+
+Values describe the last run of a stage, so they are all gauges; Prometheus
+keeps the history. Files are replaced atomically so a scrape never sees half
+a file. Outside a ``collect`` block ``add``/``set_gauge`` do nothing.
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import db
+
+METRICS_DIR = Path(__file__).parent.parent / "data" / "metrics"
+PREFIX = 'fedai'
+
+# Claude Haiku 4.5 list prices, USD per million tokens
+LLM_PRICE_PER_MTOK = {'input': 1.00, 'output': 5.00}
+
+# name -> help text; every stage metric also carries a ``stage`` label
+HELP = {
+    'stage_duration_seconds': 'Wall time of the last run of the stage',
+    'stage_success': '1 if the last run of the stage succeeded, 0 if it failed',
+    'stage_last_run_timestamp_seconds': 'When the last run of the stage finished',
+    'stage_items_processed': 'Items (products, rows, pages, agencies) handled by the last run',
+    'stage_errors': 'Errors in the last run, by exception or failure class',
+    'rows_written': 'Database rows written by the last run, by table and operation',
+    'llm_requests': 'Claude requests made by the last run',
+    'llm_tokens': 'Claude tokens used by the last run, by direction',
+    'llm_cost_dollars': 'Estimated Claude cost of the last run at list prices',
+    'scrape_pages': 'Product pages fetched by the last run, by result',
+    'scrape_success_ratio': 'Share of product pages fetched successfully in the last run',
+    'db_size_bytes': 'Size of the SQLite database including its write-ahead log',
+    'data_timestamp_seconds': 'When each dataset last changed',
+    'stage_last_success_timestamp_seconds': 'When each pipeline stage last succeeded',
+    'products': 'Products in the database, by scrape state',
+    'queue_leases_reclaimed': 'Analysis jobs taken back from workers whose lease expired',
+}
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class StageMetrics:
+    """Metric values gathered while one stage runs"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.values: Dict[Key, float] = {}
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def add(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    def fail(self, error_class: str):
+        """Mark the run as failed, counting the cause"""
+        self.failed = True
+        self.add('stage_errors', error_class=error_class)
+
+    def get(self, name: str, **labels) -> float:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        return self.values.get(key, 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            return [(name, {'stage': self.stage, **dict(labels)}, value)
+                    for (name, labels), value in self.values.items()]
+
+
+_current: contextvars.ContextVar[Optional[StageMetrics]] = contextvars.ContextVar('fedai_metrics', default=None)
+
+
+def add(name: str, value: float = 1, **labels):
+    """Add to a metric of the running stage"""
+    collector = _current.get()
+    if collector is not None:
+        collector.add(name, value, **labels)
+
+def set_gauge(name: str, value: float, **labels):
+    """Set a metric of the running stage"""
+    collector = _current.get()
+    if collector is not None:
+        collector.set(name, value, **labels)
+
+def record_llm_usage(input_tokens: int, output_tokens: int):
+    """Count one Claude request and its tokens and cost"""
+    collector = _current.get()
+    if collector is None:
+        return
+    collector.add('llm_requests')
+    collector.add('llm_tokens', input_tokens, direction='input')
+    collector.add('llm_tokens', output_tokens, direction='output')
+    collector.add('llm_cost_dollars', (input_tokens * LLM_PRICE_PER_MTOK['input']
+                                       + output_tokens * LLM_PRICE_PER_MTOK['output']) / 1e6)
+
+def record_rows(table: str, operation: str, count: int):
+    if count:
+        add('rows_written', count, table=table, operation=operation)
+
+
+# ---------------------------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(round(float(value), 9))
+
+def render(samples: List[Tuple[str, Dict[str, str], float]]) -> str:
+    """Samples in the Prometheus text exposition format, grouped by metric"""
+    by_name: Dict[str, list] = {}
+    for name, labels, value in samples:
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        full_name = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {full_name} gauge")
+        for labels, value in sorted(by_name[name], key=lambda s: sorted(s[0].items())):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+            lines.append(f"{full_name}{{{label_text}}} {_format_value(value)}" if label_text
+                         else f"{full_name} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+def write_textfile(path: Path, samples: List[Tuple[str, Dict[str, str], float]]) -> Path:
+    """Write samples to path atomically (the collector ignores files being written)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(render(samples), encoding='utf-8')
+    os.replace(tmp_path, path)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Database size and data freshness
+# ---------------------------------------------------------------------------
+
+def _epoch(timestamp: Optional[str]) -> Optional[float]:
+    """SQLite CURRENT_TIMESTAMP / ISO text (UTC unless it says otherwise) as Unix seconds"""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+FRESHNESS_QUERIES = {
+    'analysis': ('product_ai_analysis_runs', "SELECT MAX(analyzed_at) FROM product_ai_analysis_runs"),
+    'matches': ('agency_service_matches',
+                "SELECT MAX(COALESCE(updated_at, created_at)) FROM agency_service_matches"),
+    'agency_usage': ('agency_ai_usage', "SELECT MAX(analyzed_at) FROM agency_ai_usage"),
+    'scrape': ('scrape_tier_stats', "SELECT MAX(run_started_at) FROM scrape_tier_stats"),
+}
+
+def data_samples(db_path: Optional[Path] = None) -> List[Tuple[str, Dict[str, str], float]]:
+    """Database size, dataset freshness, last stage successes and scrape coverage"""
+    from fetch_json import OUTPUT_FILE as CATALOG_PATH
+
+    db_path = Path(db_path or db.DB_PATH)
+    samples = []
+    if CATALOG_PATH.exists():
+        samples.append(('data_timestamp_seconds', {'dataset': 'catalog'}, CATALOG_PATH.stat().st_mtime))
+    if not db_path.exists():
+        return samples
+
+    size = sum(p.stat().st_size for p in (db_path, Path(f"{db_path}-wal")) if p.exists())
+    samples.append(('db_size_bytes', {}, size))
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        for dataset, (table, query) in FRESHNESS_QUERIES.items():
+            if db.table_exists(conn, table):
+                seconds = _epoch(conn.execute(query).fetchone()[0])
+                if seconds is not None:
+                    samples.append(('data_timestamp_seconds', {'dataset': dataset}, seconds))
+
+        if db.table_exists(conn, 'pipeline_stage_runs'):
+            for row in conn.execute("""
+                SELECT stage, MAX(finished_at) AS finished_at FROM pipeline_stage_runs
+                WHERE status = 'success' GROUP BY stage
+            """):
+                seconds = _epoch(row['finished_at'])
+                if seconds is not None:
+                    samples.append(('stage_last_success_timestamp_seconds', {'stage': row['stage']}, seconds))
+
+        if db.table_exists(conn, 'products'):
+            scrape = db.get_scrape_stats(conn)
+            for state in ('total', 'scraped', 'pending', 'backing_off'):
+                samples.append(('products', {'state': state}, scrape[state]))
+    except sqlite3.Error as e:
+        print(f"⚠️  Could not read freshness metrics: {e}")
+    finally:
+        conn.close()
+    return samples
+
+
+@contextmanager
+def collect(stage: str, metrics_dir: Optional[Path] = None) -> Iterator[StageMetrics]:
+    """
+    Gather metrics for a stage and write its textfile when the block exits
+
+    The block's exception, if any, fails the run, is counted under its class
+    and is re-raised.
+    Pass ``metrics_dir=None`` to use data/metrics/.
+    """
+    metrics_dir = Path(metrics_dir or METRICS_DIR)
+    collector = StageMetrics(stage)
+    token = _current.set(collector)
+    start = time.perf_counter()
+    try:
+        yield collector
+    except BaseException as e:
+        collector.fail(type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        collector.set('stage_duration_seconds', round(time.perf_counter() - start, 6))
+        collector.set('stage_success', int(not collector.failed))
+        collector.set('stage_last_run_timestamp_seconds', round(time.time(), 3))
+        try:
+            write_textfile(metrics_dir / f"{PREFIX}_{stage}.prom", collector.samples())
+            write_textfile(metrics_dir / f"{PREFIX}_data.prom", data_samples())
+        except OSError as e:
+            print(f"⚠️  Could not write metrics to {metrics_dir}: {e}")
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Incremental pipeline orchestrator.
+
+Models the backend scripts as a dependency graph of stages:
+
+    fetch ──┬──> analyze ──> similarity <── load_agency
+            ├──> match <── agencies <── load_agency, load_csv, extract
+            └──> services <── analyze, extract
+    load_csv
+    extract   (scraped pages -> product fields; incremental on page content hash)
+
+Each stage is fingerprinted from the contents of its input files, any other
+state it reads (such as the set of stored page snapshots) and the fingerprints
+of the stages it depends on. Stages whose fingerprint matches the
+last successful run are skipped, independent stages run in parallel, and
+per-product stages only receive the products whose content changed since they
+last ran. Every stage that runs writes a Prometheus textfile (see metrics.py).
+"""
+
+import hashlib
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from db import (
+    get_connection, initialize_database, get_last_stage_fingerprint, record_stage_run,
+    get_stage_product_hashes, replace_stage_product_hashes
+)
+import metrics
+import tracing
+from catalog import load_catalog
+from fetch_json import OUTPUT_FILE as CATALOG_PATH, file_sha256
+
+MISSING = 'missing'
+
+
+@dataclass
+class StageContext:
+    """What a stage gets to see when it runs"""
+    fingerprint: str
+    changed_products: Set[str] = field(default_factory=set)
+    removed_products: Set[str] = field(default_factory=set)
+    failed_products: Set[str] = field(default_factory=set)  # set by per-product stages; retried next run
+    options: Dict = field(default_factory=dict)
+
+
+@dataclass
+class Stage:
+    """A node in the pipeline graph"""
+    name: str
+    run: Callable[[StageContext], None]
+    inputs: Callable[[], List[Path]] = lambda: []
+    outputs: Callable[[], List[Path]] = lambda: []
+    state: Callable[[], Any] = lambda: None  # inputs that are not files (e.g. database contents), JSON-able
+    depends_on: Tuple[str, ...] = ()
+    per_product: bool = False
+    always_run: bool = False
+
+
+# ---------------------------------------------------------------------------
+# Stage implementations (heavy modules are imported only when a stage runs)
+# ---------------------------------------------------------------------------
+
+def _run_fetch(ctx: StageContext):
+    from fetch_json import fetch_and_save_json
+    fetch_and_save_json()
+
+def _run_load_csv(ctx: StageContext):
+    from load_csv import load_csv_to_database
+    load_csv_to_database()
+
+def _run_analyze(ctx: StageContext):
+    from analyze_ai_services import analyze_all_products
+    from db import delete_ai_analysis_for_products
+
+    if ctx.removed_products:
+        conn = get_connection()
+        delete_ai_analysis_for_products(conn, sorted(ctx.removed_products))
+        conn.commit()
+        conn.close()
+        print(f"🗑️  Removed analysis for {len(ctx.removed_products)} products no longer in the catalog")
+
+    if ctx.changed_products:
+        ctx.failed_products = analyze_all_products(
+            max_workers=ctx.options.get('analyze_workers', 10),
+            product_ids=ctx.changed_products
+        )
+
+def _run_load_agency(ctx: StageContext):
+    import load_agency_data
+    if load_agency_data.main() != 0:
+        raise RuntimeError("Agency data load failed")
+
+def _run_agencies(ctx: StageContext):
+    import agencies
+    if agencies.main() != 0:
+        raise RuntimeError("Agency index build failed")
+
+def _run_services(ctx: StageContext):
+    import services
+    if services.main() != 0:
+        raise RuntimeError("Service dictionary build failed")
+
+def _run_match(ctx: StageContext):
+    import match_agencies_to_services
+    if match_agencies_to_services.main() != 0:
+        raise RuntimeError("Agency matching failed")
+
+def _run_similarity(ctx: StageContext):
+    import similarity
+    if similarity.main() != 0:
+        raise RuntimeError("Similarity scoring failed")
+
+def _run_extract(ctx: StageContext):
+    from extract_pages import extract_all_pages
+    extract_all_pages()
+
+def _csv_path() -> List[Path]:
+    from load_csv import CSV_PATH
+    return [CSV_PATH]
+
+def _workbook_path() -> List[Path]:
+    from load_agency_data import EXCEL_PATH
+    return [EXCEL_PATH]
+
+def _agency_seed_path() -> List[Path]:
+    from agencies import SEED_PATH
+    return [SEED_PATH]
+
+def _service_seed_path() -> List[Path]:
+    from services import SEED_PATH
+    return [SEED_PATH]
+
+def _extract_state() -> str:
+    from extract_pages import extraction_inputs
+    conn = get_connection()
+    try:
+        return extraction_inputs(conn)
+    finally:
+        conn.close()
+
+
+STAGES: Dict[str, Stage] = {
+    stage.name: stage for stage in [
+        Stage('fetch', _run_fetch, outputs=lambda: [CATALOG_PATH], always_run=True),
+        Stage('load_csv', _run_load_csv, inputs=_csv_path),
+        Stage('analyze', _run_analyze, depends_on=('fetch',), per_product=True),
+        Stage('load_agency', _run_load_agency, inputs=_workbook_path),
+        Stage('agencies', _run_agencies, inputs=_agency_seed_path, depends_on=('fetch', 'load_csv', 'load_agency', 'extract')),
+        Stage('services', _run_services, inputs=_service_seed_path, depends_on=('fetch', 'analyze', 'extract')),
+        Stage('match', _run_match, depends_on=('fetch', 'load_agency', 'agencies')),
+        Stage('similarity', _run_similarity, depends_on=('fetch', 'analyze', 'load_agency')),
+        Stage('extract', _run_extract, state=_extract_state),
+    ]
+}
+
+
+# ---------------------------------------------------------------------------
+# Fingerprinting
+# ---------------------------------------------------------------------------
+
+def _files_fingerprint(paths: List[Path]) -> List[str]:
+    return [file_sha256(p) if p.exists() else MISSING for p in paths]
+
+def _digest(parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+def product_content_hashes(path: Path = CATALOG_PATH) -> Dict[str, str]:
+    """Content hash of every product in the catalog so changed products can be detected"""
+    return {product.id: product.content_hash for product in load_catalog(path)}
+
+
+class Pipeline:
+    """Runs stages in dependency order, skipping the ones with unchanged inputs"""
+
+    def __init__(self, stages: Dict[str, Stage] = STAGES, force: Set[str] = frozenset(),
+                 skip: Set[str] = frozenset(), max_parallel: int = 3, dry_run: bool = False,
+                 options: Optional[Dict] = None, profile: Set[str] = frozenset(),
+                 profile_dir: Path = tracing.PROFILE_DIR, metrics_dir: Path = metrics.METRICS_DIR):
+        self.stages = stages
+        self.force = set(force)
+        self.skip = set(skip)
+        self.max_parallel = max_parallel
+        self.dry_run = dry_run
+        self.options = options or {}
+        self.profile = set(profile)
+        self.profile_dir = profile_dir
+        self.metrics_dir = metrics_dir
+        self.output_fingerprints: Dict[str, str] = {}
+        self.results: Dict[str, str] = {}
+        self._product_hashes: Optional[Dict[str, str]] = None
+        self._hash_lock = threading.Lock()
+
+    def _catalog_hashes(self) -> Dict[str, str]:
+        # Computed once per run and shared by every per-product stage
+        with self._hash_lock:
+            if self._product_hashes is None:
+                self._product_hashes = product_content_hashes(CATALOG_PATH) if CATALOG_PATH.exists() else {}
+            return self._product_hashes
+
+    def _input_fingerprint(self, stage: Stage) -> Tuple[str, bool]:
+        """Return (fingerprint, inputs_present) for a stage"""
+        files = _files_fingerprint(stage.inputs())
+        deps = [self.output_fingerprints.get(dep, MISSING) for dep in stage.depends_on]
+        present = MISSING not in files
+        parts = {'stage': stage.name, 'files': files, 'deps': deps}
+        state = stage.state()
+        if state is not None:
+            parts['state'] = state
+        return _digest(parts), present
+
+    def _run_stage(self, stage: Stage) -> str:
+        with tracing.span('pipeline.stage', stage=stage.name) as span:
+            result = self._run_stage_inner(stage)
+            span.set('result', result)
+            return result
+
+    def _run_stage_inner(self, stage: Stage) -> str:
+        started_at = datetime.now(timezone.utc).isoformat()
+        fingerprint, present = self._input_fingerprint(stage)
+
+        conn = get_connection()
+        try:
+            last = get_last_stage_fingerprint(conn, stage.name)
+
+            if stage.name in self.skip or not present:
+                reason = 'skipped by request' if stage.name in self.skip else 'input file missing'
+                print(f"⏭️  [{stage.name}] {reason}")
+                if stage.outputs():
+                    last = _digest({'stage': stage.name, 'files': _files_fingerprint(stage.outputs())})
+                self.output_fingerprints[stage.name] = last or MISSING
+                return 'skipped'
+
+            if not stage.always_run and stage.name not in self.force and fingerprint == last:
+                print(f"✓ [{stage.name}] inputs unchanged, skipping")
+                self.output_fingerprints[stage.name] = fingerprint
+                return 'unchanged'
+
+            ctx = StageContext(fingerprint=fingerprint, options=self.options)
+            current_hashes: Dict[str, str] = {}
+            if stage.per_product:
+                current_hashes = self._catalog_hashes()
+                previous = {} if stage.name in self.force else get_stage_product_hashes(conn, stage.name)
+                ctx.changed_products = {pid for pid, h in current_hashes.items() if previous.get(pid) != h}
+                ctx.removed_products = set(previous) - set(current_hashes)
+                print(f"🔎 [{stage.name}] {len(ctx.changed_products)} changed, "
+                      f"{len(ctx.removed_products)} removed products")
+
+            if self.dry_run:
+                print(f"🧪 [{stage.name}] would run")
+                self.output_fingerprints[stage.name] = fingerprint
+                return 'would_run'
+
+            print(f"🚀 [{stage.name}] running")
+            try:
+                with metrics.collect(stage.name, self.metrics_dir) as collected:
+                    if stage.name in self.profile:
+                        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+                        with tracing.profile(self.profile_dir / f"{stage.name}-{stamp}.folded"):
+                            stage.run(ctx)
+                    else:
+                        stage.run(ctx)
+                    if stage.per_product and not collected.get('stage_items_processed'):
+                        collected.set('stage_items_processed', len(ctx.changed_products) + len(ctx.removed_products))
+            except Exception as e:
+                record_stage_run(conn, stage.name, fingerprint, 'failed', started_at, error=str(e))
+                conn.commit()
+                raise
+
+            if stage.outputs():
+                fingerprint = _digest({'stage': stage.name, 'files': _files_fingerprint(stage.outputs())})
+                if stage.always_run and fingerprint == last:
+                    print(f"✓ [{stage.name}] output unchanged")
+
+            status = 'success'
+            if stage.per_product:
+                # Failed products get no hash, so the next run sees them as changed and retries them;
+                # a partial run is not recorded as a success, so the stage is not skipped as unchanged
+                done = {pid: h for pid, h in current_hashes.items() if pid not in ctx.failed_products}
+                replace_stage_product_hashes(conn, stage.name, done)
+                if ctx.failed_products:
+                    status = 'partial'
+                    print(f"⚠️  [{stage.name}] {len(ctx.failed_products)} products failed; they will be retried next run")
+            record_stage_run(conn, stage.name, fingerprint, status, started_at,
+                             items_changed=len(ctx.changed_products) + len(ctx.removed_products))
+            conn.commit()
+            # After a partial run dependents see a different fingerprint, so they run again once the retries land
+            self.output_fingerprints[stage.name] = fingerprint if status == 'success' else \
+                _digest({'stage': stage.name, 'input': fingerprint, 'failed': sorted(ctx.failed_products)})
+            return 'ran' if status == 'success' else 'partial'
+        finally:
+            conn.close()
+
+    @tracing.traced('pipeline.run')
+    def run(self) -> Dict[str, str]:
+        """Run every stage whose dependencies are satisfied, in parallel where possible"""
+        initialize_database()
+        pending = dict(self.stages)
+        running = {}
+        failed: Set[str] = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as executor:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if any(dep in failed for dep in stage.depends_on):
+                        print(f"⛔ [{name}] not run because a dependency failed")
+                        self.results[name] = 'blocked'
+                        failed.add(name)
+                        del pending[name]
+                    elif all(dep in self.results for dep in stage.depends_on):
+                        running[executor.submit(tracing.propagate(self._run_stage), stage)] = name
+                        del pending[name]
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception as e:
+                        print(f"❌ [{name}] failed: {e}", file=sys.stderr)
+                        self.results[name] = 'failed'
+                        failed.add(name)
+
+        return self.results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the FedRAMP data pipeline incrementally')
+    parser.add_argument('--force', nargs='*', default=[], choices=list(STAGES), help='Stages to rerun regardless of inputs')
+    parser.add_argument('--skip', nargs='*', default=[], choices=list(STAGES), help='Stages to leave out of this run')
+    parser.add_argument('--parallel', type=int, default=3, help='Maximum number of stages to run at once')
+    parser.add_argument('--analyze-workers', type=int, default=10, help='Number of parallel analysis workers')
+    parser.add_argument('--dry-run', action='store_true', help='Show what would run without running it')
+    parser.add_argument('--trace', action='store_true', help='Write tracing spans as OTLP JSON lines to data/traces/')
+    parser.add_argument('--trace-file', type=Path, metavar='PATH', help='Write tracing spans to PATH instead')
+    parser.add_argument('--profile', nargs='*', default=[], choices=list(STAGES),
+                        help='Stages to run under the sampling profiler (folded stacks in data/profiles/)')
+    parser.add_argument('--metrics-dir', type=Path, default=metrics.METRICS_DIR,
+                        help='Directory for Prometheus textfile metrics (node_exporter textfile collector)')
+
+    args = parser.parse_args()
+
+    if args.trace or args.trace_file:
+        print(f"🔭 Tracing to {tracing.configure(args.trace_file)}")
+
+    pipeline = Pipeline(
+        force=set(args.force),
+        skip=set(args.skip),
+        max_parallel=args.parallel,
+        dry_run=args.dry_run,
+        options={'analyze_workers': args.analyze_workers},
+        profile=set(args.profile),
+        metrics_dir=args.metrics_dir,
+    )
+    results = pipeline.run()
+
+    print()
+    print("📈 Pipeline summary:")
+    for name in STAGES:
+        print(f"   {name}: {results.get(name, 'not run')}")
+
+    return 1 if 'failed' in results.values() else 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,257 @@
+"""
+Per-host politeness scheduler shared by the scraper and the catalog fetcher
+
+Every request to a host goes through a slot:
+
+    async with scheduler.slot(url, priority=2) as slot:     # asyncio callers
+        ...; slot.report(status)
+    with scheduler.slot_sync(url) as slot:                  # threaded callers
+        ...; slot.report(status)
+
+Each host has a token bucket (requests per second plus a burst), a cap on
+requests in flight, and a priority queue of waiters: the highest-priority
+waiter is always served first. Throttling signals (429, 503, or a 202/shell
+page that means bot protection kicked in) halve the host's rate and pause it,
+honouring Retry-After; successes recover the rate gradually (AIMD).
+"""
+import asyncio
+import contextlib
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+THROTTLE_STATUSES = {202, 429, 503}
+
+
+class HostPolicy:
+    """Pacing limits for one host"""
+
+    __slots__ = ('rate', 'burst', 'concurrency', 'min_rate', 'cooldown_s', 'max_cooldown_s')
+
+    def __init__(self, rate: float = 2.0, burst: int = 2, concurrency: int = 4, min_rate: float = 0.1,
+                 cooldown_s: float = 5.0, max_cooldown_s: float = 300.0):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.cooldown_s = cooldown_s
+        self.max_cooldown_s = max_cooldown_s
+
+    def copy(self, **overrides) -> 'HostPolicy':
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(overrides)
+        return HostPolicy(**values)
+
+
+DEFAULT_POLICY = HostPolicy()
+DEFAULT_POLICIES = {
+    'marketplace.fedramp.gov': HostPolicy(rate=2.0, burst=4, concurrency=5),
+    'raw.githubusercontent.com': HostPolicy(rate=1.0, burst=2, concurrency=2),
+}
+
+
+class _Waiter:
+    """A queued request; woken when it reaches the head of its host's queue"""
+
+    __slots__ = ('key', '_event', '_loop')
+
+    def __init__(self, priority: float, seq: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.key = (-priority, seq)
+        self._loop = loop
+        self._event = asyncio.Event() if loop else threading.Event()
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return self.key < other.key
+
+    def notify(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._event.set()
+
+
+class _HostState:
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.rate = policy.rate
+        self.tokens = float(policy.burst)
+        self.updated = time.monotonic()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.strikes = 0
+        self.waiters = []
+
+    def wait_time(self, now: float) -> float:
+        """0 if a request may start now, else seconds until it might (inf = wait for a release)"""
+        self.tokens = min(self.policy.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= self.policy.concurrency:
+            return math.inf
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        return 0.0
+
+
+class Slot:
+    """Handle for one request; report the outcome so the host can adapt"""
+
+    __slots__ = ('status', 'blocked', 'retry_after')
+
+    def __init__(self):
+        self.status = None
+        self.blocked = False
+        self.retry_after = None
+
+    def report(self, status: Optional[int], blocked: bool = False, retry_after: Optional[float] = None):
+        self.status = status
+        self.blocked = blocked
+        self.retry_after = retry_after
+
+
+class PoliteScheduler:
+    """Token bucket, concurrency cap and priority queue per host, usable from threads and asyncio"""
+
+    def __init__(self, policies: Optional[Dict[str, HostPolicy]] = None, default: HostPolicy = DEFAULT_POLICY):
+        self.policies = dict(DEFAULT_POLICIES if policies is None else policies)
+        self.default = default
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def configure(self, host: str, **overrides):
+        """Override a host's limits, e.g. configure('marketplace.fedramp.gov', concurrency=10)"""
+        with self._lock:
+            policy = self.policies.get(host, self.default).copy(**overrides)
+            self.policies[host] = policy
+            if host in self._hosts:
+                self._hosts[host].policy = policy
+                self._hosts[host].rate = min(self._hosts[host].rate, policy.rate)
+
+    def current_rate(self, host: str) -> float:
+        with self._lock:
+            return self._state(host).rate
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.policies.get(host, self.default))
+        return state
+
+    def _enqueue(self, host: str, waiter: _Waiter):
+        with self._lock:
+            heapq.heappush(self._state(host).waiters, waiter)
+
+    def _try_start(self, host: str, waiter: _Waiter) -> float:
+        """Start the request if the waiter is at the head and the host allows it; else time to wait"""
+        with self._lock:
+            state = self._state(host)
+            if state.waiters[0] is not waiter:
+                return math.inf
+            wait = state.wait_time(time.monotonic())
+            if wait == 0:
+                heapq.heappop(state.waiters)
+                state.tokens -= 1
+                state.in_flight += 1
+                if state.waiters:
+                    state.waiters[0].notify()
+            return wait
+
+    def _abandon(self, host: str, waiter: _Waiter):
+        with self._lock:
+            state = self._state(host)
+            if waiter in state.waiters:
+                was_head = state.waiters[0] is waiter
+                state.waiters.remove(waiter)
+                heapq.heapify(state.waiters)
+                if was_head and state.waiters:
+                    state.waiters[0].notify()
+
+    def _finish(self, host: str, slot: Slot):
+        with self._lock:
+            state = self._state(host)
+            state.in_flight -= 1
+            policy = state.policy
+            now = time.monotonic()
+
+            if slot.blocked or slot.status in THROTTLE_STATUSES:
+                # Multiplicative decrease and a growing pause
+                state.strikes += 1
+                state.rate = max(policy.min_rate, state.rate / 2)
+                cooldown = min(policy.max_cooldown_s, policy.cooldown_s * 2 ** (state.strikes - 1))
+                if slot.retry_after is not None:
+                    cooldown = max(cooldown, slot.retry_after)
+                state.paused_until = max(state.paused_until, now + cooldown)
+            elif slot.status is not None and slot.status < 400:
+                # Additive increase back towards the configured rate
+                state.strikes = 0
+                state.rate = min(policy.rate, state.rate + policy.rate * 0.1)
+
+            if state.waiters:
+                state.waiters[0].notify()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str, priority: float = 0):
+        """Wait for permission to request url (higher priority first) from a coroutine"""
+        host = urlsplit(url).hostname or ''
+        waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop())
+        self._enqueue(host, waiter)
+        try:
+            while True:
+                waiter._event.clear()
+                wait = self._try_start(host, waiter)
+                if wait == 0:
+                    break
+                try:
+                    await asyncio.wait_for(waiter._event.wait(), None if math.isinf(wait) else wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(host, waiter)
+            raise
+
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            self._finish(host, slot)
+
+    @contextlib.contextmanager
+    def slot_sync(self, url: str, priority: float = 0):
+        """Blocking variant of slot() for threaded code"""
+        host = urlsplit(url).hostname or ''
+        waiter = _Waiter(priority, next(self._seq), None)
+        self._enqueue(host, waiter)
+        try:
+            while True:
+                waiter._event.clear()
+                wait = self._try_start(host, waiter)
+                if wait == 0:
+                    break
+                waiter._event.wait(None if math.isinf(wait) else wait)
+        except BaseException:
+            self._abandon(host, waiter)
+            raise
+
+        slot = Slot()
+        try:
+            yield slot
+        finally:
+            self._finish(host, slot)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header given in delta-seconds (HTTP dates are ignored)"""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+# Shared by every fetcher in the process
+scheduler = PoliteScheduler()
@@ -0,0 +1,127 @@
+"""
+Inverted index over the FedRAMP catalog for agency matching
+
+Maps provider names to the products they offer and service-name tokens to the
+products that list them, so matching an agency is a handful of dictionary
+lookups instead of a scan over every product and service string. When a rule
+set is given, service names are also tagged with the AI services they mention.
+The index is built once per catalog version (and rules file) and pickled next
+to the catalog cache.
+"""
+import re
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from catalog import CACHE_DIR, JSON_PATH, ProductRecord, catalog_version, load_catalog, read_cache, write_cache
+from rule_matcher import RuleSet
+
+INDEX_VERSION = 2  # bump when the index layout or tokenization changes
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+class ProductIndex:
+    """
+    Provider and service-token lookups over a list of products
+
+    Positions refer to the catalog order, which matching relies on (the first
+    government offering of a provider ends a provider-only match).
+    """
+
+    def __init__(self, products: Sequence[ProductRecord]):
+        self.products = list(products)
+        self.gov_positions = frozenset(i for i, p in enumerate(self.products) if 'gov' in p.cso.lower())
+
+        # Provider (lowercased CSP) -> product positions in catalog order
+        self.by_csp: Dict[str, List[int]] = {}
+        for i, product in enumerate(self.products):
+            self.by_csp.setdefault(product.csp.lower(), []).append(i)
+
+        # Service token -> positions of products with a service containing that token
+        by_token: Dict[str, set] = {}
+        for i, product in enumerate(self.products):
+            for service in product.services_lower:
+                for token in TOKEN_RE.findall(service):
+                    by_token.setdefault(token, set()).add(i)
+        self.by_token: Dict[str, FrozenSet[int]] = {t: frozenset(p) for t, p in by_token.items()}
+
+        # Service rule name -> positions of products with a service mentioning it (see annotate)
+        self.rules_fingerprint = ''
+        self.by_service_rule: Dict[str, FrozenSet[int]] = {}
+
+        self._provider_memo: Dict[str, Tuple[int, ...]] = {}
+        self._term_memo: Dict[str, FrozenSet[int]] = {}
+
+    def __getstate__(self):
+        return (self.products, self.gov_positions, self.by_csp, self.by_token,
+                self.rules_fingerprint, self.by_service_rule)
+
+    def __setstate__(self, state):
+        (self.products, self.gov_positions, self.by_csp, self.by_token,
+         self.rules_fingerprint, self.by_service_rule) = state
+        self._provider_memo = {}
+        self._term_memo = {}
+
+    def __len__(self):
+        return len(self.products)
+
+    def annotate(self, rules: RuleSet):
+        """Tag every product with the service rules its service names mention"""
+        by_rule: Dict[str, set] = {}
+        for i, product in enumerate(self.products):
+            for service in product.services:
+                for name in rules.names(service, 'services'):
+                    by_rule.setdefault(name, set()).add(i)
+        self.by_service_rule = {name: frozenset(p) for name, p in by_rule.items()}
+        self.rules_fingerprint = rules.fingerprint
+
+    def service_rule_positions(self, name: str) -> FrozenSet[int]:
+        """Positions of products offering the service rule ``name`` (requires annotate)"""
+        return self.by_service_rule.get(name, frozenset())
+
+    def provider_positions(self, provider: str) -> Tuple[int, ...]:
+        """Positions of products whose CSP name contains ``provider`` (case-insensitive), in catalog order"""
+        key = provider.lower()
+        positions = self._provider_memo.get(key)
+        if positions is None:
+            found = [i for csp, ids in self.by_csp.items() if key in csp for i in ids]
+            positions = self._provider_memo[key] = tuple(sorted(found))
+        return positions
+
+    def service_term_positions(self, term: str) -> FrozenSet[int]:
+        """
+        Positions of products with a service name containing ``term``
+
+        Alphanumeric terms are resolved against the token vocabulary: a
+        substring of a service made only of letters and digits always lies
+        inside one token. Other terms fall back to scanning service names.
+        """
+        key = term.lower()
+        positions = self._term_memo.get(key)
+        if positions is None:
+            if TOKEN_RE.fullmatch(key):
+                found = set()
+                for token, ids in self.by_token.items():
+                    if key in token:
+                        found.update(ids)
+            else:
+                found = {i for i, p in enumerate(self.products) if any(key in s for s in p.services_lower)}
+            positions = self._term_memo[key] = frozenset(found)
+        return positions
+
+
+def _index_cache_path(json_path: Path) -> Path:
+    return CACHE_DIR / f"{json_path.stem}.index.pickle"
+
+def load_index(json_path: Path = JSON_PATH, rules: Optional[RuleSet] = None) -> ProductIndex:
+    """Load the product index for the current catalog, building and caching it if needed"""
+    key = catalog_version(json_path)
+    if rules is not None:
+        key = f"{key}:{rules.fingerprint}"
+    cache_path = _index_cache_path(json_path)
+    index = read_cache(cache_path, INDEX_VERSION, key)
+    if index is None:
+        index = ProductIndex(load_catalog(json_path))
+        if rules is not None:
+            index.annotate(rules)
+        write_cache(cache_path, INDEX_VERSION, key, index)
+    return index
@@ -0,0 +1,151 @@
+"""
+Multi-pattern matcher for provider and service mentions
+
+Compiles every pattern from ``rules/matching_rules.json`` into one Aho-Corasick
+automaton, so a text is scanned once no matter how many rules there are. Hits
+respect word boundaries: ``aws`` does not fire inside ``laws`` and ``gpt`` does
+not fire inside ``chatgpt``, unless the pattern ends in ``*``, which lets it
+run on into a longer word. A version number may follow directly (``gpt4``).
+Every hit is returned with its span; a hit nested inside a longer hit for the
+same rule (``microsoft`` inside ``microsoft 365``) is dropped.
+"""
+import hashlib
+import json
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+RULES_PATH = Path(__file__).parent / "rules" / "matching_rules.json"
+
+
+class Hit(NamedTuple):
+    """One rule mention in a text"""
+    kind: str      # 'providers' or 'services'
+    name: str      # canonical rule name, e.g. 'Microsoft' or 'bedrock'
+    pattern: str   # the pattern that matched
+    start: int
+    end: int
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over lowercased patterns
+
+    Each pattern carries a payload; ``search`` yields (start, end, payload) for
+    every occurrence, overlapping ones included.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]
+
+        for pattern, payload in patterns:
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(pattern), payload))
+
+        # Breadth-first failure links; outputs of the fallback state are inherited
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def search(self, text: str):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in out[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+def _runs_on(text: str, end: int) -> bool:
+    """Whether the word at text[end - 1] continues past end (a version number does not count)"""
+    if end >= len(text) or not _is_word_char(text[end]) or not _is_word_char(text[end - 1]):
+        return False
+    return not (text[end].isdigit() and text[end - 1].isalpha())
+
+
+class RuleSet:
+    """Provider/service rules compiled into a single automaton"""
+
+    def __init__(self, rules: dict, fingerprint: str = ''):
+        self.version = rules.get('version', 0)
+        self.fingerprint = fingerprint
+        self.providers: Dict[str, List[str]] = rules.get('providers', {})
+        self.services: Dict[str, List[str]] = rules.get('services', {})
+        self.scoring: Dict[str, float] = rules.get('scoring', {})
+
+        patterns = []
+        for kind in ('providers', 'services'):
+            for name, aliases in rules.get(kind, {}).items():
+                for alias in aliases:
+                    prefix = alias.endswith('*')
+                    text = alias.rstrip('*').lower()
+                    patterns.append((text, (kind, name, alias, prefix)))
+        self._automaton = Automaton(patterns)
+
+    def find_all(self, text: str, kind: Optional[str] = None) -> List[Hit]:
+        """Every whole-word rule mention in text, in order of position"""
+        if not text:
+            return []
+        lowered = text.lower()
+        hits = []
+        for start, end, (hit_kind, name, pattern, prefix) in self._automaton.search(lowered):
+            if kind and hit_kind != kind:
+                continue
+            if start > 0 and _is_word_char(lowered[start - 1]) and _is_word_char(lowered[start]):
+                continue
+            if not prefix and _runs_on(lowered, end):
+                continue
+            hits.append(Hit(hit_kind, name, pattern, start, end))
+        hits.sort(key=lambda h: (h.start, -h.end))
+
+        # Drop hits inside a longer hit for the same rule; every earlier hit starts
+        # no later, so it is enough to track how far each rule's hits reach
+        kept = []
+        reach: Dict[Tuple[str, str], int] = {}
+        for hit in hits:
+            key = (hit.kind, hit.name)
+            if reach.get(key, -1) >= hit.end:
+                continue
+            reach[key] = hit.end
+            kept.append(hit)
+        return kept
+
+    def names(self, text: str, kind: str) -> List[str]:
+        """Distinct rule names of one kind mentioned in text, in order of first mention"""
+        return list(dict.fromkeys(hit.name for hit in self.find_all(text, kind)))
+
+
+_cache: Dict[str, RuleSet] = {}
+
+def load_rules(path: Path = RULES_PATH) -> RuleSet:
+    """Load and compile a rules file (memoized per file content)"""
+    data = path.read_bytes()
+    fingerprint = hashlib.sha256(data).hexdigest()
+    rules = _cache.get(fingerprint)
+    if rules is None:
+        rules = _cache[fingerprint] = RuleSet(json.loads(data), fingerprint)
+    return rules
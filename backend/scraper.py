@@ -1,150 +1,476 @@
 """
-Web scraper for FedRAMP marketplace product pages using Playwright
+Web scraper for FedRAMP marketplace product pages
+
+Pages are fetched in tiers. A pooled HTTP/2 client is tried first; only when it
+returns an empty or blocked shell page does the request escalate to Playwright.
+A single long-lived Chromium is shared by all workers. Every page gets its own
+lightweight browser context, images/fonts/media are blocked, and a page is
+considered ready as soon as its product heading renders instead of after a
+fixed network-idle wait.
 """
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-from pathlib import Path
-import sys
+import asyncio
+import itertools
+import re
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import List, Dict, Any
-from db import get_connection, update_scrape_status, get_unscraped_products, get_scrape_stats
+from datetime import datetime, timezone
+import sys
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+import politeness
+import metrics
+import tracing
+from politeness import PoliteScheduler, parse_retry_after
+from html_store import STORE_DIR, put_page, relative_blob_path
+from db import (
+    get_connection, update_scrape_status, get_unscraped_products, get_scrape_stats, record_scrape_tier_stats,
+    record_scrape_failure, clear_scrape_failure, get_scrape_failure_summary, get_scrape_priorities
+)
 
-HTML_DIR = Path(__file__).parent.parent / "data" / "html"
 BASE_URL = "https://marketplace.fedramp.gov/products"
-MAX_WORKERS = 5  # Reduced for browser-based scraping
+MAX_WORKERS = 5  # Concurrent pages across the browser pool
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'media'}
+READY_SELECTOR = 'h1'  # Product name heading, rendered once the page has data
+NAVIGATION_TIMEOUT_MS = 30000
+READY_TIMEOUT_MS = 10000
+HTTP_TIMEOUT_S = 20
+TIERS = ('http', 'browser')
+
+# Content checks a page must pass before it counts as scraped. An unrendered
+# single-page-app shell (like the 39-byte pages the site serves to bots) fails them.
+MIN_PAGE_BYTES = 512
+EMPTY_BODY_RE = re.compile(rb'<body[^>]*>\s*</body>', re.IGNORECASE)
+REQUIRED_SELECTORS = {
+    'h1': re.compile(rb'<h1[\s>]', re.IGNORECASE),
+}
+
+def validate_page(status: Optional[int], html: str) -> Optional[str]:
+    """
+    Check a fetched page
 
-def scrape_product_page_with_browser(fedramp_id: str) -> tuple[str, bool, str]:
+    Returns None for a usable product page, otherwise the error class:
+    'no_response', 'http_<status>', 'too_small', 'empty_body' or 'missing_<selector>'.
     """
-    Scrape a single product page using Playwright
-    Returns: (fedramp_id, success, html_content_or_error)
+    if status is None:
+        return 'no_response'
+    if status != 200:
+        return f'http_{status}'
+    body = html.encode('utf-8', errors='ignore')
+    if len(body) < MIN_PAGE_BYTES:
+        return 'too_small'
+    if EMPTY_BODY_RE.search(body):
+        return 'empty_body'
+    for selector, pattern in REQUIRED_SELECTORS.items():
+        if not pattern.search(body):
+            return f'missing_{selector}'
+    return None
+
+def is_shell_page(status: Optional[int], html: str) -> bool:
+    """True if a response is an empty/blocked shell rather than a rendered product page"""
+    return validate_page(status, html) is not None
+
+class BrowserPool:
     """
-    url = f"{BASE_URL}/{fedramp_id}"
+    Long-lived headless Chromium instances shared by all scrape tasks
 
-    try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-            )
-            page = context.new_page()
+    Use as an async context manager. ``fetch`` opens a fresh context per page
+    and never runs more than ``max_pages`` pages at once.
+    """
+
+    def __init__(self, max_pages: int = MAX_WORKERS, browsers: int = 1, headless: bool = True,
+                 user_agent: str = USER_AGENT, ready_selector: str = READY_SELECTOR):
+        self.max_pages = max_pages
+        self.browser_count = browsers
+        self.headless = headless
+        self.user_agent = user_agent
+        self.ready_selector = ready_selector
+        self._playwright = None
+        self._browsers = []
+        self._next_browser = None
+        self._semaphore = asyncio.Semaphore(max_pages)
+
+    async def __aenter__(self) -> 'BrowserPool':
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        try:
+            for _ in range(self.browser_count):
+                self._browsers.append(await self._playwright.chromium.launch(headless=self.headless))
+        except BaseException:
+            # Close whatever did launch and stop the driver, or it outlives the failure
+            await self.__aexit__(None, None, None)
+            raise
+        self._next_browser = itertools.cycle(self._browsers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for browser in self._browsers:
+            await browser.close()
+        self._browsers.clear()
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    @staticmethod
+    async def _block_heavy_resources(route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def fetch(self, url: str) -> Tuple[Optional[int], str, Optional[float]]:
+        """
+        Load a URL and return (http_status, html, retry_after_seconds)
+
+        The status is None if navigation produced no response. The HTML is
+        returned even if the ready selector never appeared, so callers can
+        decide what counts as a usable page. A navigation timeout is raised as
+        the builtin TimeoutError.
+        """
+        from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+        async with self._semaphore:
+            context = await next(self._next_browser).new_context(user_agent=self.user_agent)
+            try:
+                await context.route('**/*', self._block_heavy_resources)
+                page = await context.new_page()
+
+                try:
+                    response = await page.goto(url, wait_until='domcontentloaded', timeout=NAVIGATION_TIMEOUT_MS)
+                except PlaywrightTimeoutError as e:
+                    raise TimeoutError(f"Navigation to {url} timed out") from e
+                try:
+                    await page.wait_for_selector(self.ready_selector, timeout=READY_TIMEOUT_MS)
+                except PlaywrightTimeoutError:
+                    pass
+
+                if response is None:
+                    return None, await page.content(), None
+                retry_after = parse_retry_after(response.headers.get('retry-after'))
+                return response.status, await page.content(), retry_after
+            finally:
+                await context.close()
+
+class HttpFetcher:
+    """Pooled keep-alive HTTP/2 client with compression, used as the cheap first tier"""
+
+    def __init__(self, max_connections: int = MAX_WORKERS * 2, user_agent: str = USER_AGENT):
+        self.max_connections = max_connections
+        self.user_agent = user_agent
+        self._client = None
+
+    async def __aenter__(self) -> 'HttpFetcher':
+        import httpx
+
+        self._client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            timeout=HTTP_TIMEOUT_S,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+            headers={
+                'User-Agent': self.user_agent,
+                'Accept': 'text/html,application/xhtml+xml',
+            },
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.aclose()
+
+    async def fetch(self, url: str) -> Tuple[Optional[int], str, Optional[float]]:
+        import httpx
+
+        try:
+            response = await self._client.get(url)
+        except httpx.TimeoutException as e:
+            raise TimeoutError(f"Request to {url} timed out") from e
+        return response.status_code, response.text, parse_retry_after(response.headers.get('retry-after'))
+
+class TierStats:
+    """Per-run hit rate and latency for one fetch tier"""
+
+    __slots__ = ('attempts', 'hits', 'errors', 'total_latency_ms', 'max_latency_ms')
+
+    def __init__(self):
+        self.attempts = 0
+        self.hits = 0
+        self.errors = 0
+        self.total_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+
+    def record(self, latency_ms: float, hit: bool, error: bool = False):
+        self.attempts += 1
+        self.hits += hit
+        self.errors += error
+        self.total_latency_ms += latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts if self.attempts else 0.0
+
+    @property
+    def avg_latency_ms(self) -> float:
+        return self.total_latency_ms / self.attempts if self.attempts else 0.0
+
+class TieredFetcher:
+    """
+    Try plain HTTP first and escalate to the browser pool only for shell pages
+
+    The browser is launched lazily on the first escalation, so runs where HTTP
+    is enough never pay the Chromium startup cost. Every request waits for a
+    slot from the shared politeness scheduler, which paces the host and
+    serves higher-priority products first.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, tiers: Tuple[str, ...] = TIERS,
+                 scheduler: PoliteScheduler = politeness.scheduler):
+        self.max_workers = max_workers
+        self.tiers = tiers
+        self.scheduler = scheduler
+        self.stats: Dict[str, TierStats] = {tier: TierStats() for tier in tiers}
+        self._http: Optional[HttpFetcher] = None
+        self._browser: Optional[BrowserPool] = None
+        self._browser_error: Optional[Exception] = None
+        self._browser_lock = asyncio.Lock()
 
-            # Navigate to page with timeout
-            response = page.goto(url, wait_until='networkidle', timeout=30000)
+    async def __aenter__(self) -> 'TieredFetcher':
+        if 'http' in self.tiers:
+            self._http = await HttpFetcher(max_connections=self.max_workers * 2).__aenter__()
+        return self
 
-            # Check if page loaded successfully
-            if response and response.status == 200:
-                # Wait a bit for any dynamic content
-                page.wait_for_timeout(1000)
+    async def __aexit__(self, *exc_info):
+        if self._http:
+            await self._http.__aexit__(*exc_info)
+        if self._browser:
+            await self._browser.__aexit__(*exc_info)
 
-                # Get the HTML content
-                html_content = page.content()
+    async def _browser_pool(self) -> BrowserPool:
+        """The shared browser pool; a failed launch is not retried for the rest of the run"""
+        async with self._browser_lock:
+            if self._browser_error is not None:
+                raise RuntimeError(f"Browser unavailable: {self._browser_error}") from self._browser_error
+            if self._browser is None:
+                try:
+                    self._browser = await BrowserPool(max_pages=self.max_workers).__aenter__()
+                except Exception as e:
+                    self._browser_error = e
+                    print(f"⚠️  Browser launch failed, not retrying this run: {e}", file=sys.stderr)
+                    raise
+            return self._browser
 
-                # Save HTML to file
-                html_path = HTML_DIR / f"{fedramp_id}.html"
-                html_path.write_text(html_content, encoding='utf-8')
+    @tracing.traced('scrape.fetch')
+    async def _timed(self, tier: str, fetch, url: str, priority: float, last_tier: bool) -> Tuple[Optional[int], str]:
+        span = tracing.current_span()
+        span.set_attributes(tier=tier, url=url)
+        async with self.scheduler.slot(url, priority) as slot:
+            start = time.perf_counter()
+            try:
+                status, html, retry_after = await fetch(url)
+            except Exception as e:
+                span.record_error(e)
+                self.stats[tier].record((time.perf_counter() - start) * 1000, hit=False, error=True)
+                if last_tier:
+                    raise
+                return None, ''
 
-                browser.close()
+            shell = is_shell_page(status, html)
+            span.set_attributes(status=status, shell=shell, bytes=len(html))
+            self.stats[tier].record((time.perf_counter() - start) * 1000, hit=not shell)
+            # A shell from plain HTTP is expected for a JS-rendered site; from the browser it means we were blocked
+            slot.report(status, blocked=shell and tier == 'browser', retry_after=retry_after)
+            return status, html
 
-                # Return relative path for database
-                relative_path = f"data/html/{fedramp_id}.html"
-                return fedramp_id, True, relative_path
+    async def fetch(self, url: str, priority: float = 0) -> Tuple[str, Optional[int], str]:
+        """Return (tier, status, html) from the cheapest tier that produced a real page"""
+        status, html, tier = None, '', self.tiers[0]
+        for i, tier in enumerate(self.tiers):
+            last_tier = i == len(self.tiers) - 1
+            if tier == 'http':
+                status, html = await self._timed(tier, self._http.fetch, url, priority, last_tier)
             else:
-                browser.close()
-                error_msg = f"HTTP {response.status if response else 'No response'}"
-                return fedramp_id, False, error_msg
+                try:
+                    pool = await self._browser_pool()
+                except Exception:
+                    if i == 0:
+                        raise
+                    # No browser this run; keep what the cheaper tier returned
+                    tier = self.tiers[i - 1]
+                    break
+                status, html = await self._timed(tier, pool.fetch, url, priority, last_tier)
+            if not is_shell_page(status, html):
+                break
+        return tier, status, html
 
-    except PlaywrightTimeoutError:
+    def print_stats(self):
+        for tier, stats in self.stats.items():
+            print(f"  {tier:<8} {stats.hits}/{stats.attempts} hits ({stats.hit_rate * 100:.0f}%), "
+                  f"{stats.errors} errors, avg {stats.avg_latency_ms:.0f} ms, max {stats.max_latency_ms:.0f} ms")
+
+@tracing.traced('scrape.product')
+async def scrape_product_page(fetcher: TieredFetcher, fedramp_id: str, base_url: str = BASE_URL,
+                              priority: float = 0) -> Tuple[str, bool, str, Optional[str]]:
+    """
+    Scrape a single product page through the tiered fetcher
+    Returns: (fedramp_id, success, html_or_error, error_class)
+    """
+    url = f"{base_url}/{fedramp_id}"
+    span = tracing.current_span()
+    span.set_attributes(fedramp_id=fedramp_id, priority=priority)
+
+    try:
+        tier, status, html_content = await fetcher.fetch(url, priority)
+
+        # Only keep pages that pass content validation
+        error_class = validate_page(status, html_content)
+        span.set_attributes(tier=tier, status=status, error_class=error_class)
+        if error_class is None:
+            return fedramp_id, True, html_content, None
+        else:
+            error_msg = f"Invalid page via {tier}: {error_class} (HTTP {status if status else 'No response'}, {len(html_content)} bytes)"
+            return fedramp_id, False, error_msg, error_class
+
+    except TimeoutError as e:
+        # Each fetcher raises its library's timeouts as the builtin TimeoutError
+        span.record_error(e)
         error_msg = f"Timeout loading {fedramp_id}"
         print(error_msg, file=sys.stderr)
-        return fedramp_id, False, error_msg
+        return fedramp_id, False, error_msg, 'timeout'
     except Exception as e:
+        span.record_error(e)
         error_msg = f"Error scraping {fedramp_id}: {str(e)}"
         print(error_msg, file=sys.stderr)
-        return fedramp_id, False, error_msg
-
-def scrape_all_products(max_workers: int = MAX_WORKERS):
-    """Scrape all unscraped products from database"""
-
-    # Ensure HTML directory exists
-    HTML_DIR.mkdir(parents=True, exist_ok=True)
-
-    # Get connection and unscraped products
-    conn = get_connection()
-    products = get_unscraped_products(conn)
-
-    if not products:
-        print("No products to scrape!")
-        stats = get_scrape_stats(conn)
-        print(f"Stats: {stats['scraped']}/{stats['total']} products already scraped")
-        conn.close()
-        return
-
-    print(f"Starting scrape of {len(products)} products with {max_workers} workers...")
-    print("Using Playwright browser automation for scraping...")
+        return fedramp_id, False, error_msg, type(e).__name__
 
+async def _scrape_products(conn, fedramp_ids: List[str], max_workers: int, base_url: str,
+                           tiers: Tuple[str, ...], priorities: Dict[str, float]) -> Tuple[int, int]:
     success_count = 0
     error_count = 0
+    run_started_at = datetime.now(timezone.utc).isoformat()
 
-    # Use ThreadPoolExecutor for concurrent scraping
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_id = {
-            executor.submit(scrape_product_page_with_browser, p['fedramp_id']): p['fedramp_id']
-            for p in products
-        }
+    # The scheduler caps requests in flight per host and hands out slots by priority
+    host = urlsplit(base_url).hostname or ''
+    politeness.scheduler.configure(host, concurrency=max_workers)
+
+    async with TieredFetcher(max_workers=max_workers, tiers=tiers) as fetcher:
+        tasks = [
+            scrape_product_page(fetcher, fedramp_id, base_url, priorities.get(fedramp_id, 0))
+            for fedramp_id in fedramp_ids
+        ]
 
         # Process completed tasks
-        for i, future in enumerate(as_completed(future_to_id), 1):
-            fedramp_id, success, result = future.result()
+        for i, task in enumerate(asyncio.as_completed(tasks), 1):
+            fedramp_id, success, result, error_class = await task
 
             if success:
-                # Update database
-                update_scrape_status(conn, fedramp_id, result)
+                # Store the page by content hash and point the product at it
+                sha256, changed = put_page(conn, fedramp_id, result)
+                update_scrape_status(conn, fedramp_id, relative_blob_path(sha256))
+                clear_scrape_failure(conn, fedramp_id)
                 success_count += 1
-                print(f"[{i}/{len(products)}] ✓ Scraped {fedramp_id}")
+                metrics.add('scrape_pages', result='success')
+                print(f"[{i}/{len(fedramp_ids)}] ✓ Scraped {fedramp_id}{'' if changed else ' (unchanged)'}")
             else:
+                # Schedule the next attempt with exponential backoff
+                attempts, next_eligible_at = record_scrape_failure(conn, fedramp_id, error_class, result)
                 error_count += 1
-                print(f"[{i}/{len(products)}] ✗ Failed {fedramp_id}: {result}")
+                metrics.add('scrape_pages', result='failed')
+                metrics.add('stage_errors', error_class=error_class)
+                print(f"[{i}/{len(fedramp_ids)}] ✗ Failed {fedramp_id}: {result} "
+                      f"(attempt {attempts}, retry after {next_eligible_at})")
 
             # Commit every 25 products
             if i % 25 == 0:
                 conn.commit()
                 print(f"Progress: {success_count} success, {error_count} errors")
 
+    print("\nFetch tiers:")
+    fetcher.print_stats()
+    for tier, stats in fetcher.stats.items():
+        record_scrape_tier_stats(conn, run_started_at, tier, stats.attempts, stats.hits, stats.errors,
+                                 stats.total_latency_ms, stats.max_latency_ms)
+
+    return success_count, error_count
+
+@tracing.traced('scrape_all_products')
+def scrape_all_products(max_workers: int = MAX_WORKERS, base_url: str = BASE_URL, tiers: Tuple[str, ...] = TIERS,
+                        ignore_backoff: bool = False):
+    """Scrape all unscraped products from database whose retry time has come"""
+
+    # Get connection and unscraped products
+    conn = get_connection()
+    products = get_unscraped_products(conn, ignore_backoff=ignore_backoff)
+
+    if not products:
+        print("No products to scrape!")
+        stats = get_scrape_stats(conn)
+        print(f"Stats: {stats['scraped']}/{stats['total']} products already scraped, "
+              f"{stats['backing_off']} waiting for retry")
+        conn.close()
+        return
+
+    print(f"Starting scrape of {len(products)} products with {max_workers} concurrent pages...")
+    print(f"Fetch tiers: {' -> '.join(tiers)}")
+
+    # High-value products (AI services, ATO expiring soon) are fetched first
+    priorities = get_scrape_priorities(conn)
+    high_priority = sum(1 for p in products if priorities.get(p['fedramp_id'], 0) > 0)
+    print(f"Prioritizing {high_priority} high-value products")
+
+    success_count, error_count = asyncio.run(
+        _scrape_products(conn, [p['fedramp_id'] for p in products], max_workers, base_url, tiers, priorities)
+    )
+
     # Final commit
     conn.commit()
     conn.close()
 
+    metrics.add('stage_items_processed', len(products))
+    metrics.set_gauge('scrape_success_ratio', success_count / len(products))
+
     print(f"\n{'='*60}")
     print(f"Scraping complete!")
     print(f"Success: {success_count}")
     print(f"Errors: {error_count}")
     print(f"Total: {len(products)}")
-    print(f"HTML files saved to: {HTML_DIR}")
+    print(f"HTML stored in: {STORE_DIR}")
     print(f"{'='*60}")
 
 def get_stats():
     """Print scraping statistics"""
     conn = get_connection()
     stats = get_scrape_stats(conn)
+    failures = get_scrape_failure_summary(conn)
     conn.close()
 
     print(f"\nScraping Statistics:")
     print(f"  Total products: {stats['total']}")
     print(f"  Scraped: {stats['scraped']}")
     print(f"  Pending: {stats['pending']}")
+    print(f"  Waiting for retry: {stats['backing_off']}")
     print(f"  Progress: {stats['scraped']/stats['total']*100:.1f}%\n")
 
+    if failures:
+        print("Outstanding failures:")
+        for failure in failures:
+            print(f"  {failure['error_class']}: {failure['products']} products (up to {failure['max_attempts']} attempts)")
+        print()
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description='Scrape FedRAMP marketplace products')
     parser.add_argument('--stats', action='store_true', help='Show scraping statistics')
-    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Number of concurrent workers')
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help='Number of concurrent pages')
+    parser.add_argument('--base-url', default=BASE_URL, help='Product page base URL (e.g. a local fixture server)')
+    parser.add_argument('--tiers', default=','.join(TIERS), help='Comma-separated fetch tiers to try in order (http,browser)')
+    parser.add_argument('--ignore-backoff', action='store_true', help='Retry failed products even if their backoff has not expired')
 
     args = parser.parse_args()
 
     if args.stats:
         get_stats()
     else:
-        scrape_all_products(max_workers=args.workers)
+        scrape_all_products(max_workers=args.workers, base_url=args.base_url, tiers=tuple(args.tiers.split(',')),
+                            ignore_backoff=args.ignore_backoff)
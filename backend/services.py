@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Canonical service dictionary.
+
+Service names arrive spelled many ways: the catalog's ``all_others`` lists,
+service lists scraped from product pages and the service names Claude returns
+in ``ai_service_analysis``. They differ in whitespace, case, punctuation and
+vendor prefix ("Amazon SageMaker" / "AWS SageMaker" / " sagemaker"). Every
+spelling is normalized and resolved through ``service_aliases`` to one row in
+``canonical_services``; ``rules/service_aliases.json`` seeds renames and
+acronyms. Spellings whose normalized key is new are clustered against the
+known keys by character-trigram cosine similarity of the names without their
+vendor: prefix filtering on the rarest trigrams blocks candidate pairs through
+a sparse matrix product, so names are only ever scored against keys they share
+a rare trigram with, never all pairs. Names that clear the threshold join the
+matched service (and each other) as long as at most one vendor is involved, so
+"SageMaker" joins "Amazon SageMaker" but "Amazon Translate" and "Google
+Translate" stay apart; the rest become new services.
+
+Resolution is incremental. Known keys are a dictionary lookup, so each run
+only clusters spellings it has not seen before, and service ids are stable
+because services and aliases are only ever added. Product/service links from
+every source are written to ``product_service_links`` and ``service_id`` is
+filled in on ``product_services`` and ``ai_service_analysis`` so later stages
+can join on compact integer ids.
+"""
+
+import json
+import math
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# numpy and scipy are imported where clustering needs them, so name normalization stays cheap to import
+import metrics
+from catalog import load_catalog
+from db import get_connection, initialize_database, table_exists
+from fetch_json import OUTPUT_FILE as JSON_PATH
+
+SEED_PATH = Path(__file__).parent / "rules" / "service_aliases.json"
+
+SIMILARITY_THRESHOLD = 0.85  # trigram cosine above which two keys name the same service
+NGRAM = 3
+BLOCK_ROWS = 512  # keys scored per matrix product, bounds memory when many keys share trigrams
+
+PARENTHETICAL_RE = re.compile(r'\(([^)]*)\)')
+NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+NUMBER_RE = re.compile(r'\d+')
+# Leading vendor names and the vendor each stands for (longest spelling of a vendor first)
+VENDOR_PREFIXES = {
+    ('amazon', 'web', 'services'): 'amazon', ('amazon',): 'amazon', ('aws',): 'amazon',
+    ('microsoft',): 'microsoft', ('google', 'cloud'): 'google', ('google',): 'google',
+    ('oracle', 'cloud'): 'oracle', ('oracle',): 'oracle', ('oci',): 'oracle', ('ibm', 'cloud'): 'ibm',
+    ('ibm',): 'ibm', ('salesforce',): 'salesforce', ('servicenow',): 'servicenow', ('adobe',): 'adobe',
+}
+VENDORS = frozenset(VENDOR_PREFIXES.values())
+TRAILING_WORDS = (('service',), ('services',))
+
+
+def split_service_name(name: str) -> Tuple[str, str]:
+    """(vendor, name without the vendor) for a service name; vendor is '' when there is no vendor prefix"""
+    text = unicodedata.normalize('NFKC', PARENTHETICAL_RE.sub(' ', name or ''))
+    words = NON_ALNUM_RE.sub(' ', text.casefold().replace('&', ' and ')).split()
+
+    for suffix in TRAILING_WORDS:
+        if tuple(words[-len(suffix):]) == suffix and len(words) > len(suffix):
+            words = words[:-len(suffix)]
+    vendor = ''
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix, prefix_vendor in VENDOR_PREFIXES.items():
+            if tuple(words[:len(prefix)]) == prefix and len(words) > len(prefix):
+                words = words[len(prefix):]
+                vendor = vendor or prefix_vendor
+                stripped = True
+    return vendor, ' '.join(words)
+
+def normalize_service_name(name: str) -> str:
+    """Comparison key for a service name: its vendor, if any, then the rest (parenthetical acronyms are dropped)"""
+    vendor, rest = split_service_name(name)
+    return f"{vendor} {rest}" if vendor else rest
+
+def split_key(key: str) -> Tuple[str, str]:
+    """(vendor, name without the vendor) for a key made by normalize_service_name"""
+    vendor, _, rest = key.partition(' ')
+    return (vendor, rest) if vendor in VENDORS and rest else ('', key)
+
+def vendors_compatible(vendors: Iterable[str]) -> bool:
+    """Spellings from these vendors may name one service: at most one vendor, '' being unknown"""
+    return len(set(vendors) - {''}) <= 1
+
+def alias_keys(name: str) -> List[str]:
+    """The normalized name plus any acronym given in parentheses"""
+    keys = []
+    key = normalize_service_name(name)
+    if key:
+        keys.append(key)
+    for acronym in PARENTHETICAL_RE.findall(name or ''):
+        acronym_key = normalize_service_name(acronym)
+        if acronym_key and acronym_key not in keys:
+            keys.append(acronym_key)
+    return keys
+
+def display_name(name: str) -> str:
+    return ' '.join((name or '').split())
+
+def trigrams(key: str) -> List[str]:
+    """Character trigrams of a key with its spaces dropped, so "open ai" and "openai" compare equal"""
+    padded = f" {key.replace(' ', '')} "
+    return sorted({padded[i:i + NGRAM] for i in range(max(1, len(padded) - NGRAM + 1))})
+
+
+class TrigramIndex:
+    """
+    Binary trigram vectors of a fixed set of keys, for blocked cosine scoring
+
+    Cosine on binary sets x, y is |x ∩ y| / sqrt(|x||y|), so a pair scoring at
+    least t shares at least ceil(t² |x|) trigrams of x. Ordering every key's
+    trigrams rarest first, two such keys must share one of the first
+    ``|x| - ceil(t² |x|) + 1`` trigrams of each (the prefix); candidate pairs
+    are the nonzeros of prefix x prefix products, which only touch the short
+    posting lists of rare trigrams.
+    """
+
+    def __init__(self, keys: List[str], threshold: float = SIMILARITY_THRESHOLD):
+        self.keys = keys
+        self.threshold = threshold
+        grams = [trigrams(k) for k in keys]
+        df = Counter(g for gs in grams for g in gs)
+        # Rarest first, ties broken by the trigram itself so the order is global
+        order = {g: i for i, g in enumerate(sorted(df, key=lambda g: (df[g], g)))}
+
+        full_rows, prefix_rows = [], []
+        for gs in grams:
+            columns = sorted(order[g] for g in gs)
+            keep = len(columns) - math.ceil(threshold * threshold * len(columns)) + 1
+            full_rows.append(columns)
+            prefix_rows.append(columns[:max(1, keep)])
+        shape = (len(keys), len(order))
+        self.vectors = self._matrix(full_rows, shape, normalize=True)
+        self.prefixes = self._matrix(prefix_rows, shape)
+        self.numbers = [tuple(NUMBER_RE.findall(k)) for k in keys]
+
+    def _matrix(self, rows: List[List[int]], shape: Tuple[int, int], normalize: bool = False):
+        import numpy as np
+        from scipy import sparse
+
+        indptr = np.cumsum([0] + [len(r) for r in rows])
+        indices = np.fromiter((c for r in rows for c in r), dtype=np.int32, count=int(indptr[-1]))
+        if normalize:
+            data = np.repeat([1 / math.sqrt(len(r)) if r else 0.0 for r in rows], [len(r) for r in rows])
+        else:
+            data = np.ones(len(indices))
+        return sparse.csr_matrix((data.astype(np.float32), indices, indptr), shape=shape)
+
+    def similar_pairs(self, rows, others) -> List[Tuple[int, int, float]]:
+        """(row, other, score) for key pairs at or above the threshold; keys differing in numbers never match"""
+        import numpy as np
+
+        others_t = self.prefixes[others].T.tocsr()
+        pairs = []
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block = rows[start:start + BLOCK_ROWS]
+            candidates = self.prefixes[block].dot(others_t).tocoo()
+            left, right = block[candidates.row], others[candidates.col]
+            distinct = left != right
+            left, right = left[distinct], right[distinct]
+            if not len(left):
+                continue
+            scores = np.asarray(self.vectors[left].multiply(self.vectors[right]).sum(axis=1)).ravel()
+            keep = np.flatnonzero(scores >= self.threshold - 1e-6)
+            pairs.extend((int(left[i]), int(right[i]), float(scores[i])) for i in keep
+                         if self.numbers[left[i]] == self.numbers[right[i]])
+        return pairs
+
+
+class ServiceResolver:
+    """Resolves service spellings to canonical service ids, creating services as needed"""
+
+    def __init__(self, conn: sqlite3.Connection, threshold: float = SIMILARITY_THRESHOLD):
+        self.conn = conn
+        self.threshold = threshold
+        self.aliases: Dict[str, int] = dict(conn.execute("SELECT alias_key, service_id FROM service_aliases"))
+        self.service_keys = {row[0] for row in conn.execute("SELECT service_key FROM canonical_services")}
+        # Vendors named by each service's spellings; a service never takes spellings from a second vendor
+        self.vendors: Dict[int, set] = {}
+        for key, service_id in self.aliases.items():
+            self.vendors.setdefault(service_id, set()).add(split_key(key)[0])
+        self.created = 0
+        self.new_aliases = 0
+        self.clustered = 0
+
+    def _add_alias(self, key: str, service_id: int, alias: str, source: str, similarity: Optional[float] = None):
+        if key in self.aliases:
+            return
+        self.aliases[key] = service_id
+        self.vendors.setdefault(service_id, set()).add(split_key(key)[0])
+        self.new_aliases += 1
+        self.conn.execute(
+            "INSERT OR IGNORE INTO service_aliases (alias_key, service_id, alias, source, similarity) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, service_id, alias, source, None if similarity is None else round(similarity, 4))
+        )
+
+    def _create(self, name: str, key: str) -> int:
+        self.created += 1
+        self.service_keys.add(key)
+        cursor = self.conn.execute(
+            "INSERT INTO canonical_services (canonical_name, service_key) VALUES (?, ?)", (name, key)
+        )
+        self.vendors[cursor.lastrowid] = set()
+        return cursor.lastrowid
+
+    def lookup(self, name: Optional[str]) -> Optional[int]:
+        """Canonical id of a spelling that has already been resolved"""
+        return next((self.aliases[k] for k in alias_keys(name or '') if k in self.aliases), None)
+
+    def resolve(self, name: Optional[str], source: str) -> Optional[int]:
+        return self.resolve_many([name], source).get(display_name(name or ''))
+
+    def resolve_many(self, names: Iterable[Optional[str]], source: str) -> Dict[str, int]:
+        """
+        Canonical ids for a batch of spellings, keyed by whitespace-collapsed name
+
+        Spellings with a known key resolve directly; the rest are clustered
+        against the known keys and each other in one blocked pass.
+        """
+        counts: Counter = Counter()
+        for name, count in Counter(names).items():
+            if name and name.strip():
+                counts[display_name(name)] += count
+        resolved: Dict[str, int] = {}
+        pending: Dict[str, List[str]] = {}
+        for name in counts:
+            keys = alias_keys(name)
+            if not keys:
+                continue
+            service_id = next((self.aliases[k] for k in keys if k in self.aliases), None)
+            if service_id is None:
+                pending.setdefault(keys[0], []).append(name)
+                continue
+            resolved[name] = service_id
+            for key in keys:
+                self._add_alias(key, service_id, name, source)
+
+        if pending:
+            for key, (service_id, similarity) in self._cluster(pending, counts).items():
+                for name in pending[key]:
+                    resolved[name] = service_id
+                    for i, alias_key in enumerate(alias_keys(name)):
+                        self._add_alias(alias_key, service_id, name, source, similarity if i == 0 else None)
+        return resolved
+
+    def _cluster(self, pending: Dict[str, List[str]], counts: Counter) -> Dict[str, Tuple[int, Optional[float]]]:
+        """Service id (and match score) for each new key; unmatched groups of similar keys become new services"""
+        import numpy as np
+
+        new_keys = list(pending)
+        known_keys = list(self.aliases)
+        keys = known_keys + new_keys
+        vendor = [split_key(k)[0] for k in keys]
+        # Names are compared without their vendor; vendors are checked separately
+        index = TrigramIndex([split_key(k)[1] for k in keys], self.threshold)
+        known = np.arange(len(known_keys))
+        new = np.arange(len(known_keys), len(keys))
+
+        matches: Dict[int, Dict[int, float]] = {}
+        for row, other, score in index.similar_pairs(new, known):
+            service_id = self.aliases[keys[other]]
+            if vendors_compatible({vendor[row], *self.vendors[service_id]}):
+                found = matches.setdefault(row, {})
+                found[service_id] = max(score, found.get(service_id, 0.0))
+        # Best known service per new key; a vendorless key matching services of two vendors equally is ambiguous
+        best: Dict[int, Tuple[float, int]] = {}
+        for row, found in matches.items():
+            top = max(found.values())
+            tied = [service_id for service_id, score in found.items() if score >= top - 1e-6]
+            if vendors_compatible(v for service_id in tied for v in self.vendors[service_id]):
+                best[row] = (top, min(tied))
+
+        # Union-find over new keys, so a group seen for the first time becomes one service;
+        # groups are only joined while they span at most one vendor
+        parent = {int(row): int(row) for row in new}
+        group_vendors = {int(row): {vendor[row]} for row in new}
+        def find(row: int) -> int:
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+            return row
+        def union(row: int, other: int) -> bool:
+            row, other = find(row), find(other)
+            if row != other:
+                merged = group_vendors[row] | group_vendors[other]
+                if not vendors_compatible(merged):
+                    return False
+                parent[row] = other
+                group_vendors[other] = merged
+            return True
+
+        # "Name (ABC)" and "ABC" new in the same batch are one service
+        position = {key: int(row) for row, key in zip(new, new_keys)}
+        for row in new:
+            for name in pending[keys[row]]:
+                for acronym_key in alias_keys(name)[1:]:
+                    if acronym_key in position:
+                        union(int(row), position[acronym_key])
+        nearest: Dict[int, float] = {}
+        for row, other, score in index.similar_pairs(new, new):
+            if union(row, other):
+                nearest[row] = max(score, nearest.get(row, 0.0))
+
+        groups: Dict[int, List[int]] = {}
+        for row in new:
+            groups.setdefault(find(int(row)), []).append(int(row))
+
+        assigned: Dict[str, Tuple[int, Optional[float]]] = {}
+        for root, members in groups.items():
+            # Re-checked here because earlier groups in this batch may have given the service a vendor
+            matched = [best[row] for row in members if row in best
+                       and vendors_compatible(group_vendors[root] | self.vendors[best[row][1]])]
+            if matched:
+                service_id = max(matched)[1]
+                self.clustered += len(members)
+            else:
+                spellings = [name for row in members for name in pending[keys[row]]]
+                # Most frequent spelling names the service; ties go to the longer (vendor-prefixed) one
+                name = max(spellings, key=lambda n: (counts[n], len(n), n))
+                service_id = self._create(name, normalize_service_name(name))
+                self.clustered += len(members) - 1
+            self.vendors[service_id] |= group_vendors[root]
+            for row in members:
+                score = best[row][0] if row in best else nearest.get(row)
+                assigned[keys[row]] = (service_id, None if keys[row] in self.service_keys else score)
+        return assigned
+
+    def load_seed(self, path: Path = SEED_PATH):
+        """Make sure every seeded service and alias exists"""
+        seed = json.loads(path.read_text(encoding='utf-8'))
+        for entry in seed.get('services', []):
+            service_id = self.lookup(entry['name'])
+            if service_id is None:
+                key = normalize_service_name(entry['name'])
+                service_id = self._create(display_name(entry['name']), key)
+            for spelling in [entry['name'], *entry.get('aliases', [])]:
+                for key in alias_keys(spelling):
+                    self._add_alias(key, service_id, display_name(spelling), 'seed')
+
+
+def _add_service_id_index(conn: sqlite3.Connection, table: str):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if 'service_id' not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN service_id INTEGER REFERENCES canonical_services(id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_service ON {table}(service_id)")
+
+def _reset_if_stale(conn: sqlite3.Connection) -> bool:
+    """Drop a dictionary whose seeded aliases were keyed by an older normalization, so it is rebuilt"""
+    seeded = conn.execute("SELECT alias_key, alias FROM service_aliases WHERE source = 'seed'").fetchall()
+    if all(key in alias_keys(alias) for key, alias in seeded):
+        return False
+    for table in ('product_service_links', 'service_aliases', 'canonical_services'):
+        conn.execute(f"DELETE FROM {table}")
+    for table in ('product_services', 'ai_service_analysis'):
+        if table_exists(conn, table):
+            _add_service_id_index(conn, table)
+            conn.execute(f"UPDATE {table} SET service_id = NULL")
+    return True
+
+def build_service_index(conn: sqlite3.Connection, json_path: Path = JSON_PATH,
+                        threshold: float = SIMILARITY_THRESHOLD) -> Dict[str, int]:
+    """Resolve every service spelling and rebuild the product → service link table"""
+    if _reset_if_stale(conn):
+        print("♻️  Service keys changed since the dictionary was built; rebuilding it")
+    resolver = ServiceResolver(conn, threshold)
+    resolver.load_seed()
+
+    links = set()
+
+    # The catalog JSON
+    if json_path.exists():
+        products = load_catalog(json_path)
+        resolved = resolver.resolve_many((s for p in products for s in p.services), 'json')
+        ids = {}
+        for product in products:
+            for service in product.services:
+                if service not in ids:
+                    ids[service] = resolved.get(display_name(service))
+                if ids[service] is not None:
+                    links.add((ids[service], product.id, 'json'))
+
+    # Service lists extracted from product pages
+    _add_service_id_index(conn, 'product_services')
+    rows = conn.execute("SELECT rowid, fedramp_id, service_name, source, service_id FROM product_services").fetchall()
+    for source in {row[3] for row in rows}:
+        resolver.resolve_many((row[2] for row in rows if row[3] == source), source)
+    updates = []
+    for rowid, product_id, name, source, current_id in rows:
+        service_id = resolver.lookup(name)
+        if service_id is not None:
+            links.add((service_id, product_id, source))
+            if service_id != current_id:
+                updates.append((service_id, rowid))
+    conn.executemany("UPDATE product_services SET service_id = ? WHERE rowid = ?", updates)
+
+    # Only links that changed since the last run are written
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    existing = set(cursor.execute("SELECT service_id, product_id, source FROM product_service_links"))
+    conn.executemany("DELETE FROM product_service_links WHERE service_id = ? AND product_id = ? AND source = ?",
+                     existing - links)
+    conn.executemany("INSERT INTO product_service_links (service_id, product_id, source) VALUES (?, ?, ?)",
+                     sorted(links - existing))
+
+    # Services Claude classified; only rows written since the last run need an id
+    linked = 0
+    if table_exists(conn, 'ai_service_analysis'):
+        _add_service_id_index(conn, 'ai_service_analysis')
+        rows = conn.execute(
+            "SELECT id, service_name FROM ai_service_analysis WHERE service_id IS NULL"
+        ).fetchall()
+        ids = resolver.resolve_many((row[1] for row in rows), 'analysis')
+        updates = [(ids[display_name(name)], row_id) for row_id, name in rows if display_name(name or '') in ids]
+        conn.executemany("UPDATE ai_service_analysis SET service_id = ? WHERE id = ?", updates)
+        linked = len(updates)
+
+    return {
+        'services': conn.execute("SELECT COUNT(*) FROM canonical_services").fetchone()[0],
+        'created': resolver.created,
+        'aliases_added': resolver.new_aliases,
+        'clustered': resolver.clustered,
+        'links': len(links),
+        'analysis_rows_linked': linked,
+    }
+
+def get_service_aliases(conn: sqlite3.Connection, service_id: int) -> List[str]:
+    """Every spelling recorded for a canonical service"""
+    return [row[0] for row in conn.execute(
+        "SELECT alias FROM service_aliases WHERE service_id = ? ORDER BY alias", (service_id,)
+    )]
+
+def main(threshold: float = SIMILARITY_THRESHOLD) -> int:
+    print("🧩 Building canonical service dictionary")
+    print("=" * 60)
+
+    initialize_database()
+    conn = get_connection()
+    start = time.perf_counter()
+    try:
+        with conn:
+            stats = build_service_index(conn, threshold=threshold)
+    finally:
+        conn.close()
+
+    metrics.add('stage_items_processed', stats['aliases_added'])
+    metrics.record_rows('canonical_services', 'insert', stats['created'])
+    metrics.record_rows('service_aliases', 'insert', stats['aliases_added'])
+    metrics.record_rows('product_service_links', 'replace', stats['links'])
+    metrics.record_rows('ai_service_analysis', 'update', stats['analysis_rows_linked'])
+    print(f"✓ Services: {stats['services']} ({stats['created']} new, {stats['aliases_added']} new aliases, "
+          f"{stats['clustered']} merged by similarity)")
+    print(f"✓ Product/service links: {stats['links']}")
+    print(f"✓ AI analysis rows linked: {stats['analysis_rows_linked']}")
+    print(f"⏱️  {time.perf_counter() - start:.2f}s")
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD,
+                        help='Trigram cosine at which two spellings are clustered as one service')
+    exit(main(threshold=parser.parse_args().threshold))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+TF-IDF similarity between agency AI usage and FedRAMP products.
+
+Recommends products for agencies that describe a capability without naming a
+vendor. Product documents (name, provider, description, service names and the
+Claude analysis excerpts) and agency documents (solution type, notes, tool
+name and purpose) become L2-normalized TF-IDF vectors over the product
+vocabulary, and every agency is scored against every product with one sparse
+matrix product per block of agencies. The top-k products per agency are
+stored in ``agency_product_similarity``. Runs fully offline.
+"""
+
+import math
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+import metrics
+from catalog import load_catalog
+from db import get_connection, initialize_database, table_exists
+from fetch_json import OUTPUT_FILE as JSON_PATH
+
+TOP_K = 10
+MIN_SCORE = 0.1
+AGENCY_BLOCK = 1024  # agencies scored per matrix product, bounds memory for large corpora
+TOP_TERMS = 3
+MAX_DF = 0.5  # terms in more than this share of products say little and make the score matrix dense
+
+TOKEN_RE = re.compile(r'[a-z][a-z0-9]+')
+STOP_WORDS = frozenset('''
+    a an and are as at be by for from has have in is it its of on or that the their this to was were
+    will with which who use used using uses via per not no all any can may also into our your more most
+    other than such these those new one two agency agencies federal government service services
+    solution solutions system systems
+'''.split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stop words"""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+class TfidfModel:
+    """Vocabulary and inverse document frequencies fitted on the product corpus"""
+
+    def __init__(self, documents: Sequence[str], max_df: float = MAX_DF):
+        df = Counter()
+        for doc in documents:
+            df.update(set(tokenize(doc)))
+
+        n = len(documents)
+        limit = max(1, max_df * n)
+        self.terms = sorted(term for term, count in df.items() if count <= limit)
+        self.vocabulary: Dict[str, int] = {term: column for column, term in enumerate(self.terms)}
+        self.idf = np.array([math.log((1 + n) / (1 + df[term])) + 1 for term in self.terms], dtype=np.float32)
+
+    def transform(self, documents: Sequence[str]) -> sparse.csr_matrix:
+        """Rows of sublinear TF x IDF, L2-normalized; unknown terms are dropped"""
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for doc in documents:
+            counts = Counter(self.vocabulary[t] for t in tokenize(doc) if t in self.vocabulary)
+            indices.extend(counts.keys())
+            data.extend(1 + math.log(c) for c in counts.values())
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(documents), len(self.vocabulary)),
+        )
+        matrix.data *= self.idf[matrix.indices]
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def top_k_similar(agency_vectors: sparse.csr_matrix, product_vectors: sparse.csr_matrix,
+                  top_k: int = TOP_K, min_score: float = MIN_SCORE) -> List[List[Tuple[int, float]]]:
+    """For each agency row, the (product row, cosine score) pairs of its top-k products"""
+    product_t = product_vectors.T.tocsr()
+    results = []
+    for start in range(0, agency_vectors.shape[0], AGENCY_BLOCK):
+        scores = agency_vectors[start:start + AGENCY_BLOCK].dot(product_t).tocsr()
+        for row in range(scores.shape[0]):
+            lo, hi = scores.indptr[row], scores.indptr[row + 1]
+            values = scores.data[lo:hi]
+            columns = scores.indices[lo:hi]
+            keep = values >= min_score
+            values, columns = values[keep], columns[keep]
+            if len(values) > top_k:
+                best = np.argpartition(-values, top_k)[:top_k]
+                values, columns = values[best], columns[best]
+            order = np.argsort(-values, kind='stable')
+            results.append([(int(columns[i]), float(values[i])) for i in order])
+    return results
+
+def shared_terms(model: TfidfModel, agency_row: sparse.csr_matrix, product_row: sparse.csr_matrix,
+                 limit: int = TOP_TERMS) -> List[str]:
+    """Terms contributing most to one agency/product score"""
+    contribution = agency_row.multiply(product_row).tocsr()
+    order = np.argsort(-contribution.data)[:limit]
+    return [model.terms[contribution.indices[i]] for i in order]
+
+
+def create_similarity_table(conn):
+    """Create table to store agency-to-product similarity recommendations."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS agency_product_similarity (
+            agency_id INTEGER NOT NULL,
+            product_id TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            score REAL NOT NULL,
+            provider_name TEXT,
+            product_name TEXT,
+            shared_terms TEXT,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (agency_id, product_id),
+            FOREIGN KEY (agency_id) REFERENCES agency_ai_usage(id)
+        )
+    ''')
+    conn.commit()
+
+def _product_documents(conn, products) -> List[str]:
+    excerpts: Dict[str, List[str]] = {}
+    for product_id, service, excerpt in conn.execute('''
+        SELECT product_id, service_name, relevant_excerpt FROM ai_service_analysis
+    '''):
+        excerpts.setdefault(product_id, []).extend(filter(None, (service, excerpt)))
+
+    return [
+        ' '.join([p.cso, p.csp, p.service_desc, *p.services, *excerpts.get(p.id, [])])
+        for p in products
+    ]
+
+def _agency_documents(conn) -> Tuple[List[int], List[str]]:
+    rows = conn.execute('''
+        SELECT id, solution_type, notes, tool_name, tool_purpose, llm_name
+        FROM agency_ai_usage
+    ''').fetchall()
+    return [row[0] for row in rows], [' '.join(filter(None, row[1:])) for row in rows]
+
+def compute_similarity(top_k: int = TOP_K, min_score: float = MIN_SCORE) -> Dict[str, float]:
+    """Score every agency against every product and replace the stored recommendations"""
+    initialize_database()
+    conn = get_connection()
+
+    try:
+        create_similarity_table(conn)
+        products = load_catalog(JSON_PATH)
+        agency_ids, agency_docs = _agency_documents(conn)
+
+        start = time.perf_counter()
+        product_docs = _product_documents(conn, products)
+        model = TfidfModel(product_docs)
+        product_vectors = model.transform(product_docs)
+        agency_vectors = model.transform(agency_docs)
+        results = top_k_similar(agency_vectors, product_vectors, top_k, min_score)
+        elapsed = time.perf_counter() - start
+
+        rows = []
+        for agency_row, (agency_id, ranked) in enumerate(zip(agency_ids, results)):
+            for rank, (product_row, score) in enumerate(ranked, start=1):
+                product = products[product_row]
+                terms = shared_terms(model, agency_vectors[agency_row], product_vectors[product_row])
+                rows.append((agency_id, product.id, rank, round(score, 4), product.csp, product.cso, ', '.join(terms)))
+
+        with conn:
+            conn.execute('DELETE FROM agency_product_similarity')
+            conn.executemany('''
+                INSERT INTO agency_product_similarity
+                (agency_id, product_id, rank, score, provider_name, product_name, shared_terms)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+    finally:
+        conn.close()
+
+    with_results = sum(1 for ranked in results if ranked)
+    print(f"✓ Scored {len(agency_ids)} agencies x {len(products)} products "
+          f"({len(model.vocabulary)} terms) in {elapsed:.2f}s")
+    print(f"✓ Stored {len(rows)} recommendations for {with_results} agencies (top {top_k}, score ≥ {min_score})")
+    metrics.add('stage_items_processed', len(agency_ids))
+    metrics.record_rows('agency_product_similarity', 'replace', len(rows))
+    return {'agencies': len(agency_ids), 'products': len(products), 'rows': len(rows), 'seconds': elapsed}
+
+def benchmark(agencies: int = 5000, products: int = 50000, top_k: int = TOP_K, seed: int = 0) -> float:
+    """Score a synthetic Zipf-distributed corpus (no database) and report the time taken"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"term{i}" for i in range(20000)])
+    weights = 1 / np.arange(1, len(words) + 1)
+    weights /= weights.sum()
+
+    def corpus(count: int, length: int) -> List[str]:
+        return [' '.join(rng.choice(words, size=length, p=weights)) for _ in range(count)]
+
+    product_docs = corpus(products, 60)
+    agency_docs = corpus(agencies, 25)
+
+    start = time.perf_counter()
+    model = TfidfModel(product_docs)
+    product_vectors = model.transform(product_docs)
+    agency_vectors = model.transform(agency_docs)
+    fitted = time.perf_counter()
+    results = top_k_similar(agency_vectors, product_vectors, top_k, min_score=0.0)
+    elapsed = time.perf_counter() - start
+
+    print(f"📊 {agencies} agencies x {products} products, {len(model.vocabulary)} terms")
+    print(f"   Vectorize: {fitted - start:.2f}s, score + top-{top_k}: {elapsed - (fitted - start):.2f}s, "
+          f"total {elapsed:.2f}s ({sum(len(r) for r in results)} pairs kept)")
+    return elapsed
+
+def main(top_k: int = TOP_K, min_score: float = MIN_SCORE) -> int:
+    print("🧮 TF-IDF Similarity: Agency AI Usage → FedRAMP Products")
+    print("=" * 60)
+
+    conn = get_connection()
+    has_agencies = table_exists(conn, 'agency_ai_usage')
+    conn.close()
+    if not has_agencies:
+        print("❌ No agency data loaded; run load_agency_data.py first")
+        return 1
+
+    compute_similarity(top_k=top_k, min_score=min_score)
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Recommend FedRAMP products to agencies by text similarity')
+    parser.add_argument('--top-k', type=int, default=TOP_K, help='Products kept per agency')
+    parser.add_argument('--min-score', type=float, default=MIN_SCORE, help='Minimum cosine similarity')
+    parser.add_argument('--bench', action='store_true', help='Benchmark on a synthetic corpus instead')
+    parser.add_argument('--agencies', type=int, default=5000, help='Synthetic agencies for --bench')
+    parser.add_argument('--products', type=int, default=50000, help='Synthetic products for --bench')
+
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(agencies=args.agencies, products=args.products, top_k=args.top_k)
+        exit(0)
+    exit(main(top_k=args.top_k, min_score=args.min_score))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Synthetic FedRAMP data for benchmarks
+
+Generates catalogs in the shape of the GSA ``data.json`` feed, matching
+marketplace CSV exports and agency GenAI workbooks at any scale, from the
+real catalog's ~615 products up to 100k products with millions of services.
+Sizes follow the real data: a few large providers own most offerings, service
+counts per product are heavy-tailed (most list a handful, hyperscalers list
+hundreds) and only a small share of services are AI-related. Output is
+deterministic for a given seed and written incrementally, so large catalogs
+never sit in memory.
+"""
+import csv
+import json
+import math
+import random
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+REAL_CATALOG_SIZE = 615
+SCALES = {'real': REAL_CATALOG_SIZE, 'small': 5000, 'medium': 25000, 'large': 100000}
+
+# (provider, weight, branded AI services)
+PROVIDERS = [
+    ('Microsoft Corporation', 12, ['Azure OpenAI Service', 'Microsoft Copilot', 'Azure AI Search', 'Azure Machine Learning']),
+    ('Amazon Web Services', 12, ['Amazon Bedrock', 'Amazon SageMaker', 'Amazon Q', 'Amazon Comprehend']),
+    ('Google LLC', 8, ['Vertex AI', 'Gemini for Google Workspace', 'Document AI', 'Dialogflow']),
+    ('Oracle America, Inc.', 5, ['OCI Generative AI', 'OCI Data Science']),
+    ('Salesforce, Inc.', 5, ['Einstein GPT', 'Einstein Copilot']),
+    ('IBM Corporation', 4, ['watsonx.ai', 'Watson Assistant']),
+    ('ServiceNow, Inc.', 4, ['Now Assist', 'Predictive Intelligence']),
+    ('Adobe Inc.', 2, ['Adobe Firefly', 'Sensei GenAI']),
+]
+LONG_TAIL_WEIGHT = 48  # share of offerings from small vendors
+
+SERVICE_PREFIXES = ['Managed', 'Elastic', 'Secure', 'Cloud', 'Enterprise', 'Virtual', 'Distributed', 'Serverless',
+                    'Global', 'Private', 'Hybrid', 'Dedicated', 'Federated', 'Scalable', 'Automated']
+SERVICE_NOUNS = ['Storage', 'Compute', 'Database', 'Queue', 'Gateway', 'Directory', 'Backup', 'Firewall', 'Monitor',
+                 'Analytics', 'Email', 'Workflow', 'Registry', 'Cache', 'Load Balancer', 'DNS', 'Key Vault', 'CDN',
+                 'Identity', 'Ticketing', 'Search', 'Messaging', 'File Share', 'Scheduler', 'Data Lake']
+GENERIC_AI_SERVICES = ['Machine Learning Studio', 'Speech to Text', 'Text Translation', 'Computer Vision API',
+                       'AI Assistant', 'LLM Gateway', 'Generative Document Summarizer', 'Chatbot Builder']
+AI_SHARE = 0.05  # fraction of a product's services that are AI-related
+
+OFFERING_KINDS = ['Government', 'GovCloud', 'Commercial', 'Cloud', 'Enterprise', 'Platform', 'Federal']
+IMPACT_LEVELS = [['Low'], ['Moderate'], ['Moderate'], ['High'], ['LI-SaaS']]
+STATUSES = ['FedRAMP Authorized'] * 8 + ['FedRAMP In Process', 'FedRAMP Ready']
+AGENCIES = [
+    'Department of Defense', 'Department of Homeland Security', 'Department of Energy', 'Department of State',
+    'Department of Veterans Affairs', 'Department of Health and Human Services', 'Department of the Treasury',
+    'Department of Justice', 'Department of Commerce', 'Department of Labor', 'Department of Education',
+    'Department of Agriculture', 'Department of the Interior', 'Department of Transportation',
+    'General Services Administration', 'National Aeronautics and Space Administration',
+    'Environmental Protection Agency', 'Social Security Administration', 'Small Business Administration',
+    'Office of Personnel Management', 'Nuclear Regulatory Commission', 'National Science Foundation',
+]
+SUB_AGENCIES = ['Office of the CIO', 'Headquarters', 'Field Operations', 'Research Division', None, None]
+
+AGENCY_SOLUTIONS = [
+    ('Commercial (Microsoft Copilot / Azure OpenAI)', "Staff use 'AgencyGPT' built on Azure Government"),
+    ('Commercial (AWS Bedrock)', 'Claude models in GovCloud for drafting'),
+    ('Google Gemini', 'Vertex AI pilot for document review'),
+    ('Custom (internally hosted)', 'Open-weight models on premises'),
+    ('Salesforce Einstein', 'Case summarization in the contact center'),
+    ('IBM watsonx', 'Assistant for HR questions'),
+    ('ServiceNow Now Assist', 'IT ticket triage'),
+    ('Commercial (OpenAI ChatGPT Enterprise)', "Pilot of 'ChatGPT' for a small group"),
+    ('None', 'No staff chatbot approved yet'),
+]
+TOOL_PURPOSES = ['Fraud detection', 'Document classification', 'Translation', 'Claims triage', 'Code review',
+                 'Call transcription', 'Image analysis', 'Forecasting', 'Records search']
+
+
+def _weighted_provider(rng: random.Random, index: int) -> tuple:
+    total = sum(weight for _, weight, _ in PROVIDERS) + LONG_TAIL_WEIGHT
+    pick = rng.uniform(0, total)
+    for provider in PROVIDERS:
+        pick -= provider[1]
+        if pick <= 0:
+            return provider
+    return (f"Vendor {index % 5000} LLC", 0, [])
+
+def _service_count(rng: random.Random, branded: bool) -> int:
+    """Heavy-tailed services per product: median ~8, a long tail into the hundreds"""
+    count = int(math.exp(rng.gauss(2.1, 1.1)))
+    if branded:
+        count *= 3
+    return max(1, min(count, 1500))
+
+def _services(rng: random.Random, count: int, ai_services: List[str]) -> List[str]:
+    services = []
+    for i in range(count):
+        if rng.random() < AI_SHARE:
+            services.append(rng.choice(ai_services or GENERIC_AI_SERVICES))
+        else:
+            services.append(f"{rng.choice(SERVICE_PREFIXES)} {rng.choice(SERVICE_NOUNS)} {i // 375 or ''}".strip())
+    return list(dict.fromkeys(services))
+
+def _authorizations(rng: random.Random) -> List[Dict[str, Optional[str]]]:
+    count = min(int(rng.expovariate(1 / 3)), 40)
+    return [{'agency_name': agency, 'sub_agency': rng.choice(SUB_AGENCIES)}
+            for agency in rng.sample(AGENCIES, min(count, len(AGENCIES)))]
+
+def iter_synthetic_products(count: int, seed: int = 0) -> Iterator[dict]:
+    """Products in the catalog's JSON shape"""
+    rng = random.Random(seed)
+    for i in range(count):
+        csp, _, ai_services = _weighted_provider(rng, i)
+        kind = rng.choice(OFFERING_KINDS)
+        cso = f"{csp.split(',')[0].split(' ')[0]} {kind} Offering {i}"
+        services = _services(rng, _service_count(rng, bool(ai_services)), ai_services)
+        year, month, day = rng.randint(2014, 2025), rng.randint(1, 12), rng.randint(1, 28)
+        yield {
+            'id': f"FR{i:07d}",
+            'csp': csp,
+            'cso': cso,
+            'service_desc': f"{cso} provides {', '.join(services[:3]).lower()} for federal customers.",
+            'status': rng.choice(STATUSES),
+            'impact_level': rng.choice(IMPACT_LEVELS),
+            'auth_date': f"{year}-{month:02d}-{day:02d}",
+            'agency_authorizations': _authorizations(rng),
+            'all_others': services,
+        }
+
+def write_catalog(path: Path, count: int, seed: int = 0) -> Dict[str, int]:
+    """Write a synthetic catalog, one product at a time; returns product and service counts"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    services = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"data": {"Products": [')
+        for i, product in enumerate(iter_synthetic_products(count, seed)):
+            f.write((',\n' if i else '\n') + json.dumps(product))
+            services += len(product['all_others'])
+        f.write('\n]}}\n')
+    return {'products': count, 'services': services}
+
+def write_marketplace_csv(path: Path, count: int, seed: int = 0) -> int:
+    """Write the marketplace CSV export for the same products: one row per authorizing agency"""
+    from load_csv import PRODUCT_COLUMNS
+
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(PRODUCT_COLUMNS)
+        for product in iter_synthetic_products(count, seed):
+            base = {
+                'FedRAMP ID': product['id'],
+                'Cloud Service Provider': product['csp'],
+                'Cloud Service Offering': product['cso'],
+                'Service Description': product['service_desc'],
+                'Service Model': 'SaaS',
+                'Status': product['status'],
+                'Authorizations': str(len(product['agency_authorizations'])),
+                'ATO Issuance Date': product['auth_date'],
+            }
+            for auth in product['agency_authorizations'] or [{'agency_name': '', 'sub_agency': None}]:
+                row = dict(base, **{'Parent Agency': auth['agency_name'], 'Sub Agency': auth['sub_agency'] or ''})
+                writer.writerow([row.get(header, '') for header in PRODUCT_COLUMNS])
+                rows += 1
+    return rows
+
+def write_agency_workbook(path: Path, agencies: int, seed: int = 0) -> int:
+    """Write an agency GenAI workbook with a staff LLM row and a few specialized tools per agency"""
+    import openpyxl
+
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    staff = wb.create_sheet('Staff LLMs & Coding')
+    staff.append(['Agency/Department', 'Has staff LLM chatbot?', 'Has AI coding assistant?', 'Scope',
+                  'Solution type', 'Non-public info allowed?', 'Other AI (non‑chat) present?',
+                  'Notes/Comments', 'Sources'])
+    specialized = wb.create_sheet('Specialized AI (Non-chat)')
+    specialized.append(['Agency/Department', 'Tool / Capability', 'Purpose', 'Custom or Commercial', 'Scope',
+                        'Non-public info allowed?', 'Sources'])
+
+    rows = 0
+    for i in range(agencies):
+        name = AGENCIES[i] if i < len(AGENCIES) else f"{rng.choice(AGENCIES)} Component {i}"
+        solution, notes = rng.choice(AGENCY_SOLUTIONS)
+        staff.append([name, rng.choice(['Yes', 'No', 'Pilot']), rng.choice(['Yes', 'No']), 'Agency-wide',
+                      solution, rng.choice(['Yes', 'No']), 'Yes', notes, 'https://example.gov/ai'])
+        rows += 1
+        for t in range(rng.randint(0, 3)):
+            tool_solution, _ = rng.choice(AGENCY_SOLUTIONS)
+            specialized.append([name, f"Tool {t}: {rng.choice(TOOL_PURPOSES)}", rng.choice(TOOL_PURPOSES),
+                                tool_solution, 'Program', 'No', 'https://example.gov/inventory'])
+            rows += 1
+    wb.save(path)
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate synthetic FedRAMP catalogs, CSV exports and agency workbooks')
+    parser.add_argument('output', type=Path, help='Directory to write into')
+    parser.add_argument('--products', default='real', help=f"Product count or scale name ({', '.join(SCALES)})")
+    parser.add_argument('--agencies', type=int, default=200, help='Agencies in the workbook')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    count = SCALES.get(args.products) or int(args.products)
+
+    counts = write_catalog(args.output / f"catalog-{count}.json", count, args.seed)
+    print(f"✓ Catalog: {counts['products']} products, {counts['services']} services")
+    rows = write_marketplace_csv(args.output / f"marketplace-{count}.csv", count, args.seed)
+    print(f"✓ Marketplace CSV: {rows} rows")
+    rows = write_agency_workbook(args.output / f"agencies-{args.agencies}.xlsx", args.agencies, args.seed)
+    print(f"✓ Agency workbook: {rows} rows")
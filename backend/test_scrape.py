@@ -1,49 +1,78 @@
-"""Test script to scrape a single product"""
-from playwright.sync_api import sync_playwright
+"""Test script to scrape product pages through the browser pool
+
+By default this hits the live marketplace for a single product. With
+--fixtures DIR it instead serves DIR/{FEDRAMP_ID}.html from a local stub
+server and scrapes every fixture, which exercises the pool without network
+access.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
-HTML_DIR = Path(__file__).parent.parent / "data" / "html"
-HTML_DIR.mkdir(parents=True, exist_ok=True)
+from scraper import BrowserPool, BASE_URL
+
+DEFAULT_ID = "FR2513049676"
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Serves /products/{id} from {fixtures}/{id}.html"""
+
+    def translate_path(self, path):
+        name = path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+        return str(Path(self.directory) / f"{name}.html")
 
-fedramp_id = "FR2513049676"
-url = f"https://marketplace.fedramp.gov/products/{fedramp_id}"
+    def log_message(self, format, *args):
+        pass
 
-print(f"Testing scrape of {url}...")
 
-with sync_playwright() as p:
-    print("Launching browser...")
-    browser = p.chromium.launch(headless=True)
-    context = browser.new_context(
-        user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-    )
-    page = context.new_page()
+def start_fixture_server(fixtures: Path) -> ThreadingHTTPServer:
+    """Start a stub server on a free port in a background thread"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(FixtureHandler, directory=str(fixtures)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
-    print(f"Navigating to {url}...")
-    response = page.goto(url, wait_until='domcontentloaded', timeout=30000)
 
-    print(f"Response status: {response.status}")
+async def scrape(base_url: str, fedramp_ids, workers: int):
+    async with BrowserPool(max_pages=workers) as pool:
+        async def one(fedramp_id):
+            status, html, _ = await pool.fetch(f"{base_url}/{fedramp_id}")
+            print(f"  {fedramp_id}: status={status} bytes={len(html)}")
 
-    # Accept 200-299 status codes
-    if 200 <= response.status < 300:
-        print("Waiting for page to load completely...")
-        # Wait for the main heading to appear
-        try:
-            page.wait_for_selector('h1', timeout=10000)
-            print("Page content loaded!")
-        except:
-            print("Timeout waiting for content, but continuing...")
+        start = time.perf_counter()
+        await asyncio.gather(*(one(fedramp_id) for fedramp_id in fedramp_ids))
+        elapsed = time.perf_counter() - start
 
-        page.wait_for_timeout(3000)
+    print(f"Scraped {len(fedramp_ids)} pages in {elapsed:.2f}s ({len(fedramp_ids) / elapsed:.1f} pages/s)")
 
-        html_content = page.content()
-        print(f"Got HTML content ({len(html_content)} bytes)")
 
-        html_path = HTML_DIR / f"{fedramp_id}.html"
-        html_path.write_text(html_content, encoding='utf-8')
-        print(f"Saved to {html_path}")
-        print(f"File exists: {html_path.exists()}")
+def main():
+    parser = argparse.ArgumentParser(description='Test the product page scraper')
+    parser.add_argument('ids', nargs='*', help='FedRAMP IDs to scrape')
+    parser.add_argument('--fixtures', type=Path, help='Serve HTML fixtures from this directory instead of the live site')
+    parser.add_argument('--workers', type=int, default=5, help='Concurrent pages')
+
+    args = parser.parse_args()
+
+    if args.fixtures:
+        server = start_fixture_server(args.fixtures)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/products"
+        fedramp_ids = args.ids or sorted(p.stem for p in args.fixtures.glob('*.html'))
     else:
-        print(f"Failed with status {response.status}")
+        server = None
+        base_url = BASE_URL
+        fedramp_ids = args.ids or [DEFAULT_ID]
+
+    print(f"Testing scrape of {len(fedramp_ids)} pages from {base_url}...")
+    try:
+        asyncio.run(scrape(base_url, fedramp_ids, args.workers))
+    finally:
+        if server:
+            server.shutdown()
+
 
-    browser.close()
-    print("Done!")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""Shared fixtures: the backend modules are flat, so put them on the path."""
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """An empty, initialized database in a temp dir (never data/fedramp.db)."""
+    monkeypatch.setattr(db, 'DB_PATH', tmp_path / 'fedramp.db')
+    with contextlib.redirect_stdout(io.StringIO()):
+        db.initialize_database()
+    return db.DB_PATH
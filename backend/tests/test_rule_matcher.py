@@ -0,0 +1,21 @@
+"""Provider/service rule matching."""
+from match_agencies_to_services import _AgencySignals
+from rule_matcher import load_rules
+
+
+def test_nested_alias_counts_once():
+    rules = load_rules()
+    for text, provider, alias in [('google cloud vertex ai', 'Google', 'google cloud'),
+                                  ('microsoft 365', 'Microsoft', 'microsoft 365')]:
+        signals = _AgencySignals(text, rules)
+        assert signals.provider_mentions == {provider: [alias]}
+        assert signals.score(provider, [])[1].endswith('[score 1]')
+
+
+def test_word_boundaries():
+    rules = load_rules()
+    assert rules.names('new laws on chatgpt', 'providers') == []
+    assert rules.names('uses ChatGPT', 'services') == ['gpt']
+    assert rules.names('GPT4 and gpt-4o pilots', 'services') == ['gpt']
+    assert [h.pattern for h in rules.find_all('GPT4', 'services')] == ['gpt']
+    assert rules.names('gptx', 'services') == []
@@ -0,0 +1,56 @@
+"""Browser tier start-up failures."""
+import asyncio
+
+import pytest
+
+pytest.importorskip('playwright')
+
+import scraper  # noqa: E402
+
+
+class _Driver:
+    def __init__(self):
+        self.stopped = False
+        self.chromium = self
+
+    async def launch(self, headless=True):
+        raise RuntimeError('no chromium')
+
+    async def stop(self):
+        self.stopped = True
+
+
+def test_failed_launch_stops_driver(monkeypatch):
+    driver = _Driver()
+
+    class _Starter:
+        async def start(self):
+            return driver
+
+    monkeypatch.setattr('playwright.async_api.async_playwright', _Starter)
+    with pytest.raises(RuntimeError, match='no chromium'):
+        asyncio.run(scraper.BrowserPool().__aenter__())
+    assert driver.stopped
+
+
+def test_failed_launch_is_not_retried(monkeypatch):
+    launches = []
+
+    class _Pool:
+        def __init__(self, max_pages):
+            pass
+
+        async def __aenter__(self):
+            launches.append(1)
+            raise RuntimeError('no chromium')
+
+    monkeypatch.setattr(scraper, 'BrowserPool', _Pool)
+
+    async def run():
+        fetcher = scraper.TieredFetcher(tiers=('browser',))
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                await fetcher.fetch('https://example.invalid/product')
+
+    asyncio.run(run())
+    assert len(launches) == 1
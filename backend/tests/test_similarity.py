@@ -0,0 +1,31 @@
+"""TF-IDF agency/product recommendations."""
+import pytest
+
+pytest.importorskip('scipy')
+
+import catalog  # noqa: E402
+import db  # noqa: E402
+import load_agency_data  # noqa: E402
+import similarity  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def test_uses_current_database(database, tmp_path, monkeypatch, capsys):
+    catalog_path = tmp_path / 'catalog.json'
+    synthetic.write_catalog(catalog_path, 20)
+    monkeypatch.setattr(similarity, 'JSON_PATH', catalog_path)
+    monkeypatch.setattr(catalog, 'CACHE_DIR', tmp_path / 'cache')
+
+    conn = db.get_connection()
+    load_agency_data.create_tables(conn)
+    with conn:
+        conn.execute("""
+            INSERT INTO agency_ai_usage (agency_name, agency_category, solution_type, notes)
+            VALUES ('Test Agency', 'staff_llm', 'Azure OpenAI', 'chat assistant for staff')
+        """)
+    conn.close()
+
+    assert similarity.main() == 0
+    conn = db.get_connection()
+    assert db.table_exists(conn, 'agency_product_similarity')
+    conn.close()
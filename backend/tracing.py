@@ -0,0 +1,321 @@
+"""
+Tracing spans and an opt-in profiler for the pipeline
+
+Spans are nested timing records (``with tracing.span('name', key=value):`` or
+``@tracing.traced()``) that cover each stage and its per-item work. When
+tracing is configured they are written as JSON lines in the OTLP/JSON shape
+(one ``resourceSpans`` export request per line), which the OpenTelemetry
+collector's ``otlpjsonfile`` receiver and most trace viewers read directly.
+Until ``configure`` is called every span is a shared no-op object, so the
+instrumentation costs one global lookup per call.
+
+``profile`` wraps a block in either a sampling profiler over all threads,
+written as folded stacks for flamegraph.pl / speedscope, or in cProfile
+(``.pstats``/``.prof`` paths, calling thread only).
+"""
+import atexit
+import contextvars
+import cProfile
+import functools
+import inspect
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+TRACE_DIR = Path(__file__).parent.parent / "data" / "traces"
+PROFILE_DIR = Path(__file__).parent.parent / "data" / "profiles"
+SERVICE_NAME = 'fedai'
+FLUSH_EVERY = 256          # spans buffered before a line is written
+SAMPLE_INTERVAL = 0.005    # seconds between stack samples
+
+# OTLP enum values
+SPAN_KIND_INTERNAL = 1
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+
+def _any_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _attributes(values: Dict[str, Any]) -> list:
+    return [{'key': key, 'value': _any_value(value)} for key, value in values.items() if value is not None]
+
+
+class Span:
+    """A timed operation; use as a context manager"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes',
+                 'error', 'events', '_token')
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.events: list = []
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"
+        self.events.append({
+            'timeUnixNano': str(time.time_ns()),
+            'name': 'exception',
+            'attributes': _attributes({'exception.type': type(exc).__name__, 'exception.message': str(exc)}),
+        })
+
+    def __enter__(self) -> 'Span':
+        parent = _current.get()
+        if parent is None:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_id = ''
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None and not self.error:
+            self.record_error(exc)
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'kind': SPAN_KIND_INTERNAL,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _attributes(self.attributes),
+            'status': {'code': STATUS_CODE_ERROR, 'message': self.error} if self.error else {'code': STATUS_CODE_OK},
+        }
+        if self.events:
+            span['events'] = self.events
+        return span
+
+
+class _NoopSpan:
+    """Stands in for every span while tracing is off"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, exc: BaseException):
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonlExporter:
+    """Buffers finished spans and appends them to a file as OTLP/JSON export requests"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.spans = []
+        self.lock = threading.Lock()
+        self.resource = {'attributes': _attributes({
+            'service.name': SERVICE_NAME,
+            'host.name': socket.gethostname(),
+            'process.pid': os.getpid(),
+            'process.command_line': ' '.join(sys.argv),
+        })}
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.spans:
+            return
+        request = {'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{'scope': {'name': SERVICE_NAME}, 'spans': [s.to_otlp() for s in self.spans]}],
+        }]}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(request, separators=(',', ':')) + '\n')
+        self.spans = []
+
+
+_exporter: Optional[JsonlExporter] = None
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('fedai_span', default=None)
+
+
+def configure(path: Optional[Path] = None) -> Path:
+    """Start writing spans to path (default: a new file under data/traces/)"""
+    global _exporter
+    if path is None:
+        path = TRACE_DIR / f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl"
+    shutdown()
+    _exporter = JsonlExporter(Path(path))
+    return _exporter.path
+
+def shutdown():
+    """Flush buffered spans and turn tracing off"""
+    global _exporter
+    if _exporter is not None:
+        _exporter.flush()
+        _exporter = None
+
+atexit.register(shutdown)
+
+def enabled() -> bool:
+    return _exporter is not None
+
+def span(name: str, **attributes):
+    """Context manager timing a block as a child of the current span"""
+    if _exporter is None:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+def current_span():
+    """The innermost open span (a no-op span when tracing is off or none is open)"""
+    if _exporter is None:
+        return NOOP_SPAN
+    return _current.get() or NOOP_SPAN
+
+def traced(name: Optional[str] = None):
+    """Decorator: run each call of the function (sync or async) in a span"""
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if _exporter is None:
+                    return await fn(*args, **kwargs)
+                with Span(span_name, {}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _exporter is None:
+                return fn(*args, **kwargs)
+            with Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def propagate(fn):
+    """
+    Bind fn to the current context before handing it to another thread
+
+    Thread pools don't inherit context variables; wrap each submitted call
+    (``executor.submit(tracing.propagate(work), item)``) so its spans nest
+    under the submitting span and its metrics count toward the running stage.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks of every other thread and counts them as folded stacks"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name='stack-sampler', daemon=True)
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.counts[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path: Path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def profile(path: Path, interval: float = SAMPLE_INTERVAL):
+    """
+    Profile a block into path
+
+    ``.pstats``/``.prof`` paths get a cProfile dump of the calling thread (open
+    with snakeviz or flameprof); anything else gets folded stacks sampled from
+    all threads every ``interval`` seconds (flamegraph.pl, speedscope).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if path.suffix in ('.pstats', '.prof'):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            print(f"🔥 cProfile stats written to {path}")
+        return
+
+    sampler = StackSampler(interval)
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        sampler.write(path)
+        print(f"🔥 {sampler.samples} stack samples written to {path} (folded stacks)")
@@ -1,6 +1,6 @@
 import Link from 'next/link';
 import { notFound } from 'next/navigation';
-import { getAgencyBySlug, getAgencyMatches } from '@/lib/agency-db';
+import { getAgencyBySlug, getAgencyMatches, getAgencyAuthorizedProducts } from '@/lib/agency-db';
 import Breadcrumbs from '@/components/Breadcrumbs';
 
 export default async function AgencyDetailPage({
@@ -16,6 +16,7 @@ export default async function AgencyDetailPage({
   }
 
   const matches = getAgencyMatches(agency.id);
+  const authorized = getAgencyAuthorizedProducts(agency.agency_id);
 
   return (
     <div className="min-h-screen bg-gov-slate-50">
@@ -147,6 +148,32 @@ export default async function AgencyDetailPage({
           </div>
         )}
 
+        {/* FedRAMP Authorizations */}
+        {authorized.length > 0 && (
+          <div className="bg-white rounded-lg border border-gov-slate-200 p-6 mb-6">
+            <h2 className="text-2xl font-semibold text-gov-navy-900 mb-4">
+              FedRAMP Authorizations ({authorized.length})
+            </h2>
+            <p className="text-gov-slate-600 mb-4">
+              FedRAMP products this agency has issued or reused an authorization for:
+            </p>
+            <div className="grid grid-cols-1 md:grid-cols-2 gap-3">
+              {authorized.map((product) => (
+                <Link
+                  key={product.product_id}
+                  href={`/product/${product.product_id}`}
+                  className="block p-3 bg-gov-slate-50 rounded-md border border-gov-slate-200 hover:bg-gov-slate-100 hover:border-gov-navy-600 transition-all"
+                >
+                  <span className="font-semibold text-gov-navy-900">{product.provider_name || product.product_id}</span>
+                  {product.product_name && (
+                    <span className="text-gov-navy-900"> — {product.product_name}</span>
+                  )}
+                </Link>
+              ))}
+            </div>
+          </div>
+        )}
+
         {/* Sources */}
         {agency.sources && (
           <div className="bg-white rounded-lg border border-gov-slate-200 p-6">
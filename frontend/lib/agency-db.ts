@@ -1,5 +1,5 @@
 import Database from 'better-sqlite3';
-import path from 'path';
+import { DB_PATH } from './db';
 
 export interface AgencyAIUsage {
   id: number;
@@ -18,6 +18,7 @@ export interface AgencyAIUsage {
   sources: string | null;
   analyzed_at: string;
   slug: string;
+  agency_id?: number | null;  // canonical agency (backend/agencies.py)
 }
 
 export interface AgencyServiceMatch {
@@ -28,6 +29,13 @@ export interface AgencyServiceMatch {
   match_reason: string;
 }
 
+export interface AgencyAuthorizedProduct {
+  product_id: string;
+  provider_name: string | null;
+  product_name: string | null;
+  sources: string;
+}
+
 export interface AgencyStats {
   total_agencies: number;
   agencies_with_llm: number;
@@ -38,8 +46,6 @@ export interface AgencyStats {
   high_confidence_matches: number;
 }
 
-const DB_PATH = path.join(process.cwd(), '..', 'data', 'fedramp.db');
-
 export function getAgencies(category?: 'staff_llm' | 'specialized'): AgencyAIUsage[] {
   const db = new Database(DB_PATH, { readonly: true });
 
@@ -71,10 +77,28 @@ export function getAgencyBySlug(slug: string): AgencyAIUsage | null {
 export function getAgencyMatches(agencyId: number): AgencyServiceMatch[] {
   const db = new Database(DB_PATH, { readonly: true });
 
+  // Text-similarity recommendations (similarity.py) fill in as low confidence
+  const hasSimilarity = db.prepare(
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'agency_product_similarity'"
+  ).get();
+
+  const similar = hasSimilarity ? `
+    UNION ALL
+    SELECT s.product_id, s.provider_name, s.product_name, 'low' AS confidence,
+           'Similar description: ' || s.shared_terms AS match_reason
+    FROM agency_product_similarity s
+    WHERE s.agency_id = @agencyId
+      AND s.product_id NOT IN (SELECT product_id FROM agency_service_matches WHERE agency_id = @agencyId)
+  ` : '';
+
   const matches = db.prepare(`
     SELECT product_id, provider_name, product_name, confidence, match_reason
-    FROM agency_service_matches
-    WHERE agency_id = ?
+    FROM (
+      SELECT product_id, provider_name, product_name, confidence, match_reason
+      FROM agency_service_matches
+      WHERE agency_id = @agencyId
+      ${similar}
+    )
     ORDER BY
       CASE confidence
         WHEN 'high' THEN 1
@@ -82,12 +106,36 @@ export function getAgencyMatches(agencyId: number): AgencyServiceMatch[] {
         WHEN 'low' THEN 3
       END,
       provider_name
-  `).all(agencyId) as AgencyServiceMatch[];
+  `).all({ agencyId }) as AgencyServiceMatch[];
 
   db.close();
   return matches;
 }
 
+export function getAgencyAuthorizedProducts(agencyId: number | null | undefined): AgencyAuthorizedProduct[] {
+  if (agencyId == null) {
+    return [];
+  }
+
+  const db = new Database(DB_PATH, { readonly: true });
+
+  const products = db.prepare(`
+    SELECT
+      a.product_id,
+      p.cloud_service_provider AS provider_name,
+      p.cloud_service_offering AS product_name,
+      GROUP_CONCAT(DISTINCT a.source) AS sources
+    FROM agency_product_authorizations a
+    LEFT JOIN products p ON p.fedramp_id = a.product_id
+    WHERE a.agency_id = ?
+    GROUP BY a.product_id
+    ORDER BY provider_name, product_name
+  `).all(agencyId) as AgencyAuthorizedProduct[];
+
+  db.close();
+  return products;
+}
+
 export function getAgencyStats(): AgencyStats {
   const db = new Database(DB_PATH, { readonly: true });
 
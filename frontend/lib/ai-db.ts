@@ -1,5 +1,5 @@
 import Database from 'better-sqlite3';
-import path from 'path';
+import { DB_PATH } from './db';
 
 export interface AIService {
   id: number;
@@ -27,8 +27,6 @@ export interface AIStats {
   providers_with_ai: number;
 }
 
-const DB_PATH = path.join(process.cwd(), '..', 'data', 'fedramp.db');
-
 export function getAIServices(filterType?: 'ai' | 'genai' | 'llm'): AIService[] {
   const db = new Database(DB_PATH, { readonly: true });
 
@@ -1,4 +1,5 @@
 import Database from 'better-sqlite3';
+import fs from 'fs';
 import path from 'path';
 
 export interface Product {
@@ -19,13 +20,18 @@ export interface Product {
   fedramp_authorization_date: string | null;
   annual_assessment_date: string | null;
   ato_expiration_date: string | null;
+  impact_level: string | null;
   html_scraped: number;
   html_path: string | null;
   created_at: string;
   updated_at: string;
 }
 
-const DB_PATH = path.join(process.cwd(), '..', 'data', 'fedramp.db');
+// The single-file snapshot from `./fedai publish`; the live pipeline database until one exists
+const PUBLISHED_DB_PATH = path.join(process.cwd(), '..', 'data', 'publish', 'fedramp.db');
+const LIVE_DB_PATH = path.join(process.cwd(), '..', 'data', 'fedramp.db');
+
+export const DB_PATH = fs.existsSync(PUBLISHED_DB_PATH) ? PUBLISHED_DB_PATH : LIVE_DB_PATH;
 
 export function getDb() {
   return new Database(DB_PATH, { readonly: true });